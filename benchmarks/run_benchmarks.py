@@ -0,0 +1,221 @@
+"""Headless benchmarks of the import -> fit -> retarget -> bake pipeline.
+
+Run with a plain Python (lightweight bpy/mathutils stand-ins from ./stubs are used):
+
+    python benchmarks/run_benchmarks.py --joints 20 60 --frames 1000 4000 16000 --output bench.json
+
+or inside Blender, where the real modules are used:
+
+    blender --background --python benchmarks/run_benchmarks.py -- --output bench.json
+
+Stages slower than their THRESHOLDS are listed in the output and the exit status is 1.
+"""
+import argparse
+import gc
+import importlib.util
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# stage: (reference stage, ratio), the stage may take at most ratio times the reference of the same case
+THRESHOLDS = {
+    'add_joint_decimated': [('add_joint', 20.0), ('add_joint_legacy', 1.0)],
+}
+ADDON_DIR = os.path.dirname(HERE)
+PACKAGE = 'motion_capture_blender'
+
+try:
+    import bpy
+    import mathutils
+    STUBBED = False
+except ImportError:
+    sys.path.insert(0, os.path.join(HERE, 'stubs'))
+    import bpy
+    import mathutils
+    STUBBED = True
+
+sys.path.insert(0, HERE)
+from synthetic import write_bvh
+
+
+def load_addon():
+    # Register the add-on directory as a package without running its __init__ (no operator registration).
+    spec = importlib.util.spec_from_file_location(PACKAGE, os.path.join(ADDON_DIR, '__init__.py'),
+                                                  submodule_search_locations=[ADDON_DIR])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE] = package
+    bvhutils = importlib.import_module(PACKAGE + '.bvhutils')
+    test_op = importlib.import_module(PACKAGE + '.test_op')
+    return bvhutils, test_op
+
+
+def measure(func, repeat):
+    # Best wall time of repeat runs, then one more run under tracemalloc for the peak allocation.
+    best = None
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    gc.collect()
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, best, peak
+
+
+def new_context():
+    if STUBBED:
+        bpy.reset()
+        return bpy.context
+    return bpy.context
+
+
+def run_case(bvhutils, test_op, path, joint_count, frame_count, args):
+    stages = []
+
+    def record(stage, func):
+        result, seconds, peak = measure(func, args.repeat)
+        stages.append({
+            'stage': stage,
+            'joints': joint_count,
+            'frames': frame_count,
+            'seconds': seconds,
+            'frames_per_second': frame_count / seconds if seconds > 0 else None,
+            'peak_bytes': peak,
+        })
+        print('  %-22s %9.4f s %12.0f frames/s %10.1f MB peak' % (
+            stage, seconds, stages[-1]['frames_per_second'] or 0.0, peak / 1e6))
+        return result
+
+    def read(keep_anim_data):
+        bvh = bvhutils.Bvh()
+        bvh.read_bvh(path, keep_anim_data=keep_anim_data)
+        if keep_anim_data:
+            #anim_data is lazy, build the tuples of every joint
+            for joint in bvh.joints.values():
+                joint.anim_data
+        return bvh
+
+    def read_lazy():
+        bvh = bvhutils.Bvh()
+        bvh.read_bvh(path, lazy=True)
+        return bvh
+
+    record('read_bvh_lazy', read_lazy)
+    bvh = record('read_bvh', lambda: read(False))
+    record('read_bvh_anim_data', lambda: read(True))
+    # Derived data is memoized on the clip, time the computation and not the cache hit.
+    def uncached(func):
+        def run():
+            bvh.derived.clear()
+            return func()
+        return run
+
+    record('getTimeStamp', uncached(bvh.getTimeStamp))
+    path_result = record('getRootJointPath', uncached(bvh.getRootJointPath))
+    record('getRootJointPath_cached', bvh.getRootJointPath)
+    source_points = path_result[1]
+
+    nodes = [(30, 0, 5), (30, 30, 40), (30, 0, 75), (30, 30, 110)]
+    bvh.destiny_points = record('calc_path', lambda: test_op.calc_path(nodes, len(source_points)))
+
+    def bake(bulk, tolerance=None):
+        context = new_context()
+        bvh.add_joint(context, 1, source_points, bulk=bulk, tolerance=tolerance)
+
+    record('add_joint', lambda: bake(True))
+    record('add_joint_decimated', lambda: bake(True, 1.0e-3))
+    if args.legacy_bake:
+        record('add_joint_legacy', lambda: bake(False))
+    record('add_armature', lambda: bvh.add_armature(new_context(), 1, source_points))
+    return stages
+
+
+def check_thresholds(results):
+    # Failed THRESHOLDS as messages, references that were not timed are skipped.
+    seconds = {(item['stage'], item['joints'], item['frames']): item['seconds'] for item in results}
+    failures = []
+    for (stage, joints, frames), value in sorted(seconds.items()):
+        for reference, ratio in THRESHOLDS.get(stage, ()):
+            limit = seconds.get((reference, joints, frames))
+            if limit is not None and value > ratio * limit:
+                failures.append('%s %d joints %d frames: %.4f s, over %.1f x %s (%.4f s)' % (
+                    stage, joints, frames, value, ratio, reference, limit))
+    return failures
+
+
+def scaling(results):
+    # Growth exponent of each stage over frame count: 1.0 is linear, 2.0 quadratic.
+    curves = {}
+    for item in results:
+        curve = curves.setdefault(item['stage'], {}).setdefault(str(item['joints']), [])
+        curve.append((item['frames'], item['seconds']))
+
+    summary = {}
+    for stage, by_joints in curves.items():
+        summary[stage] = {}
+        for joints, points in by_joints.items():
+            points.sort()
+            (f0, s0), (f1, s1) = points[0], points[-1]
+            exponent = None
+            if f1 > f0 and s0 > 0 and s1 > 0:
+                exponent = math.log(s1 / s0) / math.log(f1 / f0)
+            summary[stage][joints] = {'points': points, 'exponent': exponent}
+    return summary
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--joints', type=int, nargs='+', default=[20, 60])
+    parser.add_argument('--frames', type=int, nargs='+', default=[1000, 4000, 16000])
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage, the best is kept')
+    parser.add_argument('--legacy-bake', action='store_true', help='also time the per-frame keyframe_insert bake')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    bvhutils, test_op = load_addon()
+    import numpy
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for joint_count in args.joints:
+            for frame_count in args.frames:
+                path = os.path.join(directory, 'synthetic_%d_%d.bvh' % (joint_count, frame_count))
+                write_bvh(path, joint_count, frame_count)
+                print('%d joints, %d frames, %.1f MB' % (joint_count, frame_count, os.path.getsize(path) / 1e6))
+                results += run_case(bvhutils, test_op, path, joint_count, frame_count, args)
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'platform': platform.platform(),
+        'blender': None if STUBBED else bpy.app.version_string,
+        'repeat': args.repeat,
+        'results': results,
+        'scaling': scaling(results),
+        'failures': check_thresholds(results),
+    }
+    for failure in report['failures']:
+        print('THRESHOLD ' + failure)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    # Blender passes its own arguments first, ours come after '--'.
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else sys.argv[1:]
+    sys.exit(1 if main(argv)['failures'] else 0)
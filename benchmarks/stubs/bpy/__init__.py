@@ -0,0 +1,203 @@
+# Minimal stand-in for Blender's bpy, enough to import the add-on and run the
+# Bvh pipeline headless. Objects, actions and F-curves only record what is written.
+import mathutils
+
+from . import app, props, types, utils
+
+
+class _Recorder:
+    def __getattr__(self, name):
+        return _Recorder()
+
+    def __call__(self, *args, **kwargs):
+        return _Recorder()
+
+
+class KeyframePoints:
+    def __init__(self):
+        self.count = 0
+        self.co = None
+
+    def __len__(self):
+        return self.count
+
+    def add(self, count):
+        self.count += count
+
+    def insert(self, frame, value):
+        if self.co is None:
+            self.co = []
+        self.co += [frame, value]
+        self.count += 1
+
+    def foreach_set(self, attr, seq):
+        setattr(self, attr, list(seq) if not hasattr(seq, 'copy') else seq.copy())
+
+
+class FCurve:
+    def __init__(self, data_path, index):
+        self.data_path = data_path
+        self.array_index = index
+        self.keyframe_points = KeyframePoints()
+
+    def update(self):
+        pass
+
+
+class FCurves(list):
+    def new(self, data_path, index=0, action_group=''):
+        fcurve = FCurve(data_path, index)
+        self.append(fcurve)
+        return fcurve
+
+    def find(self, data_path, index=0):
+        for fcurve in self:
+            if fcurve.data_path == data_path and fcurve.array_index == index:
+                return fcurve
+        return None
+
+
+class Action:
+    def __init__(self, name):
+        self.name = name
+        self.fcurves = FCurves()
+
+
+class AnimData:
+    def __init__(self):
+        self.action = None
+
+
+class EditBone:
+    def __init__(self, name):
+        self.name = name
+        self.head = mathutils.Vector((0.0, 0.0, 0.0))
+        self.tail = mathutils.Vector((0.0, 1.0, 0.0))
+        self.parent = None
+
+    @property
+    def matrix(self):
+        # Rest matrix with the bone along its local Y axis and no roll.
+        y = (self.tail - self.head).normalized()
+        x = y.cross((0.0, 0.0, 1.0))
+        if x.length < 1.0e-6:
+            x = y.cross((1.0, 0.0, 0.0))
+        x = x.normalized()
+        z = x.cross(y)
+        return mathutils.Matrix([(x[i], y[i], z[i]) for i in range(3)])
+
+
+class EditBones(dict):
+    def new(self, name):
+        bone = self[name] = EditBone(name)
+        return bone
+
+
+class Armature:
+    def __init__(self, name):
+        self.name = name
+        self.edit_bones = EditBones()
+
+
+class PoseBone:
+    def __init__(self, name):
+        self.name = name
+        self.rotation_mode = 'QUATERNION'
+
+
+class Pose:
+    def __init__(self, armature):
+        self.bones = {name: PoseBone(name) for name in armature.edit_bones}
+
+
+class Object:
+    def __init__(self, name, data=None):
+        self.name = name
+        self.data = data
+        self.parent = None
+        self.animation_data = None
+        self.keyframe_count = 0
+
+    @property
+    def pose(self):
+        if not hasattr(self, '_pose'):
+            self._pose = Pose(self.data)
+        return self._pose
+
+    def select_set(self, state):
+        pass
+
+    def animation_data_create(self):
+        self.animation_data = AnimData()
+        return self.animation_data
+
+    # Keys the current value into the action of the object, like Blender.
+    def keyframe_insert(self, data_path, index=-1, frame=0):
+        self.keyframe_count += 1
+        if self.animation_data is None:
+            self.animation_data_create()
+        if self.animation_data.action is None:
+            self.animation_data.action = data.actions.new(self.name + 'Action')
+        fcurves = self.animation_data.action.fcurves
+        value = getattr(self, data_path)
+        for i in (range(len(value)) if index == -1 else [index]):
+            fcurve = fcurves.find(data_path, i) or fcurves.new(data_path, i)
+            fcurve.keyframe_points.insert(frame, value[i])
+        return True
+
+    def path_resolve(self, data_path):
+        if not hasattr(self, '_values'):
+            self._values = {}
+        return self._values.setdefault(data_path, [0.0, 0.0, 0.0])
+
+
+class _Collection(list):
+    def new(self, name, *args):
+        item = self._type(name, *args)
+        self.append(item)
+        return item
+
+    def link(self, item):
+        self.append(item)
+
+
+class Objects(_Collection):
+    _type = Object
+
+
+class Actions(_Collection):
+    _type = Action
+
+
+class Armatures(_Collection):
+    _type = Armature
+
+
+class Data:
+    def __init__(self):
+        self.objects = Objects()
+        self.actions = Actions()
+        self.armatures = Armatures()
+
+
+class Context:
+    def __init__(self):
+        self.scene = _Recorder()
+        self.scene.objects = []
+        self.collection = _Recorder()
+        self.collection.objects = Objects()
+        self.view_layer = _Recorder()
+        self.view_layer.objects = _Recorder()
+
+
+data = Data()
+context = Context()
+ops = _Recorder()
+
+
+# drop everything created so far, returns the fresh bpy.data
+def reset():
+    global data, context
+    data = Data()
+    context = Context()
+    return data
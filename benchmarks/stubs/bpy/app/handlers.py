@@ -0,0 +1,6 @@
+depsgraph_update_post = []
+load_post = []
+
+
+def persistent(func):
+    return func
@@ -0,0 +1,5 @@
+def _property(*args, **kwargs):
+    return kwargs.get('default')
+
+
+StringProperty = BoolProperty = IntProperty = FloatProperty = EnumProperty = PointerProperty = CollectionProperty = _property
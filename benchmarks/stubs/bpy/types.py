@@ -0,0 +1,18 @@
+class Operator:
+    pass
+
+
+class Panel:
+    pass
+
+
+class PropertyGroup:
+    pass
+
+
+class Scene:
+    pass
+
+
+class OperatorFileListElement:
+    pass
@@ -0,0 +1,124 @@
+# Minimal stand-in for Blender's mathutils, only what the add-on uses outside of Blender.
+import math
+
+
+class Vector:
+    def __init__(self, seq=(0.0, 0.0, 0.0)):
+        self._data = [float(v) for v in seq]
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __getitem__(self, index):
+        return self._data[index]
+
+    def __setitem__(self, index, value):
+        self._data[index] = float(value)
+
+    def __add__(self, other):
+        return Vector([a + b for a, b in zip(self._data, other)])
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return Vector([a - b for a, b in zip(self._data, other)])
+
+    def __rsub__(self, other):
+        return Vector([b - a for a, b in zip(self._data, other)])
+
+    def __mul__(self, scalar):
+        return Vector([a * scalar for a in self._data])
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return Vector([-a for a in self._data])
+
+    def __repr__(self):
+        return 'Vector((%s))' % ', '.join('%.4f' % v for v in self._data)
+
+    x = property(lambda self: self._data[0], lambda self, v: self.__setitem__(0, v))
+    y = property(lambda self: self._data[1], lambda self, v: self.__setitem__(1, v))
+    z = property(lambda self: self._data[2], lambda self, v: self.__setitem__(2, v))
+
+    @property
+    def length(self):
+        return math.sqrt(sum(a * a for a in self._data))
+
+    def copy(self):
+        return Vector(self._data)
+
+    def normalized(self):
+        length = self.length
+        return Vector([a / length for a in self._data]) if length else Vector(self._data)
+
+    def dot(self, other):
+        return sum(a * b for a, b in zip(self._data, other))
+
+    def cross(self, other):
+        ax, ay, az = self._data
+        bx, by, bz = other
+        return Vector((ay * bz - az * by, az * bx - ax * bz, ax * by - ay * bx))
+
+    def rotation_difference(self, other):
+        a = self.normalized()
+        b = Vector(other).normalized()
+        axis = a.cross(b)
+        if axis.length > 1.0e-7:
+            angle = math.acos(max(-1.0, min(1.0, a.dot(b))))
+            axis = axis.normalized()
+        elif a.dot(b) > 0.0:
+            return Quaternion((1.0, 0.0, 0.0, 0.0))
+        else:
+            axis = a.cross((1.0, 0.0, 0.0) if abs(a.x) < 0.9 else (0.0, 1.0, 0.0)).normalized()
+            angle = math.pi
+        s = math.sin(angle / 2.0)
+        return Quaternion((math.cos(angle / 2.0), axis.x * s, axis.y * s, axis.z * s))
+
+    def rotate(self, rotation):
+        pass
+
+
+class Euler(Vector):
+    def __init__(self, seq=(0.0, 0.0, 0.0), order='XYZ'):
+        super().__init__(seq)
+        self.order = order
+
+
+class Quaternion(Vector):
+    def __init__(self, seq=(1.0, 0.0, 0.0, 0.0)):
+        super().__init__(seq)
+
+    def to_euler(self):
+        w, x, y, z = self._data
+        roll = math.atan2(2.0 * (w * x + y * z), 1.0 - 2.0 * (x * x + y * y))
+        pitch = math.asin(max(-1.0, min(1.0, 2.0 * (w * y - z * x))))
+        yaw = math.atan2(2.0 * (w * z + x * y), 1.0 - 2.0 * (y * y + z * z))
+        return Euler((roll, pitch, yaw))
+
+
+class Matrix:
+    def __init__(self, rows=((1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0))):
+        self._rows = [Vector(row) for row in rows]
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __getitem__(self, index):
+        return self._rows[index]
+
+    def __setitem__(self, index, row):
+        self._rows[index] = Vector(row)
+
+    def to_3x3(self):
+        return Matrix([list(row)[:3] for row in self._rows[:3]])
+
+    def __matmul__(self, other):
+        columns = list(zip(*other))
+        return Matrix([[sum(a * b for a, b in zip(row, col)) for col in columns] for row in self._rows])
@@ -0,0 +1,42 @@
+# Synthetic BVH clips of a given size for the benchmarks.
+import math
+import random
+
+CHAIN_LENGTH = 5
+
+
+def write_bvh(path, joint_count, frame_count, frame_time=1.0 / 120.0, seed=0):
+    rng = random.Random(seed)
+    lines = ['HIERARCHY', 'ROOT Hips', '{',
+             '\tOFFSET 0.000000 0.000000 0.000000',
+             '\tCHANNELS 6 Xposition Yposition Zposition Zrotation Xrotation Yrotation']
+    channel_count = 6
+
+    # Chains of CHAIN_LENGTH joints hanging off the root, each closed by an End Site.
+    depth = 1
+    for index in range(1, joint_count):
+        indent = '\t' * depth
+        lines += [indent + 'JOINT Joint%d' % index, indent + '{',
+                  indent + '\tOFFSET %.6f %.6f %.6f' % (rng.uniform(-5, 5), rng.uniform(1, 10), rng.uniform(-5, 5)),
+                  indent + '\tCHANNELS 3 Zrotation Xrotation Yrotation']
+        channel_count += 3
+        depth += 1
+        if index % CHAIN_LENGTH == 0 or index == joint_count - 1:
+            indent = '\t' * depth
+            lines += [indent + 'End Site', indent + '{', indent + '\tOFFSET 0.000000 2.000000 0.000000', indent + '}']
+            while depth > 1:
+                depth -= 1
+                lines.append('\t' * depth + '}')
+    lines.append('}')
+
+    lines += ['MOTION', 'Frames: %d' % frame_count, 'Frame Time: %.6f' % frame_time]
+    phases = [rng.uniform(0, 2 * math.pi) for _ in range(channel_count)]
+    with open(path, 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+        for frame in range(frame_count):
+            t = frame * frame_time
+            # Root walks a wide circle, every rotation channel swings with its own phase.
+            values = [100.0 * math.cos(0.2 * t), 90.0 + 2.0 * math.sin(6.0 * t), 100.0 * math.sin(0.2 * t)]
+            values += [30.0 * math.sin(2.0 * t + phase) for phase in phases[3:]]
+            file.write(' '.join('%.4f' % v for v in values) + '\n')
+    return channel_count
@@ -0,0 +1,101 @@
+import os
+import sys
+import site
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from .bvhutils import Bvh
+
+ADDON_DIR = os.path.dirname(os.path.abspath(__file__))
+#Workers import the parser as this top level module,
+#importing the add-on package there would pull in bpy
+WORKER_MODULE = 'bvhparse'
+
+def get_worker_parse():
+    module = sys.modules.get(WORKER_MODULE)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(WORKER_MODULE, os.path.join(ADDON_DIR, WORKER_MODULE + '.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        sys.modules[WORKER_MODULE] = module
+    return module.parse_bvh
+
+def get_pool(max_workers):
+    #Never fork a running Blender, start clean interpreters instead
+    context = multiprocessing.get_context('spawn')
+    try:
+        import bpy
+        #Blender before 2.91 reports its own binary as sys.executable
+        python = getattr(bpy.app, 'binary_path_python', None)
+        if python:
+            context.set_executable(python)
+    except ImportError:
+        pass
+    return ProcessPoolExecutor(max_workers, mp_context=context, initializer=site.addsitedir, initargs=(ADDON_DIR,))
+
+# every .bvh file of a directory, sorted by name
+def list_bvh_files(directory):
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith('.bvh') and os.path.isfile(os.path.join(directory, name))
+    )
+
+# parse many files in a process pool, the hierarchy and motion array of each file come back
+# in the plain parse_bvh format so only one array per clip crosses the process boundary
+# return ({file path: Bvh}, {file path: error message}), a failing file does not stop the others
+# lazy=True or stream=True only read the hierarchies here (no pool, no cache), see Bvh.read_bvh
+def import_bvh_files(file_paths, max_workers=None, keep_anim_data=True, cache=None, dtype=np.float64, lazy=False, stream=False):
+    loaded = {}
+    failed = {}
+    pending = []
+    if lazy or stream:
+        for file_path in file_paths:
+            try:
+                bvh = loaded[file_path] = Bvh(dtype)
+                bvh.read_bvh(file_path, keep_anim_data, load_motion=not stream, lazy=lazy and not stream)
+            except Exception as e:
+                loaded.pop(file_path, None)
+                failed[file_path] = str(e)
+        return loaded, failed
+
+    for file_path in file_paths:
+        try:
+            bvh = cache.lookup(file_path, keep_anim_data, dtype) if cache is not None else None
+        except Exception as e:
+            #Missing or unreadable, the digest could not be computed
+            failed[file_path] = str(e)
+            continue
+        if bvh is not None:
+            loaded[file_path] = bvh
+        else:
+            pending.append(file_path)
+
+    def add(file_path, parsed):
+        bvh = Bvh(dtype)
+        bvh.set_parsed(parsed, keep_anim_data)
+        bvh.file_path = file_path
+        loaded[file_path] = bvh
+        if cache is not None:
+            cache.store(file_path, bvh)
+
+    parse_bvh = get_worker_parse()
+    if len(pending) < 2 or max_workers == 1:
+        for file_path in pending:
+            try:
+                add(file_path, parse_bvh(file_path))
+            except Exception as e:
+                failed[file_path] = str(e)
+    elif pending:
+        with get_pool(max_workers) as pool:
+            futures = {pool.submit(parse_bvh, file_path): file_path for file_path in pending}
+            for future in as_completed(futures):
+                file_path = futures[future]
+                try:
+                    add(file_path, future.result())
+                except Exception as e:
+                    failed[file_path] = str(e)
+
+    #Keep the order the files were given in
+    loaded = {file_path: loaded[file_path] for file_path in file_paths if file_path in loaded}
+    return loaded, failed
@@ -0,0 +1,203 @@
+import os
+import json
+import hashlib
+import numpy as np
+from .bvhutils import Bvh
+from .bvhprofile import PROFILER
+
+#Bump when the layout of the cached files changes
+CACHE_VERSION = 4
+
+#On-disk cache of parsed Bvh objects
+#every entry is <key>.json (hierarchy and header) plus <key>.npy (Bvh.anim), the key is the digest of the file
+#and the dtype of anim, so a float32 entry never stands in for a float64 clip,
+#on a hit the npy is memory-mapped as the anim of the clip, so no text parsing is needed
+#and the motion stays in the page cache instead of the process memory
+class BvhCache():
+    def __init__(self, directory=None, max_bytes=512 * 1024 * 1024):
+        if directory is None:
+            directory = os.path.join(os.path.expanduser('~'), '.cache', 'motion_capture_blender')
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(directory, 'index.json')
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, file_path, keep_anim_data=True, dtype=np.float64):
+        with PROFILER.stage('cache_lookup'):
+            bvh = self.lookup(file_path, keep_anim_data, dtype)
+        if bvh is not None:
+            return bvh
+
+        bvh = Bvh(dtype)
+        bvh.read_bvh(file_path, keep_anim_data)
+        with PROFILER.stage('cache_store', bvh.frame_count, len(bvh.joints)):
+            self.store(file_path, bvh)
+        return bvh
+
+    # cached Bvh of the file or None, counted in hits and misses
+    def lookup(self, file_path, keep_anim_data=True, dtype=np.float64):
+        bvh = self.read_entry(file_path, keep_anim_data, dtype)
+        if bvh is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return bvh
+
+    def read_entry(self, file_path, keep_anim_data=True, dtype=np.float64):
+        meta_path, anim_path = self.entry_paths(self.get_key(file_path, dtype))
+        try:
+            with open(meta_path, 'r') as file:
+                meta = json.load(file)
+            if meta['version'] != CACHE_VERSION:
+                return None
+            anim = np.load(anim_path, mmap_mode='r')
+        except (OSError, ValueError, KeyError):
+            return None
+        if anim.dtype != np.dtype(dtype):
+            return None
+
+        #Mark as recently used for the LRU eviction
+        os.utime(anim_path)
+
+        meta['motion'] = None
+        bvh = Bvh(dtype)
+        bvh.set_parsed(meta, keep_anim_data)
+        bvh.file_path = file_path
+        bvh.set_anim(anim, keep_anim_data)
+        bvh.map_path = anim_path
+        bvh.from_file = True
+        return bvh
+
+    def store(self, file_path, bvh):
+        if bvh.anim is None:
+            return
+        meta_path, anim_path = self.entry_paths(self.get_key(file_path, bvh.dtype))
+
+        meta = {
+            'version': CACHE_VERSION,
+            'root': bvh.rootJoint.index,
+            'frame_count': bvh.frame_count,
+            'frame_time': bvh.frame_time,
+            'channel_count': bvh.channel_count,
+            'motion_offset': bvh.motion_offset,
+            'hierarchy': bvh.get_hierarchy(),
+        }
+        with open(anim_path + '.tmp', 'wb') as file:
+            np.save(file, bvh.anim)
+        os.replace(anim_path + '.tmp', anim_path)
+        with open(meta_path + '.tmp', 'w') as file:
+            json.dump(meta, file)
+        os.replace(meta_path + '.tmp', meta_path)
+
+        self.evict()
+
+    # drop the entry of one source file
+    def invalidate(self, file_path):
+        index = self.read_index()
+        item = index.pop(os.path.abspath(file_path), None)
+        if item is None:
+            return
+        self.write_index(index)
+        #Other paths with the same content share the entry
+        if any(other['digest'] == item['digest'] for other in index.values()):
+            return
+        #Entries of every dtype
+        for name in os.listdir(self.directory):
+            if name.startswith(item['digest']):
+                self.remove(os.path.join(self.directory, name))
+
+    def clear(self):
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith(('.json', '.npy', '.tmp')):
+                self.remove(os.path.join(self.directory, name))
+
+    # remove least recently used entries until the cache fits in max_bytes
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.npy'):
+                continue
+            key = name[:-4]
+            size = 0
+            for path in self.entry_paths(key):
+                if os.path.exists(path):
+                    size += os.path.getsize(path)
+            mtime = os.path.getmtime(os.path.join(self.directory, name))
+            entries.append((mtime, size, key))
+            total += size
+
+        entries.sort()
+        evicted = set()
+        for mtime, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            for path in self.entry_paths(key):
+                self.remove(path)
+            evicted.add(key)
+            total -= size
+
+        if evicted:
+            #Keep the digests of files that still have an entry of another dtype
+            left = {key.split('-')[0] for mtime, size, key in entries if key not in evicted}
+            evicted = {key.split('-')[0] for key in evicted} - left
+            index = self.read_index()
+            index = {path: item for path, item in index.items() if item['digest'] not in evicted}
+            self.write_index(index)
+
+    def size(self):
+        if not os.path.isdir(self.directory):
+            return 0
+        return sum(os.path.getsize(os.path.join(self.directory, name))
+                   for name in os.listdir(self.directory) if name.endswith(('.json', '.npy')))
+
+    # content hash of the file, only recomputed when path, size or mtime changed
+    def get_digest(self, file_path):
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        index = self.read_index()
+        item = index.get(file_path)
+        if item and item['size'] == stat.st_size and item['mtime'] == stat.st_mtime_ns:
+            return item['digest']
+
+        sha = hashlib.sha1()
+        with open(file_path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                sha.update(block)
+        digest = sha.hexdigest()
+
+        os.makedirs(self.directory, exist_ok=True)
+        index[file_path] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'digest': digest}
+        self.write_index(index)
+        return digest
+
+    # entry key of the file, float64 entries are the plain digest
+    def get_key(self, file_path, dtype=np.float64):
+        dtype = np.dtype(dtype)
+        digest = self.get_digest(file_path)
+        return digest if dtype == np.float64 else digest + '-' + dtype.name
+
+    def entry_paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + '.json', base + '.npy'
+
+    def read_index(self):
+        try:
+            with open(self.index_path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def write_index(self, index):
+        with open(self.index_path + '.tmp', 'w') as file:
+            json.dump(index, file)
+        os.replace(self.index_path + '.tmp', self.index_path)
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,122 @@
+import numpy as np
+from .bvhfk import forward_kinematics
+from .bvhmath import euler_to_matrix, matrix_to_euler, matrix_to_quat, quat_to_matrix, slerp
+
+#Concatenation of two clips on arrays: transition search, root alignment and blending.
+#The result uses the skeleton of the first clip, joints of the second clip are matched by name.
+
+# index in b of every joint of a, in a's index order, joints are matched by name
+# or through mapping {joint name in a: joint name in b} for skeletons named differently
+def match_joints(a, b, mapping=None):
+    joint_list = sorted(a.joints.values(), key=lambda joint: joint.index)
+    names = [mapping.get(joint.name, joint.name) if mapping else joint.name for joint in joint_list]
+    missing = [name for name in names if name not in b.joints]
+    if missing:
+        raise Exception("The second bvh has no joint %s" % ', '.join(missing[:5]))
+    #Euler channels are only blended between the same rotation orders
+    for joint, name in zip(joint_list, names):
+        if tuple(joint.rot_order) != tuple(b.joints[name].rot_order):
+            raise Exception("Joint %s rotates in %s order in the first bvh and %s in the second" % (joint.name, joint.rot_order_str, b.joints[name].rot_order_str))
+    return [b.joints[name].index for name in names]
+
+# heading angle of root quaternions around the up axis (0, 1, 2 for x, y, z)
+def get_yaw(quat, up_axis=1):
+    forward_axis, side_axis = (up_axis + 1) % 3, (up_axis + 2) % 3
+    forward = quat_to_matrix(quat)[..., :, forward_axis]
+    return np.arctan2(forward[..., side_axis], forward[..., forward_axis])
+
+def yaw_matrix(yaw, up_axis=1):
+    angles = np.zeros(np.shape(yaw) + (3,))
+    angles[..., up_axis] = yaw
+    return euler_to_matrix(angles, (up_axis,))
+
+# root relative joint positions with the heading removed, one row of features per frame
+def pose_features(bvh, start, end, names, up_axis=1):
+    positions, quats = forward_kinematics(bvh, start, end, names)
+    root = bvh.rootJoint.name
+    root_column = names.index(root) if root in names else 0
+    local = positions - positions[:, root_column:root_column + 1]
+    #Row vectors times R is R^T times the vector, which undoes the heading
+    local = local @ yaw_matrix(get_yaw(quats[:, root_column], up_axis))
+    return local.reshape(len(local), local.shape[1] * 3)
+
+# squared distance of every row of fa to every row of fb
+def distance_matrix(fa, fb):
+    d = np.sum(fa * fa, axis=1)[:, None] + np.sum(fb * fb, axis=1)[None, :] - 2.0 * fa @ fb.T
+    return np.maximum(d, 0.0)
+
+# best transition: frame i of a (start of the blend) and frame j of b,
+# searched over the last window frames of a and the first window frames of b
+def find_transition(a, b, blend_frames=10, window=60, up_axis=1, mapping=None):
+    names = [joint.name for joint in sorted(a.joints.values(), key=lambda joint: joint.index)]
+    b_list = sorted(b.joints.values(), key=lambda joint: joint.index)
+    b_names = [b_list[index].name for index in match_joints(a, b, mapping)]
+
+    last = max(blend_frames, 1)
+    i_start = max(0, a.frame_count - last - window + 1)
+    i_end = max(i_start + 1, a.frame_count - last + 1)
+    j_end = max(1, min(window, b.frame_count - last + 1))
+
+    fa = pose_features(a, i_start, i_end, names, up_axis)
+    fb = pose_features(b, 0, j_end, b_names, up_axis)
+    distance = distance_matrix(fa, fb)
+    i, j = np.unravel_index(np.argmin(distance), distance.shape)
+    return i_start + int(i), int(j), float(np.sqrt(distance[i, j]))
+
+# (frames, joints, 4) local rotations of anim in the rotation order of each joint
+def anim_quats(anim, joint_list):
+    quats = np.empty(anim.shape[:2] + (4,))
+    for column, joint in enumerate(joint_list):
+        quats[:, column] = matrix_to_quat(euler_to_matrix(anim[:, column, 3:6], joint.rot_order))
+    return quats
+
+def quats_to_anim(quats, anim, joint_list):
+    for column, joint in enumerate(joint_list):
+        anim[:, column, 3:6] = matrix_to_euler(quat_to_matrix(quats[:, column]), joint.rot_order)
+
+# new Bvh playing a up to the transition, blending into b over blend_frames and then playing b,
+# b is moved and turned so its root continues from a's root at the transition
+# mapping {joint name in a: joint name in b} pairs joints whose names differ, see match_joints
+# return (bvh, {'frame_a', 'frame_b', 'distance'})
+def concatenate(a, b, blend_frames=10, window=60, up_axis=1, mapping=None):
+    blend_frames = max(0, min(blend_frames, a.frame_count, b.frame_count))
+    frame_a, frame_b, distance = find_transition(a, b, blend_frames, window, up_axis, mapping)
+    return join(a, b, frame_a, frame_b, blend_frames, up_axis, mapping), {'frame_a': frame_a, 'frame_b': frame_b, 'distance': distance}
+
+# a up to frame_a, then blend_frames blended frames, then b after frame_b + blend_frames
+def join(a, b, frame_a, frame_b, blend_frames=10, up_axis=1, mapping=None):
+    blend_frames = max(0, min(blend_frames, a.frame_count - frame_a, b.frame_count - frame_b))
+    joint_list = sorted(a.joints.values(), key=lambda joint: joint.index)
+    root = a.rootJoint.index
+    anim_a = a.get_anim()
+    b_index = match_joints(a, b, mapping)
+    anim_b = np.array(b.get_anim()[:, b_index])
+
+    quat_b = anim_quats(anim_b, joint_list)
+
+    #Turn b's root by the heading difference at the transition and move it onto a's root
+    quat_a = anim_quats(anim_a[frame_a:frame_a + 1], joint_list)
+    yaw = get_yaw(quat_a[0, root], up_axis) - get_yaw(quat_b[frame_b, root], up_axis)
+    turn = yaw_matrix(yaw, up_axis)
+    quat_b[:, root] = matrix_to_quat(turn @ quat_to_matrix(quat_b[:, root]))
+    if a.rootJoint.has_loc:
+        ground = np.ones(3)
+        ground[up_axis] = 0.0
+        location = anim_b[:, root, 0:3] - anim_b[frame_b, root, 0:3] * ground
+        anim_b[:, root, 0:3] = location @ turn.T + anim_a[frame_a, root, 0:3] * ground
+    quats_to_anim(quat_b, anim_b, joint_list)
+
+    #Ease in/out weights, lerp for locations and slerp for rotations
+    weight = 0.5 - 0.5 * np.cos(np.pi * (np.arange(blend_frames) + 0.5) / max(blend_frames, 1))
+    blend_a = anim_a[frame_a:frame_a + blend_frames]
+    blend_b = anim_b[frame_b:frame_b + blend_frames]
+    blend = np.empty_like(blend_a)
+    blend[:, :, 0:3] = blend_a[:, :, 0:3] + weight[:, None, None] * (blend_b[:, :, 0:3] - blend_a[:, :, 0:3])
+    quats = slerp(anim_quats(blend_a, joint_list), anim_quats(blend_b, joint_list), weight[:, None])
+    quats_to_anim(quats, blend, joint_list)
+
+    anim = np.concatenate((anim_a[:frame_a], blend, anim_b[frame_b + blend_frames:]))
+    #Conversions return angles in (-pi, pi], keep every channel continuous
+    anim[:, :, 3:6] = np.unwrap(anim[:, :, 3:6], axis=0)
+
+    return a.new_clip(anim)
@@ -0,0 +1,69 @@
+import numpy as np
+from .bvhmath import euler_to_matrix, matrix_to_quat
+
+#Forward kinematics over the Joint tree of a Bvh, all frames at once.
+#Positions and orientations are in the BVH world space (not converted to Blender axes).
+
+# joints needed to evaluate names: the joints themselves and all their parents, in index order
+def get_chain(bvh, names=None):
+    if names is None:
+        return sorted(bvh.joints.values(), key=lambda joint: joint.index)
+    needed = {}
+    for name in names:
+        joint = bvh.joints[name]
+        while joint is not None and joint.index not in needed:
+            needed[joint.index] = joint
+            joint = joint.parent
+    return [needed[index] for index in sorted(needed)]
+
+# return positions (frames, joints, 3) and quaternions (frames, joints, 4) in world space
+# for frames [start, end) and the given joint names (every joint in index order by default)
+def forward_kinematics(bvh, start=0, end=None, joints=None):
+    anim = bvh.get_anim(start, end)
+    chain = get_chain(bvh, joints)
+    column = {joint.index: i for i, joint in enumerate(chain)}
+    frame_count = anim.shape[0]
+
+    #Local transforms: the position channels replace the offset when the joint has them
+    local_anim = anim[:, [joint.index for joint in chain]]
+    translation = np.empty((frame_count, len(chain), 3))
+    rotation = np.empty((frame_count, len(chain), 3, 3))
+    for i, joint in enumerate(chain):
+        if joint.has_loc:
+            translation[:, i] = local_anim[:, i, 0:3]
+        else:
+            translation[:, i] = tuple(joint.rest_head_local)
+
+    #One batched euler conversion per distinct rotation order
+    orders = {}
+    for i, joint in enumerate(chain):
+        orders.setdefault(joint.rot_order, []).append(i)
+    for order, columns in orders.items():
+        rotation[:, columns] = euler_to_matrix(local_anim[:, columns, 3:6], order)
+
+    #Walk the tree one depth level at a time, every joint of a level in one batch
+    depth = {}
+    for joint in chain:
+        depth[joint.index] = depth[joint.parent.index] + 1 if joint.parent is not None else 0
+    levels = {}
+    for joint in chain:
+        levels.setdefault(depth[joint.index], []).append(joint)
+
+    position = np.empty_like(translation)
+    world = np.empty_like(rotation)
+    for level in sorted(levels):
+        columns = [column[joint.index] for joint in levels[level]]
+        if level == 0:
+            position[:, columns] = translation[:, columns]
+            world[:, columns] = rotation[:, columns]
+            continue
+        parents = [column[joint.parent.index] for joint in levels[level]]
+        parent_world = world[:, parents]
+        position[:, columns] = position[:, parents] + np.einsum('fjab,fjb->fja', parent_world, translation[:, columns])
+        world[:, columns] = parent_world @ rotation[:, columns]
+
+    if joints is not None:
+        selected = [column[bvh.joints[name].index] for name in joints]
+        position = position[:, selected]
+        world = world[:, selected]
+    return position, matrix_to_quat(world)
@@ -0,0 +1,263 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .bvhindex import pose_features
+from .bvhconcat import get_yaw, yaw_matrix, join
+from .bvhmath import euler_to_matrix, matrix_to_euler
+from .bvhfk import forward_kinematics
+
+#Motion graph over many clips of one skeleton and a beam search assembling clips along a path.
+#Edges are transitions (clip, frame) -> (clip, frame) between close poses, the search
+#plays clips along the edges so the root trajectory follows a target path on the ground.
+
+# root ground positions (frames, 2) and heading (frames,) of a clip,
+# ground coordinates are (forward axis, side axis) of the up axis like get_yaw
+def root_trajectory(bvh, up_axis=1):
+    position, quat = forward_kinematics(bvh, joints=[bvh.rootJoint.name])
+    forward_axis, side_axis = (up_axis + 1) % 3, (up_axis + 2) % 3
+    ground = position[:, 0][:, [forward_axis, side_axis]]
+    return ground, np.unwrap(get_yaw(quat[:, 0], up_axis))
+
+def rotate(points, angle):
+    c, s = np.cos(angle), np.sin(angle)
+    return np.stack((c * points[..., 0] - s * points[..., 1], s * points[..., 0] + c * points[..., 1]), axis=-1)
+
+# anim with the root turned by angle around the up axis and moved so frame starts at origin on the ground
+def place_root(bvh, anim, angle, origin, frame=0, up_axis=1):
+    root = bvh.rootJoint
+    anim = np.array(anim, dtype=np.float64)
+    turn = yaw_matrix(angle, up_axis)
+    if root.has_rot:
+        rotation = turn @ euler_to_matrix(anim[:, root.index, 3:6], root.rot_order)
+        anim[:, root.index, 3:6] = np.unwrap(matrix_to_euler(rotation, root.rot_order), axis=0)
+    if root.has_loc:
+        ground = np.ones(3)
+        ground[up_axis] = 0.0
+        location = anim[:, root.index, 0:3] - anim[frame, root.index, 0:3] * ground
+        anim[:, root.index, 0:3] = location @ turn.T + np.asarray(origin, dtype=np.float64) * ground
+    return anim
+
+class MotionGraph():
+    # clips {name: Bvh} of one skeleton, every stride-th frame can start or end a transition
+    # and transitions need at least min_gap frames between them inside one clip
+    def __init__(self, clips, up_axis=1, stride=5, min_gap=30):
+        self.names = list(clips)
+        self.clips = [clips[name] for name in self.names]
+        self.up_axis = up_axis
+        self.stride = stride
+        self.min_gap = min_gap
+        self.trajectories = [root_trajectory(bvh, up_axis) for bvh in self.clips]
+        #Per clip: (exit frames, target clips, target frames, costs) sorted by exit frame
+        self.edges = [(np.zeros(0, dtype=np.intp),) * 3 + (np.zeros(0),) for bvh in self.clips]
+
+    # all pairwise distances of the sampled frames in chunk_size x chunk_size blocks on max_workers threads
+    # (numpy releases the GIL in the products), only the best target frame of every target clip is kept,
+    # a transition is an edge when its distance is under threshold, by default the given quantile of
+    # the distances from about sample_size exit frames spread over all clips,
+    # at most two blocks of rows per thread are in flight and their edges are kept as they finish
+    def build(self, threshold=None, quantile=0.1, chunk_size=256, max_workers=None, sample_size=1024):
+        features = [pose_features(bvh, up_axis=self.up_axis)[::self.stride] for bvh in self.clips]
+        frames = [np.arange(len(feature)) * self.stride for feature in features]
+        norms = [np.einsum('ij,ij->i', feature, feature) for feature in features]
+        #Clips shorter than one sampled frame have no entries
+        targets = [clip for clip, feature in enumerate(features) if len(feature)]
+        if max_workers is None:
+            max_workers = min(32, (os.cpu_count() or 1) + 4)
+
+        # best distance (rows, clips) and target row of every target clip for exit rows of clip
+        def search(job):
+            clip, rows = job
+            block = features[clip][rows]
+            block_frame = frames[clip][rows]
+            block_norm = norms[clip][rows]
+            best = np.full((len(rows), len(features)), np.inf)
+            where = np.zeros((len(rows), len(features)), dtype=np.intp)
+            for target in targets:
+                for column in range(0, len(features[target]), chunk_size):
+                    part = slice(column, column + chunk_size)
+                    d = block_norm[:, None] + norms[target][None, part] - 2.0 * block @ features[target][part].T
+                    if target == clip:
+                        #No transition to nearby frames of the same clip
+                        d[np.abs(block_frame[:, None] - frames[target][None, part]) < self.min_gap] = np.inf
+                    index = np.argmin(d, axis=1)
+                    value = d[np.arange(len(rows)), index]
+                    better = value < best[:, target]
+                    best[better, target] = value[better]
+                    where[better, target] = column + index[better]
+            return clip, block_frame, np.sqrt(np.maximum(best, 0.0)), where
+
+        # search every job, handing each result to done as soon as it is ready
+        def run(jobs, done):
+            with ThreadPoolExecutor(max_workers) as executor:
+                pending = set()
+                for job in jobs:
+                    if len(pending) >= 2 * max_workers:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            done(*future.result())
+                    pending.add(executor.submit(search, job))
+                for future in pending:
+                    done(*future.result())
+
+        def chunks(step):
+            for clip in targets:
+                rows = np.arange(0, len(features[clip]), step)
+                for row in range(0, len(rows), chunk_size):
+                    yield clip, rows[row:row + chunk_size]
+
+        if threshold is None:
+            costs = []
+            def sample(clip, block_frame, best, where):
+                costs.append(best[np.isfinite(best)])
+            step = max(1, -(-sum(len(feature) for feature in features) // sample_size))
+            run(chunks(step), sample)
+            costs = np.concatenate(costs) if costs else np.zeros(0)
+            threshold = float(np.quantile(costs, quantile)) if len(costs) else 0.0
+
+        edges = [[] for _ in self.clips]
+        def keep(clip, block_frame, best, where):
+            rows, target = np.nonzero(best <= threshold)
+            edges[clip].append((block_frame[rows], target, where[rows, target] * self.stride, best[rows, target]))
+        run(chunks(1), keep)
+
+        for clip, parts in enumerate(edges):
+            if not parts:
+                continue
+            exit_frame, target, target_frame, cost = (np.concatenate(part) for part in zip(*parts))
+            order = np.argsort(exit_frame, kind='stable')
+            self.edges[clip] = (exit_frame[order], target[order], target_frame[order], cost[order])
+        self.threshold = threshold
+        return self
+
+    def edge_count(self):
+        return sum(len(edge[0]) for edge in self.edges)
+
+    # path (n, 3) as ground points (n, 2)
+    def get_ground(self, path):
+        forward_axis, side_axis = (self.up_axis + 1) % 3, (self.up_axis + 2) % 3
+        return np.asarray(path, dtype=np.float64)[:, [forward_axis, side_axis]]
+
+    # angle turning clip so it moves along the start of the ground path from frame first
+    def start_angle(self, clip, first, ground_path):
+        ground = self.trajectories[clip][0]
+        step = ground[min(first + self.min_gap, len(ground) - 1)] - ground[first]
+        direction = ground_path[min(1, len(ground_path) - 1)] - ground_path[0]
+        return np.arctan2(direction[1], direction[0]) - np.arctan2(step[1], step[0])
+
+    # beam search for segments [(clip name, first frame, last frame), ...] whose root follows path,
+    # path is (n, 3) points in clip space, every hypothesis tries the next branching transitions of its clip,
+    # the search starts from the beam_width clip frames whose first min_gap frames follow the path start best
+    # return (segments, mean distance to the path, covered fraction of the path length),
+    # covered is under 1 when no sequence reaches the end of the path and the furthest one is returned
+    def search(self, path, beam_width=64, branching=8, max_steps=200):
+        path = self.get_ground(path)
+        length = np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(path, axis=0), axis=1))))
+        total = length[-1]
+
+        def target(distance):
+            distance = np.clip(distance, 0.0, total)
+            return np.stack([np.interp(distance, length, path[:, axis]) for axis in range(2)], axis=-1)
+
+        # play clip from frame first to frame last after hypothesis h, the clip heading at first
+        # becomes heading and its root starts at origin
+        def extend(h, clip, first, last, heading, origin):
+            ground, yaw = self.trajectories[clip]
+            points = rotate(ground[first:last + 1] - ground[first], heading - yaw[first]) + origin
+            steps = np.linalg.norm(np.diff(points, axis=0), axis=1)
+            distance = h['distance'] + np.concatenate(([0.0], np.cumsum(steps)))
+            done = distance[-1] >= total
+            if done:
+                #Stop at the end of the path
+                last = first + int(np.searchsorted(distance, total))
+                points = points[:last - first + 1]
+                distance = distance[:last - first + 1]
+            error = np.sum((points - target(distance)) ** 2, axis=1)
+            return {
+                'segments': h['segments'] + [(clip, first, last)],
+                'distance': distance[-1],
+                'cost': h['cost'] + float(np.sum(error[1:] if h['segments'] else error)),
+                'frames': h['frames'] + len(points) - (1 if h['segments'] else 0),
+                'position': points[-1],
+                'heading': heading - yaw[first] + yaw[last],
+                'done': done,
+            }
+
+        start = {'segments': [], 'distance': 0.0, 'cost': 0.0, 'frames': 0}
+        starts = []
+        for clip, (ground, yaw) in enumerate(self.trajectories):
+            if len(ground) < 2:
+                continue
+            #Starts with less than min_gap frames left would score as standing still on the path start
+            firsts = np.arange(0, max(1, len(ground) - self.min_gap), max(self.min_gap, self.stride))
+            #Turn the clip so it starts moving along the path
+            angle = np.array([self.start_angle(clip, first, path) for first in firsts])
+            frames = np.minimum(firsts[:, None] + np.arange(self.min_gap + 1), len(ground) - 1)
+            points = rotate(ground[frames] - ground[firsts][:, None], angle[:, None]) + path[0]
+            steps = np.linalg.norm(np.diff(points, axis=1), axis=2)
+            distance = np.concatenate((np.zeros((len(firsts), 1)), np.cumsum(steps, axis=1)), axis=1)
+            error = np.mean(np.sum((points - target(distance)) ** 2, axis=-1), axis=1)
+            starts.extend(zip(error, [clip] * len(firsts), firsts, angle + yaw[firsts]))
+        starts.sort(key=lambda item: item[0])
+        beam = [dict(start, position=path[0], heading=heading, next=(clip, int(first)))
+                for error, clip, first, heading in starts[:beam_width]]
+
+        best = None
+        #Hypothesis that got furthest, also the ones that played a clip to its end
+        furthest = None
+        for step in range(max_steps):
+            candidates = []
+            for h in beam:
+                clip, first = h['next']
+                exit_frame, targets, target_frames, costs = self.edges[clip]
+                #Next transitions after first, or play the clip to its end
+                options = np.nonzero(exit_frame >= first + self.min_gap)[0][:branching]
+                exits = [(int(exit_frame[i]), (int(targets[i]), int(target_frames[i]))) for i in options]
+                exits.append((self.clips[clip].frame_count - 1, None))
+                for last, jump in exits:
+                    if last <= first:
+                        continue
+                    new = extend(h, clip, first, last, h['heading'], h['position'])
+                    if new['done']:
+                        if best is None or new['cost'] / new['frames'] < best['cost'] / best['frames']:
+                            best = new
+                        continue
+                    if furthest is None or new['distance'] > furthest['distance']:
+                        furthest = new
+                    if jump is None:
+                        continue
+                    new['next'] = jump
+                    candidates.append(new)
+
+            if not candidates:
+                break
+            #Mean error per frame, ties go to the hypothesis that got further
+            candidates.sort(key=lambda h: (h['cost'] / max(h['frames'], 1), -h['distance']))
+            beam = candidates[:beam_width]
+            if best is not None and best['cost'] / best['frames'] <= beam[0]['cost'] / max(beam[0]['frames'], 1):
+                break
+
+        if best is None:
+            #Path longer than anything found
+            best = furthest
+        if best is None or not best['segments']:
+            return [], float('inf'), 0.0
+        segments = [(self.names[clip], first, last) for clip, first, last in best['segments']]
+        covered = min(1.0, best['distance'] / total) if total > 0 else 1.0
+        return segments, float(np.sqrt(best['cost'] / best['frames'])), covered
+
+    # one continuous clip playing the segments, joined with blend_frames blended frames,
+    # with the path of search the root starts on it like in the search
+    def assemble(self, segments, blend_frames=10, path=None):
+        name, first, last = segments[0]
+        clip = self.names.index(name)
+        bvh = self.clips[clip]
+        anim = bvh.get_anim(first, bvh.frame_count)
+        if path is not None:
+            anim = place_root(bvh, anim, self.start_angle(clip, first, self.get_ground(path)), path[0], 0, self.up_axis)
+        result = bvh.new_clip(anim)
+        end = last - first
+        for name, first, last in segments[1:]:
+            bvh = self.clips[self.names.index(name)]
+            result = join(result, bvh, end, first, blend_frames, self.up_axis)
+            end += last - first
+        return result.new_clip(result.get_anim(0, end + 1))
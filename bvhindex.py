@@ -0,0 +1,270 @@
+import heapq
+import numpy as np
+from .bvhconcat import pose_features as get_pose_positions, get_yaw
+from .bvhfk import forward_kinematics
+
+#Nearest pose lookup over many clips.
+#Every frame is a feature vector: joint positions relative to the root (heading removed),
+#root velocity in the heading frame and heading change per second.
+
+# (frames, features) of frames [start, end) of bvh
+def pose_features(bvh, start=0, end=None, up_axis=1, velocity_weight=0.1, heading_weight=1.0):
+    if end is None:
+        end = bvh.frame_count
+    #A neighbour frame for the rates
+    first = max(0, start - 1)
+    last = min(bvh.frame_count, max(end, first + 2))
+    names = [joint.name for joint in sorted(bvh.joints.values(), key=lambda joint: joint.index)]
+    positions = get_pose_positions(bvh, first, last, names, up_axis)
+    root_position, root_quat = forward_kinematics(bvh, first, last, [bvh.rootJoint.name])
+    root_position = root_position[:, 0]
+    yaw = np.unwrap(get_yaw(root_quat[:, 0], up_axis))
+
+    frame_time = bvh.frame_time if bvh.frame_time > 0 else 1.0
+    def rate(values):
+        if len(values) < 2:
+            return np.zeros_like(values)
+        d = np.diff(values, axis=0) / frame_time
+        return np.concatenate((d[:1], d))
+
+    #Root velocity seen from the root heading, so turning the whole clip changes nothing
+    velocity = rate(root_position)
+    c, s = np.cos(yaw), np.sin(yaw)
+    forward_axis, side_axis = (up_axis + 1) % 3, (up_axis + 2) % 3
+    local_velocity = velocity.copy()
+    local_velocity[:, forward_axis] = c * velocity[:, forward_axis] + s * velocity[:, side_axis]
+    local_velocity[:, side_axis] = -s * velocity[:, forward_axis] + c * velocity[:, side_axis]
+
+    features = np.hstack((
+        positions,
+        velocity_weight * local_velocity,
+        heading_weight * rate(yaw)[:, None],
+    ))
+    return features[start - first:end - first]
+
+# KD-tree over a low dimensional orthonormal projection of the features,
+# distances in the projection never exceed the full distances so the search stays exact
+class KDTree():
+    def __init__(self, features, projection, leaf_size=64):
+        self.features = features
+        self.projection = projection
+        self.points = features @ projection
+        self.leaf_size = leaf_size
+        self.order = np.arange(len(features))
+        #Per node: lower corner, upper corner, children (left, right) or -1, range of self.order
+        self.lower = []
+        self.upper = []
+        self.children = []
+        self.ranges = []
+        if len(features):
+            self.build(0, len(features))
+
+    def build(self, start, end):
+        node = len(self.ranges)
+        points = self.points[self.order[start:end]]
+        self.lower.append(points.min(axis=0))
+        self.upper.append(points.max(axis=0))
+        self.ranges.append((start, end))
+        self.children.append((-1, -1))
+        if end - start <= self.leaf_size:
+            return node
+
+        #Split the widest axis at the median
+        axis = int(np.argmax(self.upper[node] - self.lower[node]))
+        middle = (end - start) // 2
+        part = np.argpartition(points[:, axis], middle)
+        self.order[start:end] = self.order[start:end][part]
+        left = self.build(start, start + middle)
+        right = self.build(start + middle, end)
+        self.children[node] = (left, right)
+        return node
+
+    def bound(self, node, point):
+        gap = np.maximum(0.0, np.maximum(self.lower[node] - point, point - self.upper[node]))
+        return float(np.dot(gap, gap))
+
+    # (row, squared distance) of the nearest row where alive is True, (-1, inf) when there is none
+    def query(self, feature, alive=None):
+        best = (-1, np.inf)
+        if not self.ranges:
+            return best
+        point = feature @ self.projection
+        heap = [(self.bound(0, point), 0)]
+        while heap:
+            bound, node = heapq.heappop(heap)
+            if bound >= best[1]:
+                break
+            left, right = self.children[node]
+            if left == -1:
+                start, end = self.ranges[node]
+                rows = self.order[start:end]
+                if alive is not None:
+                    rows = rows[alive[rows]]
+                if len(rows) == 0:
+                    continue
+                d = self.features[rows] - feature
+                d = np.einsum('ij,ij->i', d, d)
+                i = int(np.argmin(d))
+                if d[i] < best[1]:
+                    best = (int(rows[i]), float(d[i]))
+                continue
+            for child in (left, right):
+                heapq.heappush(heap, (self.bound(child, point), child))
+        return best
+
+# index of every frame of many clips, clips are added and removed one at a time:
+# new frames wait in a small list searched by brute force, removed frames are masked,
+# the tree is rebuilt once either grows past a quarter of it
+class PoseIndex():
+    def __init__(self, up_axis=1, projection_size=12, leaf_size=64):
+        self.up_axis = up_axis
+        self.projection_size = projection_size
+        self.leaf_size = leaf_size
+        #{skeleton: group}, clips of one skeleton (same joint names) share one tree
+        self.groups = {}
+        #{clip name: skeleton}
+        self.clips = {}
+        #{clip name: Bvh} of the featurized clips, for release()
+        self.indexed = {}
+        #Clips added but not featurized yet
+        self.waiting = {}
+
+    def get_skeleton(self, bvh):
+        return tuple(joint.name for joint in sorted(bvh.joints.values(), key=lambda joint: joint.index))
+
+    def add(self, name, bvh):
+        if name in self.clips or name in self.waiting:
+            self.remove(name)
+        self.waiting[name] = bvh
+
+    def remove(self, name):
+        self.waiting.pop(name, None)
+        self.indexed.pop(name, None)
+        skeleton = self.clips.pop(name, None)
+        if skeleton is None:
+            return
+        group = self.groups[skeleton]
+        group['pending'] = [item for item in group['pending'] if item[0] != name]
+        for clip, clip_name in enumerate(group['names']):
+            if clip_name == name:
+                group['alive'][group['clip'] == clip] = False
+        if np.count_nonzero(~group['alive']) * 4 > len(group['alive']):
+            self.rebuild(skeleton)
+
+    def clear(self):
+        self.groups = {}
+        self.clips = {}
+        self.indexed = {}
+        self.waiting = {}
+
+    # bytes of the features and trees, clips waiting to be featurized hold none
+    def get_size(self):
+        size = 0
+        for group in self.groups.values():
+            tree = group['tree']
+            if tree is not None:
+                size += tree.features.nbytes + tree.points.nbytes + tree.order.nbytes
+                size += sum(corner.nbytes for corner in tree.lower + tree.upper)
+            size += group['clip'].nbytes + group['frame'].nbytes + group['alive'].nbytes
+            size += sum(feature.nbytes for name, feature in group['pending'])
+        return size
+
+    # drop every feature, the clips stay in the index and are featurized again by the next query
+    def release(self):
+        self.waiting.update(self.indexed)
+        self.groups = {}
+        self.clips = {}
+        self.indexed = {}
+
+    def __len__(self):
+        return len(self.clips) + len(self.waiting)
+
+    # featurize the clips added since the last query
+    def update(self):
+        for name, bvh in list(self.waiting.items()):
+            skeleton = self.get_skeleton(bvh)
+            group = self.groups.setdefault(skeleton, {
+                'tree': None, 'names': [], 'clip': np.zeros(0, dtype=np.intp), 'frame': np.zeros(0, dtype=np.intp),
+                'alive': np.zeros(0, dtype=bool), 'pending': [],
+            })
+            group['pending'].append((name, pose_features(bvh, up_axis=self.up_axis)))
+            self.clips[name] = skeleton
+            self.indexed[name] = bvh
+            del self.waiting[name]
+
+            tree_size = len(group['alive'])
+            if sum(len(item[1]) for item in group['pending']) * 4 > tree_size:
+                self.rebuild(skeleton)
+
+    # one tree with every live frame of the group
+    def rebuild(self, skeleton):
+        group = self.groups[skeleton]
+        features = []
+        names = []
+        clip = []
+        frame = []
+        tree = group['tree']
+        if tree is not None:
+            for index, name in enumerate(group['names']):
+                rows = np.nonzero(group['alive'] & (group['clip'] == index))[0]
+                if len(rows) == 0:
+                    continue
+                features.append(tree.features[rows])
+                clip.append(np.full(len(rows), len(names)))
+                frame.append(group['frame'][rows])
+                names.append(name)
+        for name, feature in group['pending']:
+            features.append(feature)
+            clip.append(np.full(len(feature), len(names)))
+            frame.append(np.arange(len(feature)))
+            names.append(name)
+
+        features = np.concatenate(features) if features else np.zeros((0, 0))
+        group['names'] = names
+        group['clip'] = np.concatenate(clip).astype(np.intp) if clip else np.zeros(0, dtype=np.intp)
+        group['frame'] = np.concatenate(frame).astype(np.intp) if frame else np.zeros(0, dtype=np.intp)
+        group['alive'] = np.ones(len(features), dtype=bool)
+        group['pending'] = []
+        group['tree'] = KDTree(features, self.get_projection(features), self.leaf_size) if len(features) else None
+
+    # principal axes of the features (rows of a sample), as columns
+    def get_projection(self, features):
+        sample = features[::max(1, len(features) // 10000)]
+        sample = sample - sample.mean(axis=0)
+        vt = np.linalg.svd(sample, full_matrices=False)[2]
+        return vt[:min(self.projection_size, len(vt))].T
+
+    # nearest frame to frame of bvh among the indexed clips with the same skeleton,
+    # return (clip name, frame, distance) or None, clips named in exclude are skipped
+    def query(self, bvh, frame, exclude=()):
+        self.update()
+        group = self.groups.get(self.get_skeleton(bvh))
+        if group is None:
+            return None
+        feature = pose_features(bvh, frame, frame + 1, self.up_axis)[0]
+        return self.query_feature(group, feature, exclude)
+
+    def query_feature(self, group, feature, exclude=()):
+        best = None
+        tree = group['tree']
+        if tree is not None:
+            alive = group['alive']
+            skip = [index for index, name in enumerate(group['names']) if name in exclude]
+            if skip:
+                alive = alive & ~np.isin(group['clip'], skip)
+            row, distance = tree.query(feature, alive)
+            if row != -1:
+                best = (group['names'][group['clip'][row]], int(group['frame'][row]), distance)
+
+        for name, features in group['pending']:
+            if name in exclude:
+                continue
+            d = features - feature
+            d = np.einsum('ij,ij->i', d, d)
+            i = int(np.argmin(d))
+            if best is None or d[i] < best[2]:
+                best = (name, i, float(d[i]))
+
+        if best is None:
+            return None
+        return best[0], best[1], float(np.sqrt(best[2]))
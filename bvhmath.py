@@ -0,0 +1,279 @@
+import numpy as np
+
+#Vectorized spline and rotation math used by the add-on,
+#functions work on arrays of shape (..., 3) vectors / (..., 4) quaternions (w, x, y, z)
+
+# uniform cubic B-spline weights of the 4 control points for each t, shape (len(t), 4)
+# column i matches getCubicConstant(t, i)
+def cubic_basis(t):
+    t = np.asarray(t, dtype=np.float64)
+    t2 = t * t
+    t3 = t2 * t
+    basis = np.empty(t.shape + (4,))
+    basis[..., 0] = (1.0 - t) ** 3 / 6.0
+    basis[..., 1] = (3.0 * t3 - 6.0 * t2 + 4.0) / 6.0
+    basis[..., 2] = (-3.0 * t3 + 3.0 * t2 + 3.0 * t + 1.0) / 6.0
+    basis[..., 3] = t3 / 6.0
+    return basis
+
+# first control point and weights of the 4 control points driving each t
+# on a uniform cubic B-spline with control_count control points (control_count - 3 segments)
+def bspline_basis(t, control_count):
+    t = np.clip(np.asarray(t, dtype=np.float64), 0.0, 1.0)
+    segment_count = control_count - 3
+    u = t * segment_count
+    index = np.minimum(np.floor(u).astype(np.intp), segment_count - 1)
+    return index, cubic_basis(u - index)
+
+def eval_bspline(control, t):
+    control = np.asarray(control, dtype=np.float64)
+    index, weights = bspline_basis(t, len(control))
+    return np.einsum('fi,fij->fj', weights, control[index[:, None] + np.arange(4)])
+
+# cumulative arc length of the spline at samples + 1 uniform parameters, normalized to [0, 1]
+# return (t, s), a curve of zero length gets s = t
+def arc_length_table(control, samples=1024):
+    t = np.linspace(0.0, 1.0, samples + 1)
+    points = eval_bspline(control, t)
+    s = np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(points, axis=0), axis=1))))
+    if s[-1] <= 0.0:
+        return t, t.copy()
+    return t, s / s[-1]
+
+# parameters of the spline at the normalized distances of an arc_length_table,
+# binary search for the table interval then linear interpolation inside it
+def arc_length_to_param(table, distance):
+    t, s = table
+    distance = np.clip(np.asarray(distance, dtype=np.float64), 0.0, 1.0)
+    index = np.clip(np.searchsorted(s, distance, side='right') - 1, 0, len(s) - 2)
+    length = s[index + 1] - s[index]
+    factor = np.divide(distance - s[index], length, out=np.zeros_like(distance), where=length > 0)
+    return t[index] + factor * (t[index + 1] - t[index])
+
+# least squares control points of a uniform cubic B-spline through points sampled at t,
+# the normal matrix only has 3 diagonals on each side so assembly and solve are linear
+def fit_bspline(t, points, control_count, damping=1e-14):
+    points = np.asarray(points, dtype=np.float64)
+    index, weights = bspline_basis(t, control_count)
+
+    #bands[d, i] = A[i, i + d]
+    bands = np.zeros((4, control_count))
+    rhs = np.zeros((control_count, points.shape[1]))
+    for i in range(4):
+        for d in range(4 - i):
+            bands[d] += np.bincount(index + i, weights[:, i] * weights[:, i + d], minlength=control_count)
+        for axis in range(points.shape[1]):
+            rhs[:, axis] += np.bincount(index + i, weights[:, i] * points[:, axis], minlength=control_count)
+
+    #Keep the system definite when some segments have no samples
+    bands[0] += damping * max(bands[0].max(), 1.0)
+    return solve_banded_spd(bands, rhs)
+
+# solve A x = rhs for a symmetric positive definite banded A given as bands[d, i] = A[i, i + d]
+def solve_banded_spd(bands, rhs):
+    width, n = bands.shape[0] - 1, bands.shape[1]
+
+    #Banded Cholesky A = U^T U, U stored the same way as bands
+    U = np.zeros_like(bands)
+    for i in range(n):
+        for d in range(min(width, n - 1 - i) + 1):
+            j = i + d
+            s = bands[d, i]
+            for k in range(max(0, j - width), i):
+                s -= U[i - k, k] * U[j - k, k]
+            if d == 0:
+                U[0, i] = np.sqrt(s)
+            else:
+                U[d, i] = s / U[0, i]
+
+    x = np.array(rhs, dtype=np.float64)
+    for i in range(n):
+        for k in range(max(0, i - width), i):
+            x[i] -= U[i - k, k] * x[k]
+        x[i] /= U[0, i]
+    for i in range(n - 1, -1, -1):
+        for k in range(i + 1, min(n, i + width + 1)):
+            x[i] -= U[k - i, i] * x[k]
+        x[i] /= U[0, i]
+    return x
+
+# Ramer-Douglas-Peucker on a curve y(x): mask of the samples to keep so that linear interpolation
+# between kept samples is within tolerance of every dropped sample,
+# y (n,) or (n, columns) for several curves on the same x, every segment of every curve is split
+# in the same pass so the loop runs once per level of the split tree instead of once per kept sample,
+# every block-th sample is kept so long periodic curves do not make the tree thousands of levels deep
+def simplify_curve(x, y, tolerance, block=128):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    single = y.ndim == 1
+    #One curve per row so the samples of a segment are contiguous
+    y = (y[:, None] if single else y).T
+    count, n = y.shape
+    keep = np.zeros((count, n), dtype=bool)
+    if n:
+        #Fixed keys every block samples bound the depth of the split tree
+        keep[:, ::block] = True
+        keep[:, -1] = True
+    #Flat positions of the samples of the segments still being split
+    flat = keep.ravel()
+    y = y.ravel()
+    x = np.tile(x, count)
+    active = np.arange(count * n)
+    while len(active):
+        #Kept samples before and after every sample, the segment ends at the one before the next kept
+        first = flat[active]
+        segment = np.cumsum(first) - 1
+        starts = np.flatnonzero(first)
+        left = active[starts][segment]
+        #The last sample of a curve is kept, so right only passes the end of y for the last one
+        right = np.minimum(np.append(active[starts[1:] - 1], active[-1]) + 1, len(y) - 1)[segment]
+        xl = x[left]
+        yl = y[left]
+        span = x[right] - xl
+        line = yl + (y[right] - yl) * (x[active] - xl) / np.where(span > 0, span, 1.0)
+        error = np.abs(y[active] - line)
+        error[first] = -1.0
+
+        #Largest error of every segment
+        largest = np.maximum.reduceat(error, starts)[segment]
+        split = np.flatnonzero((error == largest) & (largest > tolerance))
+        if len(split) == 0:
+            break
+        #First sample with the largest error, like argmax
+        split = split[np.concatenate(([True], segment[split[1:]] != segment[split[:-1]]))]
+        flat[active[split]] = True
+        splitting = np.zeros(len(starts), dtype=bool)
+        splitting[segment[split]] = True
+        active = active[splitting[segment]]
+    return keep[0] if single else keep.T
+
+def normalize(v):
+    length = np.linalg.norm(v, axis=-1, keepdims=True)
+    return np.divide(v, length, out=np.zeros_like(v), where=length > 0)
+
+# same as mathutils Vector.rotation_difference for each row of a and b
+def rotation_difference(a, b):
+    a = normalize(np.asarray(a, dtype=np.float64))
+    b = normalize(np.asarray(b, dtype=np.float64))
+
+    axis = np.cross(a, b)
+    axis_length = np.linalg.norm(axis, axis=-1, keepdims=True)
+    dot = np.sum(a * b, axis=-1)
+    #Robust angle between normalized vectors like angle_normalized_v3v3
+    angle = np.where(
+        dot >= 0,
+        2.0 * np.arcsin(np.clip(np.linalg.norm(a - b, axis=-1) / 2.0, -1.0, 1.0)),
+        np.pi - 2.0 * np.arcsin(np.clip(np.linalg.norm(a + b, axis=-1) / 2.0, -1.0, 1.0)),
+    )
+
+    #Colinear but opposed vectors rotate 180 degrees around any orthogonal axis
+    ortho = np.cross(a, np.where(np.abs(a[..., 0:1]) < 0.9, [1.0, 0.0, 0.0], [0.0, 1.0, 0.0]))
+    degenerate = axis_length[..., 0] <= np.finfo(np.float32).eps
+    axis = np.where(degenerate[..., None], normalize(ortho), axis / np.where(axis_length > 0, axis_length, 1.0))
+    angle = np.where(degenerate, np.where(dot > 0, 0.0, np.pi), angle)
+
+    quat = np.empty(a.shape[:-1] + (4,))
+    quat[..., 0] = np.cos(0.5 * angle)
+    quat[..., 1:] = axis * np.sin(0.5 * angle)[..., None]
+    return quat
+
+# rotation matrices of euler angles (..., 3) stored x, y, z, applied in the BVH channel order
+# order is a triple of axis indices, e.g. (2, 0, 1) for Zrotation Xrotation Yrotation: Rz @ Rx @ Ry
+def euler_to_matrix(angles, order):
+    angles = np.asarray(angles, dtype=np.float64)
+    c = np.cos(angles)
+    s = np.sin(angles)
+    matrix = np.broadcast_to(np.eye(3), angles.shape[:-1] + (3, 3)).copy()
+    for axis in order:
+        if axis is None:
+            continue
+        i, j = (axis + 1) % 3, (axis + 2) % 3
+        rotation = np.zeros(angles.shape[:-1] + (3, 3))
+        rotation[..., axis, axis] = 1.0
+        rotation[..., i, i] = c[..., axis]
+        rotation[..., j, j] = c[..., axis]
+        rotation[..., i, j] = -s[..., axis]
+        rotation[..., j, i] = s[..., axis]
+        matrix = matrix @ rotation
+    return matrix
+
+# euler angles (..., 3) stored x, y, z of rotation matrices, the inverse of euler_to_matrix for the same order
+def matrix_to_euler(matrix, order):
+    if None in order:
+        order = (0, 1, 2)
+    m = np.asarray(matrix, dtype=np.float64)
+    a, b, c = order
+    #Even permutations of x, y, z flip no signs
+    sign = 1.0 if (b - a) % 3 == 1 else -1.0
+
+    angles = np.empty(m.shape[:-2] + (3,))
+    sin_b = np.clip(sign * m[..., a, c], -1.0, 1.0)
+    angles[..., b] = np.arcsin(sin_b)
+    angles[..., a] = np.arctan2(-sign * m[..., b, c], m[..., c, c])
+    angles[..., c] = np.arctan2(-sign * m[..., a, b], m[..., a, a])
+
+    #Gimbal lock, only the sum of the first and last angle is known
+    locked = np.abs(sin_b) > 1.0 - 1.0e-12
+    angles[..., a] = np.where(locked, np.arctan2(sign * m[..., c, b], m[..., b, b]), angles[..., a])
+    angles[..., c] = np.where(locked, 0.0, angles[..., c])
+    return angles
+
+# quaternions (w, x, y, z) of rotation matrices (..., 3, 3), w kept positive
+def matrix_to_quat(matrix):
+    m = np.asarray(matrix, dtype=np.float64)
+    m00, m11, m22 = m[..., 0, 0], m[..., 1, 1], m[..., 2, 2]
+    #Magnitudes from the diagonal, signs from the off diagonal terms
+    quat = np.empty(m.shape[:-2] + (4,))
+    quat[..., 0] = np.sqrt(np.maximum(0.0, 1.0 + m00 + m11 + m22)) / 2.0
+    quat[..., 1] = np.copysign(np.sqrt(np.maximum(0.0, 1.0 + m00 - m11 - m22)) / 2.0, m[..., 2, 1] - m[..., 1, 2])
+    quat[..., 2] = np.copysign(np.sqrt(np.maximum(0.0, 1.0 - m00 + m11 - m22)) / 2.0, m[..., 0, 2] - m[..., 2, 0])
+    quat[..., 3] = np.copysign(np.sqrt(np.maximum(0.0, 1.0 - m00 - m11 + m22)) / 2.0, m[..., 1, 0] - m[..., 0, 1])
+    return normalize(quat)
+
+# spherical interpolation from quaternions a to b by factor (...,), along the shorter arc
+def slerp(a, b, factor):
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    factor = np.asarray(factor, dtype=np.float64)[..., None]
+    dot = np.sum(a * b, axis=-1, keepdims=True)
+    b = np.where(dot < 0, -b, b)
+    dot = np.abs(dot)
+
+    angle = np.arccos(np.clip(dot, -1.0, 1.0))
+    sin_angle = np.sin(angle)
+    #Nearly equal quaternions fall back to a normalized lerp
+    near = sin_angle < 1.0e-6
+    safe = np.where(near, 1.0, sin_angle)
+    wa = np.where(near, 1.0 - factor, np.sin((1.0 - factor) * angle) / safe)
+    wb = np.where(near, factor, np.sin(factor * angle) / safe)
+    return normalize(wa * a + wb * b)
+
+# rotation matrices in mathutils row layout, so matrix @ vector rotates the vector
+def quat_to_matrix(quat):
+    w, x, y, z = np.moveaxis(np.asarray(quat, dtype=np.float64), -1, 0)
+    matrix = np.empty(w.shape + (3, 3))
+    matrix[..., 0, 0] = 1.0 - 2.0 * (y * y + z * z)
+    matrix[..., 0, 1] = 2.0 * (x * y - w * z)
+    matrix[..., 0, 2] = 2.0 * (x * z + w * y)
+    matrix[..., 1, 0] = 2.0 * (x * y + w * z)
+    matrix[..., 1, 1] = 1.0 - 2.0 * (x * x + z * z)
+    matrix[..., 1, 2] = 2.0 * (y * z - w * x)
+    matrix[..., 2, 0] = 2.0 * (x * z - w * y)
+    matrix[..., 2, 1] = 2.0 * (y * z + w * x)
+    matrix[..., 2, 2] = 1.0 - 2.0 * (x * x + y * y)
+    return matrix
+
+# same as mathutils Quaternion.to_euler() ('XYZ' order, smallest of the two solutions)
+def quat_to_euler(quat):
+    matrix = quat_to_matrix(quat)
+    m00, m01, m02 = matrix[..., 0, 0], matrix[..., 1, 0], matrix[..., 2, 0]
+    m12, m22 = matrix[..., 2, 1], matrix[..., 2, 2]
+    m21, m11 = matrix[..., 1, 2], matrix[..., 1, 1]
+
+    cy = np.hypot(m00, m01)
+    eul1 = np.stack((np.arctan2(m12, m22), np.arctan2(-m02, cy), np.arctan2(m01, m00)), axis=-1)
+    eul2 = np.stack((np.arctan2(-m12, -m22), np.arctan2(-m02, -cy), np.arctan2(-m01, -m00)), axis=-1)
+    gimbal = np.stack((np.arctan2(-m21, m11), np.arctan2(-m02, cy), np.zeros_like(cy)), axis=-1)
+
+    best = np.where((np.abs(eul1).sum(axis=-1) > np.abs(eul2).sum(axis=-1))[..., None], eul2, eul1)
+    return np.where((cy > 16.0 * np.finfo(np.float32).eps)[..., None], best, gimbal)
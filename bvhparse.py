@@ -0,0 +1,194 @@
+import warnings
+import numpy as np
+
+#BVH text parsing with no Blender dependency, so it can also run in worker processes.
+#The joint tree comes back in the plain format of Bvh.get_hierarchy / Bvh.set_hierarchy.
+
+def add(a, b):
+    return [a[0] + b[0], a[1] + b[1], a[2] + b[2]]
+
+# return {'hierarchy', 'root', 'frame_count', 'frame_time', 'channel_count', 'motion_offset', 'motion'}
+# motion is a (frame_count, channel_count) array in file units (degrees), None with load_motion=False
+def parse_bvh(file_path, load_motion=True):
+    with open(file_path, 'r') as file:
+
+        #Tokenize the hierarchy only, the motion block is read in one bulk pass
+        file_lines = []
+        while True:
+            line = file.readline()
+            if not line:
+                break
+            tokens = line.split()
+            if not tokens:
+                continue
+            file_lines.append(tokens)
+            if len(tokens) > 1 and tokens[0].lower() == 'frame' and tokens[1].lower() == 'time:':
+                break
+
+        if file_lines and file_lines[0][0].lower() == 'hierarchy':
+            pass
+        else:
+            raise Exception("This is not a BVH file")
+
+        hierarchy = []
+        joint_serial = [None]
+        channelIndex = -1
+        root = -1
+        frame_count = 0
+        frame_time = 0
+
+        lineIdx = 0
+        while lineIdx < len(file_lines) - 1:
+            if file_lines[lineIdx][0].lower() in {'root', 'joint'}:
+                #get root joint
+                isRoot = file_lines[lineIdx][0].lower() == 'root'
+
+                #Joint name
+                name = file_lines[lineIdx][1]
+
+                #get offset
+                lineIdx += 2
+                rest_head_local = [float(v) for v in file_lines[lineIdx][1:4]]
+
+                #get channel
+                lineIdx += 1
+                channels = [-1, -1, -1, -1, -1, -1]
+                rot_orders = [None, None, None]
+                rot_count = 0
+                for channel in file_lines[lineIdx][2:]:
+                    channel = channel.lower()
+                    channelIndex += 1
+                    if channel == 'xposition':
+                        channels[0] = channelIndex
+                    elif channel == 'yposition':
+                        channels[1] = channelIndex
+                    elif channel == 'zposition':
+                        channels[2] = channelIndex
+
+                    elif channel == 'xrotation':
+                        channels[3] = channelIndex
+                        rot_orders[rot_count] = 0
+                        rot_count += 1
+                    elif channel == 'yrotation':
+                        channels[4] = channelIndex
+                        rot_orders[rot_count] = 1
+                        rot_count += 1
+                    elif channel == 'zrotation':
+                        channels[5] = channelIndex
+                        rot_orders[rot_count] = 2
+                        rot_count += 1
+
+                parent = joint_serial[-1]
+                #Add the parent offset
+                if parent is None:
+                    rest_head_world = list(rest_head_local)
+                else:
+                    rest_head_world = add(parent['head_world'], rest_head_local)
+
+                joint = {
+                    'name': name,
+                    'parent': parent['index'] if parent else -1,
+                    'offset': rest_head_local,
+                    'head_world': rest_head_world,
+                    'tail_local': None,
+                    'tail_world': None,
+                    'channels': channels,
+                    'rot_order': rot_orders,
+                    'index': len(hierarchy),
+                    'children': [],
+                }
+                if parent:
+                    parent['children'].append(joint)
+                if isRoot:
+                    root = joint['index']
+                hierarchy.append(joint)
+                joint_serial.append(joint)
+
+            if file_lines[lineIdx][0].lower() == 'end' and file_lines[lineIdx][1].lower() == 'site':
+                #get offset
+                lineIdx += 2
+                rest_tail = [float(v) for v in file_lines[lineIdx][1:4]]
+
+                joint_serial[-1]['tail_world'] = add(joint_serial[-1]['head_world'], rest_tail)
+                joint_serial[-1]['tail_local'] = add(joint_serial[-1]['offset'], rest_tail)
+                joint_serial.append(None)
+
+            #remove serial joint
+            if len(file_lines[lineIdx]) == 1 and file_lines[lineIdx][0] == '}':
+                joint_serial.pop()
+
+            #End of Hierarchy
+            if len(file_lines[lineIdx]) == 1 and file_lines[lineIdx][0].lower() == 'motion':
+                lineIdx += 1  # Read frame
+                if (len(file_lines[lineIdx]) == 2 and file_lines[lineIdx][0].lower() == 'frames:'):
+                    frame_count = int(file_lines[lineIdx][1])
+
+                lineIdx += 1  # Read frame rate.
+                if (len(file_lines[lineIdx]) == 3 and file_lines[lineIdx][0].lower() == 'frame' and file_lines[lineIdx][1].lower() == 'time:'):
+                    frame_time = float(file_lines[lineIdx][2])
+                lineIdx += 1  # get the first frame
+                break
+            lineIdx += 1
+
+        channel_count = channelIndex + 1
+        motion_offset = file.tell()
+        motion = None
+        if load_motion:
+            motion = read_motion(file, channel_count, frame_count, file_path)
+
+    #Set tail for each joint
+    for joint in hierarchy:
+        children = joint['children']
+        head_world = joint['head_world']
+        if joint['tail_world'] is None:
+            if len(children) == 0:
+                joint['tail_world'] = list(head_world)
+                joint['tail_local'] = list(joint['offset'])
+            elif len(children) == 1:
+                joint['tail_world'] = list(children[0]['head_world'])
+                joint['tail_local'] = add(joint['offset'], children[0]['offset'])
+            else:
+                tail_world = [0.0, 0.0, 0.0]
+                tail_local = [0.0, 0.0, 0.0]
+                for child in children:
+                    tail_world = add(tail_world, child['head_world'])
+                    tail_local = add(tail_local, child['offset'])
+                joint['tail_world'] = [v * (1.0 / len(children)) for v in tail_world]
+                joint['tail_local'] = [v * (1.0 / len(children)) for v in tail_local]
+
+    #Only keep what Bvh.set_hierarchy reads
+    for joint in hierarchy:
+        del joint['children'], joint['head_world'], joint['index']
+
+    return {
+        'hierarchy': hierarchy,
+        'root': root,
+        'frame_count': frame_count,
+        'frame_time': frame_time,
+        'channel_count': channel_count,
+        'motion_offset': motion_offset,
+        'motion': motion,
+    }
+
+# (frames, channel_count) array of the numbers in text, which must be whole frames
+def parse_frames(text, channel_count, file_path=''):
+    #Parse every number at once instead of float() per channel,
+    #older NumPy only warns about a bad token and stops there
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', DeprecationWarning)
+            values = np.fromstring(text, dtype=np.float64, sep=' ')
+    except (ValueError, DeprecationWarning):
+        raise Exception("%s: the motion data has a value that is not a number" % file_path)
+    if channel_count == 0:
+        return np.zeros((0, 0))
+    if len(values) % channel_count:
+        raise Exception("%s: the last frame has %d of %d values" % (file_path, len(values) % channel_count, channel_count))
+    return values.reshape(-1, channel_count)
+
+# the rest of file as motion, with the frame count of the header when it is given
+def read_motion(file, channel_count, frame_count=None, file_path=''):
+    motion = parse_frames(file.read(), channel_count, file_path)
+    if frame_count is not None and channel_count and len(motion) != frame_count:
+        raise Exception("%s: expected %d frames, got %d" % (file_path, frame_count, len(motion)))
+    return motion
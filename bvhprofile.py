@@ -0,0 +1,77 @@
+import os
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+#Per-stage wall time and allocation of the operators.
+#Stages only measure inside an enabled run, everywhere else stage() is one attribute check.
+
+#Reusable no-op context, returned while no run is recorded
+_NULL = nullcontext()
+
+class Profiler():
+    def __init__(self):
+        #Run being recorded, None when disabled
+        self.current = None
+        #{'name', 'time', 'wall', 'peak', 'frames', 'joints', 'stages': [{'name', 'wall', 'peak', 'frames', 'joints'}]}
+        self.last_run = None
+
+    # record every stage inside, keep the result in last_run and append it to log_path as one JSON line
+    @contextmanager
+    def run(self, name, enabled=True, log_path=None):
+        if not enabled or self.current is not None:
+            yield None
+            return
+
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        run = self.current = {'name': name, 'time': time.time(), 'wall': 0.0, 'peak': 0, 'frames': None, 'joints': None, 'stages': []}
+        begin = time.perf_counter()
+        base = tracemalloc.get_traced_memory()[0]
+        try:
+            yield run
+        finally:
+            run['wall'] = time.perf_counter() - begin
+            run['peak'] = max([stage['peak'] for stage in run['stages']] + [tracemalloc.get_traced_memory()[1] - base, 0])
+            if started:
+                tracemalloc.stop()
+            self.current = None
+            self.last_run = run
+            if log_path:
+                with open(os.path.abspath(log_path), 'a') as file:
+                    file.write(json.dumps(run) + '\n')
+
+    # time one stage of the current run, frames / joints are the sizes it worked on
+    def stage(self, name, frames=None, joints=None):
+        if self.current is None:
+            return _NULL
+        return self._stage(name, frames, joints)
+
+    @contextmanager
+    def _stage(self, name, frames, joints):
+        stage = {'name': name, 'wall': 0.0, 'peak': 0, 'frames': frames, 'joints': joints}
+        self.current['stages'].append(stage)
+        #Peak since the stage started, without reset_peak (Python 3.9) the run peak so far
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        begin = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage['wall'] = time.perf_counter() - begin
+            stage['peak'] = max(tracemalloc.get_traced_memory()[1] - base, 0)
+
+    # sizes of the clip the current run works on
+    def count(self, frames=None, joints=None):
+        if self.current is None:
+            return
+        if frames is not None:
+            self.current['frames'] = frames
+        if joints is not None:
+            self.current['joints'] = joints
+
+#Shared by every operator
+PROFILER = Profiler()
@@ -0,0 +1,61 @@
+import numpy as np
+from .bvhconcat import anim_quats, quats_to_anim
+from .bvhmath import slerp
+
+#Resampling of clips in time: new frame rate, new frame count or any time-warp curve.
+#Locations are interpolated linearly and rotations by quaternion slerp, all joints and frames at once.
+
+# new clip with one frame at each source time (seconds from the first frame), frame_time of the result
+def resample_times(bvh, times, frame_time):
+    anim = bvh.get_anim()
+    joint_list = sorted(bvh.joints.values(), key=lambda joint: joint.index)
+    source_time = get_frame_time(bvh)
+
+    position = np.clip(np.asarray(times, dtype=np.float64) / source_time, 0.0, len(anim) - 1)
+    index = np.minimum(np.floor(position).astype(np.intp), len(anim) - 2) if len(anim) > 1 else np.zeros(len(position), dtype=np.intp)
+    nxt = np.minimum(index + 1, len(anim) - 1)
+    weight = position - index
+
+    a = anim[index]
+    b = anim[nxt]
+    result = np.empty(a.shape)
+    result[:, :, 0:3] = a[:, :, 0:3] + weight[:, None, None] * (b[:, :, 0:3] - a[:, :, 0:3])
+    quats = slerp(anim_quats(a, joint_list), anim_quats(b, joint_list), np.broadcast_to(weight[:, None], a.shape[:2]))
+    quats_to_anim(quats, result, joint_list)
+    #Conversions return angles in (-pi, pi], keep every channel continuous
+    result[:, :, 3:6] = np.unwrap(result[:, :, 3:6], axis=0)
+    return bvh.new_clip(result, frame_time)
+
+# frame time of bvh, a header value that is a whole frame rate rounded to about 6 decimals
+# (0.008333 for 120 fps) is taken as that rate, so times do not drift over long clips
+def get_frame_time(bvh):
+    if bvh.frame_time <= 0:
+        return 1.0
+    rate = 1.0 / bvh.frame_time
+    whole = round(rate)
+    #A frame time off by 5e-7 moves the rate by rate^2 * 5e-7
+    if whole > 0 and abs(rate - whole) <= rate * rate * 5.0e-7:
+        return 1.0 / whole
+    return bvh.frame_time
+
+def get_duration(bvh):
+    return max(bvh.frame_count - 1, 0) * get_frame_time(bvh)
+
+# same motion at another frame time, e.g. 1 / 30 for a 30 fps scene,
+# a last frame within 1e-3 of a frame of the end is kept
+def resample_rate(bvh, frame_time):
+    frame_count = int(np.floor(get_duration(bvh) / frame_time + 1.0e-3)) + 1
+    return resample_times(bvh, np.arange(frame_count) * frame_time, frame_time)
+
+# same motion stretched or squeezed to frame_count frames, the frame time is kept
+def resample_count(bvh, frame_count):
+    return time_warp(bvh, np.linspace(0.0, 1.0, frame_count))
+
+# frame i of the result plays the clip at normalized time warp[i] (0 first frame, 1 last frame),
+# warp can also be a function of the normalized output time, then frame_count frames are made
+def time_warp(bvh, warp, frame_count=None):
+    if callable(warp):
+        if frame_count is None:
+            frame_count = bvh.frame_count
+        warp = warp(np.linspace(0.0, 1.0, frame_count))
+    return resample_times(bvh, np.asarray(warp, dtype=np.float64) * get_duration(bvh), bvh.frame_time)
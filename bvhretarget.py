@@ -0,0 +1,175 @@
+import os
+import csv
+import json
+import time
+import numpy as np
+from .bvhparse import parse_bvh
+from .bvhwrite import write_bvh
+from .bvhmath import rotation_difference, quat_to_matrix, euler_to_matrix, matrix_to_euler, fit_bspline, eval_bspline, arc_length_table, arc_length_to_param
+
+#Parse -> fit -> retarget -> write on plain arrays, with no Blender dependency.
+#Bvh and the operators use the same functions, the batch script runs them in worker processes.
+
+# (joint_count, 6) motion column of every anim channel, -1 where the joint has none
+def get_channels(hierarchy):
+    return np.array([item['channels'] for item in hierarchy], dtype=np.intp).reshape(-1, 6)
+
+# (frames, channel_count) motion in degrees as (frames, joint_count, 6) anim in radians
+def motion_to_anim(channels, motion, dtype=np.float64):
+    used = channels != -1
+    anim = np.zeros((motion.shape[0], len(channels), 6), dtype=dtype)
+    anim[:, used] = motion[:, channels[used]]
+    np.radians(anim[:, :, 3:], out=anim[:, :, 3:])
+    return anim
+
+# inverse of motion_to_anim, channels of joints without them are dropped
+def anim_to_motion(channels, anim, channel_count):
+    used = channels != -1
+    anim = np.array(anim, dtype=np.float64)
+    np.degrees(anim[:, :, 3:], out=anim[:, :, 3:])
+    motion = np.zeros((anim.shape[0], channel_count))
+    motion[:, channels[used]] = anim[:, used]
+    return motion
+
+def to_arrays(source_points, destiny_points, frame_count):
+    source_points = np.array([tuple(p) for p in source_points], dtype=np.float64)[:frame_count]
+    destiny_points = np.array([tuple(p) for p in destiny_points], dtype=np.float64)[:frame_count]
+    return source_points, destiny_points
+
+# per frame rotation (quaternions) turning the source path direction into the destiny path direction,
+# frame 0 uses the direction of frame 1
+def get_heading(source_points, destiny_points):
+    def step(points):
+        if len(points) < 2:
+            return np.zeros((len(points), 3))
+        d = np.diff(points, axis=0)
+        return np.vstack((d[:1], d))
+    return rotation_difference(step(source_points), step(destiny_points))
+
+# normalized cumulative distance of (frames, 3) root locations, in [0, 1]
+# a root that does not move (total distance 0) is spread uniformly over its frames
+def get_timestamp(location):
+    location = np.asarray(location, dtype=np.float64)
+    if len(location) == 0:
+        return np.zeros(0)
+    d = np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(location, axis=0), axis=1))))
+    if d[-1] <= 0.0:
+        return np.linspace(0.0, 1.0, len(d))
+    return d / d[-1]
+
+# (n, 3) points of the spline through control at the normalized distances along it,
+# so equal distance steps give equal steps on the curve
+def sample_path(control, distances, samples=1024):
+    control = np.array([tuple(p) for p in control], dtype=np.float64)
+    t = arc_length_to_param(arc_length_table(control, samples), distances)
+    return eval_bspline(control, t)
+
+# copy of anim (frames, joint_count, 6) with the root moved from source_points onto destiny_points
+# and turned with the path, root is (index, rot_order, has_loc, has_rot)
+def retarget_anim(anim, root, source_points, destiny_points):
+    return next(iter_retarget_anim([(0, anim)], root, source_points, destiny_points, len(anim)))[1]
+
+# retarget_anim of (start, anim) chunks of a clip of frame_count frames, yields (start, retargeted copy),
+# only the (frame_count, 3) paths and the heading are held whole
+def iter_retarget_anim(chunks, root, source_points, destiny_points, frame_count):
+    index, rot_order, has_loc, has_rot = root
+    source_points, destiny_points = to_arrays(source_points, destiny_points, frame_count)
+    if has_rot:
+        heading = quat_to_matrix(get_heading(source_points, destiny_points))
+    last = None
+    for start, anim in chunks:
+        anim = np.array(anim, dtype=np.float64)
+        end = start + len(anim)
+        if has_rot:
+            rotation = heading[start:end] @ euler_to_matrix(anim[:, index, 3:6], rot_order)
+            euler = matrix_to_euler(rotation, rot_order)
+            #Continue from the last frame of the previous chunk
+            if last is None:
+                euler = np.unwrap(euler, axis=0)
+            else:
+                euler = np.unwrap(np.concatenate((last, euler)), axis=0)[1:]
+            anim[:, index, 3:6] = euler
+            last = euler[-1:]
+        if has_loc:
+            anim[:, index, 0:3] += destiny_points[start:end] - source_points[start:end]
+        yield start, anim
+
+# destination control points (n, 3) from a JSON file ([[x, y, z], ...] or {"points": [...]})
+# or a CSV file with one x, y, z row per point (a header row is skipped)
+def load_points(file_path):
+    if file_path.lower().endswith('.json'):
+        with open(file_path, 'r') as file:
+            data = json.load(file)
+        if isinstance(data, dict):
+            data = data['points']
+        points = np.array(data, dtype=np.float64)
+    else:
+        rows = []
+        with open(file_path, 'r', newline='') as file:
+            for row in csv.reader(file):
+                row = [value.strip() for value in row if value.strip()]
+                if not row:
+                    continue
+                try:
+                    rows.append([float(value) for value in row[:3]])
+                except ValueError:
+                    if rows:
+                        raise
+        points = np.array(rows, dtype=np.float64)
+    if points.ndim != 2 or points.shape[1] != 3:
+        raise Exception("%s: control points must be rows of x, y, z" % file_path)
+    if len(points) < 4:
+        raise Exception("%s: at least 4 control points are needed" % file_path)
+    return points
+
+# one retarget job {'input', 'points', 'output'}: the root path of the input clip is fitted with as many
+# control points as the destination has, sampled at the same normalized distances on the destination
+# and the clip is written with its root following it, like GenerateJointAndBone then ExportBvh
+# return {'input', 'output', 'frames', 'joints', 'wall', 'stages': {name: seconds}}
+def retarget_file(job, precision=6, chunk_size=1024):
+    stages = {}
+    begin = last = time.perf_counter()
+    def lap(name):
+        nonlocal last
+        now = time.perf_counter()
+        stages[name] = now - last
+        last = now
+
+    parsed = parse_bvh(job['input'])
+    hierarchy = parsed['hierarchy']
+    root_index = parsed['root'] if parsed['root'] != -1 else 0
+    channels = get_channels(hierarchy)
+    anim = motion_to_anim(channels, parsed['motion'])
+    nodes = job['points']
+    if isinstance(nodes, str):
+        nodes = load_points(nodes)
+    lap('parse')
+
+    location = anim[:, root_index, 0:3]
+    timestamp = get_timestamp(location)
+    control = fit_bspline(timestamp, location, max(4, len(nodes)))
+    source_points = eval_bspline(control, timestamp)
+    lap('fit')
+
+    destiny_points = sample_path(nodes, timestamp)
+    root = hierarchy[root_index]
+    used = channels[root_index] != -1
+    anim = retarget_anim(anim, (root_index, root['rot_order'], used[0:3].any(), used[3:6].any()), source_points, destiny_points)
+    motion = anim_to_motion(channels, anim, parsed['channel_count'])
+    lap('retarget')
+
+    output = job['output']
+    directory = os.path.dirname(os.path.abspath(output))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    write_bvh(output, hierarchy, motion, parsed['frame_time'], root_index, precision=precision, chunk_size=chunk_size)
+    lap('write')
+
+    return {
+        'input': job['input'],
+        'output': output,
+        'frames': len(motion),
+        'joints': len(hierarchy),
+        'wall': time.perf_counter() - begin,
+        'stages': stages,
+    }
@@ -1,6 +1,17 @@
 import bpy
+import os
+import sys
+import tempfile
+import numpy as np
 from mathutils import Vector, Euler, Matrix
 from math import radians, ceil , degrees
+from itertools import islice
+from .bvhparse import parse_bvh, parse_frames, read_motion
+from .bvhwrite import write_bvh as write_bvh_file
+from .bvhfk import forward_kinematics
+from .bvhprofile import PROFILER
+from .bvhretarget import motion_to_anim, anim_to_motion, to_arrays, get_heading, get_timestamp, retarget_anim, iter_retarget_anim
+from .bvhmath import quat_to_euler, quat_to_matrix, euler_to_matrix, matrix_to_euler, fit_bspline, eval_bspline, simplify_curve
 
 class Joint:
     __slots__ = (
@@ -27,9 +38,14 @@ class Joint:
         'rot_order',
         # Same as above but a string 'XYZ' format..
         'rot_order_str',
-        # A list one tuple's one for each frame: (locx, locy, locz, rotx, roty, rotz),
-        # euler rotation ALWAYS stored xyz order, even when native used.
-        'anim_data',
+        # Backing list of anim_data, None until it is first read.
+        '_anim_data',
+        # Bvh holding the joint, asked for the motion of a lazy clip.
+        'owner',
+        # (frame_count, 3) view into Bvh.anim: locx, locy, locz for each frame.
+        'anim_loc',
+        # (frame_count, 3) view into Bvh.anim: rotx, roty, rotz in radians for each frame.
+        'anim_rot',
         # Convenience function, bool, same as: (channels[0] != -1 or channels[1] != -1 or channels[2] != -1).
         'has_loc',
         # Convenience function, bool, same as: (channels[3] != -1 or channels[4] != -1 or channels[5] != -1).
@@ -71,7 +87,33 @@ class Joint:
         # List of 6 length tuples: (lx, ly, lz, rx, ry, rz)
         # even if the channels aren't used they will just be zero.
         #self.anim_data = [(0, 0, 0, 0, 0, 0)]
-        self.anim_data = []
+        self._anim_data = []
+        self.anim_loc = None
+        self.anim_rot = None
+        self.owner = None
+
+    # A list one tuple's one for each frame: (locx, locy, locz, rotx, roty, rotz),
+    # euler rotation ALWAYS stored xyz order, even when native used.
+    # Only for compatibility, built from anim_loc / anim_rot the first time it is read,
+    # for a streamed clip it is read from the file on every access and not kept.
+    @property
+    def anim_data(self):
+        if self._anim_data is None:
+            if self.anim_loc is None and self.owner is not None:
+                self.owner.ensure_motion()
+        if self._anim_data is None:
+            if self.anim_loc is None and self.owner is not None:
+                return [frame for start, anim in self.owner.iter_anim() for frame in map(tuple, anim[:, self.index].tolist())]
+            if self.anim_loc is None:
+                self._anim_data = []
+            else:
+                values = np.hstack((self.anim_loc, self.anim_rot))
+                self._anim_data = list(zip(*values.T.tolist()))
+        return self._anim_data
+
+    @anim_data.setter
+    def anim_data(self, value):
+        self._anim_data = value
 
     def __repr__(self):
         return (
@@ -82,184 +124,449 @@ class Joint:
             )
         )
 
-class Bvh():
+#Keyframe.interpolation value of 'LINEAR' for foreach_set
+KEYFRAME_LINEAR = 1
+
+def get_action(obj):
+    if obj.animation_data is None:
+        obj.animation_data_create()
+    if obj.animation_data.action is None:
+        obj.animation_data.action = bpy.data.actions.new(obj.name + 'Action')
+    return obj.animation_data.action
+
+# keep masks of simplify_curve for many (frames, n) curves on the same frames, None without a tolerance,
+# the columns of many curves are simplified together, group_size values at most per pass
+def decimate_curves(frames, curves, tolerance, group_size=1 << 18):
+    if tolerance is None:
+        return [None] * len(curves)
+    keeps = []
+    group = []
+    for curve in curves + [None]:
+        if group and (curve is None or len(curve) * sum(item.shape[1] for item in group + [curve]) > group_size):
+            keep = simplify_curve(frames, np.concatenate(group, axis=1), tolerance)
+            keeps += np.split(keep, np.cumsum([item.shape[1] for item in group])[:-1], axis=1)
+            group = []
+        if curve is not None:
+            group.append(curve)
+    return keeps
+
+# one F-curve per column of values (frames, n), all keys allocated and filled in one call
+# with a tolerance, constant columns get no F-curve (the value is set on target instead)
+# and the other columns keep only the keys needed to stay within tolerance, linearly interpolated,
+# keeps are the masks of decimate_curves when they were computed with other curves
+# return the number of keys left out
+def write_fcurves(action, data_path, values, frames, group=None, tolerance=None, target=None, keeps=None):
+    frames = np.asarray(frames)
+    removed = 0
+    constant = None
+    if tolerance is not None and len(values):
+        constant = (np.ptp(values, axis=0) <= tolerance) & (target is not None)
+        if keeps is None:
+            keeps = simplify_curve(frames, values, tolerance)
+    for index in range(values.shape[1]):
+        fcurve = action.fcurves.find(data_path, index=index)
+        if fcurve is not None:
+            action.fcurves.remove(fcurve)
+
+        column = values[:, index]
+        keep = None
+        if constant is not None:
+            if constant[index]:
+                target.path_resolve(data_path)[index] = float(column[0])
+                removed += len(column)
+                continue
+            keep = keeps[:, index]
+            removed += len(column) - int(np.count_nonzero(keep))
+
+        co = np.empty((len(frames) if keep is None else int(np.count_nonzero(keep)), 2), dtype=np.float32)
+        co[:, 0] = frames if keep is None else frames[keep]
+        co[:, 1] = column if keep is None else column[keep]
+        fcurve = action.fcurves.new(data_path, index=index, action_group=group or '')
+        fcurve.keyframe_points.add(len(co))
+        fcurve.keyframe_points.foreach_set('co', co.ravel())
+        if keep is not None:
+            #Dropped keys are only bounded for straight segments
+            fcurve.keyframe_points.foreach_set('interpolation', [KEYFRAME_LINEAR] * len(co))
+        fcurve.update()
+    return removed
+
+# results computed from the motion of one clip, keyed by what produced them (name and parameters),
+# Bvh empties it whenever its motion or hierarchy is replaced
+class DerivedData():
     def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    # cached value of key, compute() fills it on a miss
+    def get(self, key, compute):
+        if key in self.entries:
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        value = self.entries[key] = compute()
+        return value
+
+    def clear(self):
+        self.entries = {}
+
+    # bytes of the cached arrays
+    def get_size(self):
+        return sum(array.nbytes for value in self.entries.values() for array in (value if isinstance(value, tuple) else (value,)))
+
+    def get_stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries), 'bytes': self.get_size()}
+
+class Bvh():
+    # dtype of Bvh.anim, np.float32 halves the memory of a clip
+    def __init__(self, dtype=np.float64):
         #key : name, value : class Joint
         self.joints = {}
         self.rootJoint = None
         self.frame_time = 0
         self.frame_count = 0
+        self.channel_count = 0
+        #(frame_count, joint_count, 6) lx, ly, lz, rx, ry, rz per joint, rotations in radians,
+        #the only copy of the motion, the raw (frame_count, channel_count) block is rebuilt by iter_motion
+        self.anim = None
+        self.dtype = np.dtype(dtype)
+        #Source file and position of the first frame, used to stream the motion block
+        self.file_path = None
+        self.motion_offset = 0
         self.destiny_points = []
         self.destiny_points_nodes = []
+        #{joint name: keys left out by the decimation} of the last bake
+        self.removed_keys = {}
+        #Only the hierarchy is read, the motion block is parsed the first time it is used
+        self.lazy = False
+        self.keep_anim_data = True
+        #Timestamps and root path fits of the current motion
+        self.derived = DerivedData()
+        #The motion is the one of file_path, so it can be read again after evict()
+        self.from_file = False
+        #Copy of a motion with no source file, written by evict()
+        self.spill_path = None
+        #Cache file anim is memory-mapped from, see BvhCache.lookup
+        self.map_path = None
         
-    def read_bvh(self, file_path):
-        file = open(file_path, 'rU')
-        file_lines = file.readlines()
-        if len(file_lines) == 1:
-            file_lines = file_lines[0].split('\r')
-        
-        file_lines = [ll for ll in [l.split() for l in file_lines] if ll]
-        
-        if file_lines[0][0].lower() == 'hierarchy':
-            pass
-        else:
-            raise Exception("This is not a BVH file")
-        
-        self.joints = {None: None}
-        joint_serial = [None]
-        channelIndex = -1
-        isRoot = False
-
-        lineIdx = 0
-        while lineIdx < len(file_lines) - 1:
-            if file_lines[lineIdx][0].lower() in {'root', 'joint'}:
-                #get root joint
-                isRoot = False
-                if file_lines[lineIdx][0].lower() == 'root':
-                    isRoot = True
-
-                #Joint name
-                name = file_lines[lineIdx][1]
-                
-                #get offset
-                lineIdx += 2
-                rest_head_local = Vector((
-                    float(file_lines[lineIdx][1]),
-                    float(file_lines[lineIdx][2]),
-                    float(file_lines[lineIdx][3]),
-                ))
-
-                #get channel
-                lineIdx += 1
-                channels = [-1, -1, -1, -1, -1, -1]
-                rot_orders = [None, None, None]
-                rot_count = 0
-                for channel in file_lines[lineIdx][2:]:
-                    channel = channel.lower()
-                    channelIndex += 1
-                    if channel == 'xposition':
-                        channels[0] = channelIndex
-                    elif channel == 'yposition':
-                        channels[1] = channelIndex
-                    elif channel == 'zposition':
-                        channels[2] = channelIndex
-
-                    elif channel == 'xrotation':
-                        channels[3] = channelIndex
-                        rot_orders[rot_count] = 0
-                        rot_count += 1
-                    elif channel == 'yrotation':
-                        channels[4] = channelIndex
-                        rot_orders[rot_count] = 1
-                        rot_count += 1
-                    elif channel == 'zrotation':
-                        channels[5] = channelIndex
-                        rot_orders[rot_count] = 2
-                        rot_count += 1
-                
-                parent = joint_serial[-1]
-                #Add the parent offset
-                if parent is None:
-                    rest_head_world = Vector(rest_head_local)
-                else:
-                    rest_head_world = parent.rest_head_world + rest_head_local
-                
-                joint = self.joints[name] = Joint(
-                    name,
-                    rest_head_world,
-                    rest_head_local,
-                    parent,
-                    channels,
-                    rot_orders,
-                    len(self.joints) - 1,
-                )
-                if isRoot:
-                    self.rootJoint = joint
-                joint_serial.append(joint)
-
-            if file_lines[lineIdx][0].lower() == 'end' and file_lines[lineIdx][1].lower() == 'site':
-                #get offset
-                lineIdx += 2
-                rest_tail = Vector((
-                    float(file_lines[lineIdx][1]),
-                    float(file_lines[lineIdx][2]),
-                    float(file_lines[lineIdx][3]),
-                ))
-                
-                joint_serial[-1].rest_tail_world = joint_serial[-1].rest_head_world + rest_tail
-                joint_serial[-1].rest_tail_local = joint_serial[-1].rest_head_local + rest_tail
-                joint_serial.append(None)
-            
-            #remove serial joint
-            if len(file_lines[lineIdx]) == 1 and file_lines[lineIdx][0] == '}':
-                joint_serial.pop()
-
-            #End of Hierarchy
-            if len(file_lines[lineIdx]) == 1 and file_lines[lineIdx][0].lower() == 'motion':
-                lineIdx += 1  # Read frame
-                if (len(file_lines[lineIdx]) == 2 and file_lines[lineIdx][0].lower() == 'frames:'):
-                    self.frame_count = int(file_lines[lineIdx][1])
-
-                lineIdx += 1  # Read frame rate.
-                if (len(file_lines[lineIdx]) == 3 and file_lines[lineIdx][0].lower() == 'frame' and file_lines[lineIdx][1].lower() == 'time:'):
-                    self.frame_time = float(file_lines[lineIdx][2])
-                lineIdx += 1  # get the first frame
-                break
-            lineIdx += 1
-        
-        del self.joints[None]
-        del joint_serial
-
+    # load_motion=False streams the motion block from the file every time it is used,
+    # lazy=True reads it once, the first time anim_data, the root path or a bake needs it
+    def read_bvh(self, file_path, keep_anim_data=True, load_motion=True, lazy=False):
+        #Reading and tokenizing happen in one pass of parse_bvh
+        with PROFILER.stage('parse'):
+            parsed = parse_bvh(file_path, load_motion and not lazy)
+        with PROFILER.stage('anim', parsed['frame_count'], len(parsed['hierarchy'])):
+            self.set_parsed(parsed, keep_anim_data)
+        self.file_path = file_path
+        if lazy:
+            self.lazy = True
+        if lazy or not load_motion:
+            self.keep_anim_data = keep_anim_data
+            for joint in self.joints.values():
+                joint.anim_data = None if keep_anim_data else []
+
+    # load the motion of a lazy or evicted clip, nothing to do for the others
+    def ensure_motion(self):
+        if not self.lazy:
+            return
+        from_file, spill_path, map_path = self.from_file, self.spill_path, self.map_path
+        with PROFILER.stage('lazy_motion', self.frame_count, len(self.joints)):
+            anim = None
+            if spill_path is not None:
+                anim = np.load(spill_path)
+            elif map_path is not None:
+                try:
+                    anim = np.load(map_path, mmap_mode='r')
+                except (OSError, ValueError):
+                    #Removed from the cache in the meantime
+                    map_path = None
+            if anim is None:
+                #A bad file raises here and the clip stays lazy
+                with open(self.file_path, 'r') as file:
+                    file.seek(self.motion_offset)
+                    anim = self.motion_to_anim(read_motion(file, self.channel_count, self.frame_count, self.file_path))
+                from_file = True
+            #set_anim would delete the spill file
+            self.spill_path = None
+            self.set_anim(anim, self.keep_anim_data)
+        self.from_file, self.spill_path, self.map_path = from_file, spill_path, map_path
+
+    # free the motion arrays, the clip stays usable and loads them again on its next use like a lazy clip,
+    # a motion that is not the one of the source file is saved in spill_directory first,
+    # a memory-mapped anim is only unmapped
+    # return the bytes freed
+    def evict(self, spill_directory=None):
+        if self.lazy or self.anim is None:
+            return 0
+        freed = self.get_memory_footprint()['total']
+        if not self.from_file and self.spill_path is None:
+            handle, path = tempfile.mkstemp('.npy', 'bvh_', spill_directory)
+            with os.fdopen(handle, 'wb') as file:
+                np.save(file, self.anim)
+            self.spill_path = path
+        self.anim = None
+        for joint in self.joints.values():
+            joint.anim_loc = None
+            joint.anim_rot = None
+            joint.anim_data = None
+        self.derived.clear()
+        self.lazy = True
+        return freed
+
+    # delete the spill file of evict()
+    def release_spill(self):
+        if self.spill_path is not None and os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+        self.spill_path = None
+
+    # bytes of anim once loaded, also for a lazy or evicted clip
+    def get_motion_size(self):
+        return self.frame_count * len(self.joints) * 6 * self.dtype.itemsize
+
+    # fill the clip from the output of bvhparse.parse_bvh
+    def set_parsed(self, parsed, keep_anim_data=True):
+        self.set_hierarchy(parsed['hierarchy'], parsed.get('root', -1))
+        self.frame_count = parsed['frame_count']
+        self.frame_time = parsed['frame_time']
+        self.channel_count = parsed['channel_count']
+        self.motion_offset = parsed['motion_offset']
+        if parsed['motion'] is not None:
+            self.set_motion(parsed['motion'], keep_anim_data)
+            self.from_file = True
+
+    # plain description of the joint tree, enough to rebuild it with set_hierarchy
+    def get_hierarchy(self):
         joint_list = list(self.joints.values())
         joint_list.sort(key=lambda joint: joint.index)
-        
-        while lineIdx < len(file_lines):
-            line = file_lines[lineIdx]
-            for joint in joint_list:
-                lx = ly = lz = rx = ry = rz = 0.0
-                channels = joint.channels
-                anim_data = joint.anim_data
-                if channels[0] != -1:
-                    lx = float(line[channels[0]])
-                if channels[1] != -1:
-                    ly = float(line[channels[1]])
-                if channels[2] != -1:
-                    lz = float(line[channels[2]])
-                
-                if channels[3] != -1 or channels[4] != -1 or channels[5] != -1:
-                    rx = radians(float(line[channels[3]]))
-                    ry = radians(float(line[channels[4]]))
-                    rz = radians(float(line[channels[5]]))
-                anim_data.append((lx, ly, lz, rx, ry, rz))
-            lineIdx += 1
-
-        #Assign children
+
+        hierarchy = []
         for joint in joint_list:
-            parent = joint.parent
+            hierarchy.append({
+                'name': joint.name,
+                'parent': joint.parent.index if joint.parent else -1,
+                'offset': list(joint.rest_head_local),
+                'tail_local': list(joint.rest_tail_local),
+                'tail_world': list(joint.rest_tail_world),
+                'channels': list(joint.channels),
+                'rot_order': list(joint.rot_order),
+            })
+        return hierarchy
+
+    def set_hierarchy(self, hierarchy, root=-1):
+        self.derived.clear()
+        self.joints = {}
+        self.rootJoint = None
+        joint_list = []
+        for index, item in enumerate(hierarchy):
+            parent = joint_list[item['parent']] if item['parent'] != -1 else None
+            rest_head_local = Vector(item['offset'])
+            #Add the parent offset
+            if parent is None:
+                rest_head_world = Vector(rest_head_local)
+            else:
+                rest_head_world = parent.rest_head_world + rest_head_local
+
+            joint = self.joints[item['name']] = Joint(
+                item['name'],
+                rest_head_world,
+                rest_head_local,
+                parent,
+                list(item['channels']),
+                item['rot_order'],
+                index,
+            )
+            joint.rest_tail_local = Vector(item['tail_local'])
+            joint.rest_tail_world = Vector(item['tail_world'])
+            joint.owner = self
             if parent:
-                joint.parent.children.append(joint)
-        
-        #Set tail for each joint
+                parent.children.append(joint)
+            elif self.rootJoint is None:
+                self.rootJoint = joint
+            joint_list.append(joint)
+
+        if root != -1:
+            self.rootJoint = joint_list[root]
+
+    # (joint_count, 6) motion column of every anim channel, see bvhretarget.get_channels
+    def get_channels(self):
+        joint_list = list(self.joints.values())
+        joint_list.sort(key=lambda joint: joint.index)
+        return np.array([joint.channels for joint in joint_list], dtype=np.intp).reshape(-1, 6)
+
+    def motion_to_anim(self, motion):
+        return motion_to_anim(self.get_channels(), motion, self.dtype)
+
+    # inverse of motion_to_anim, channels of joints without them are dropped
+    def anim_to_motion(self, anim):
+        return anim_to_motion(self.get_channels(), anim, self.channel_count)
+
+    # motion is a (frames, channel_count) block in file units, only its anim conversion is kept
+    def set_motion(self, motion, keep_anim_data=True):
+        self.set_anim(self.motion_to_anim(motion), keep_anim_data)
+
+    # anim (frames, joint_count, 6) in self.dtype becomes the motion of the clip
+    def set_anim(self, anim, keep_anim_data=True):
+        joint_list = list(self.joints.values())
+        joint_list.sort(key=lambda joint: joint.index)
+
+        self.lazy = False
+        self.keep_anim_data = keep_anim_data
+        self.from_file = False
+        self.release_spill()
+        self.map_path = None
+        self.derived.clear()
+        self.frame_count = anim.shape[0]
+        self.anim = anim
+
         for joint in joint_list:
-            if not joint.rest_tail_world:
-                if len(joint.children) == 0:
-                    joint.rest_tail_world = Vector(joint.rest_head_world)
-                    joint.rest_tail_local = Vector(joint.rest_head_local)
-                elif len(joint.children) == 1:
-                    joint.rest_tail_world = Vector(joint.children[0].rest_head_world)
-                    joint.rest_tail_local = joint.rest_head_local + joint.children[0].rest_head_local
-                else:
-                    rest_tail_world = Vector((0.0, 0.0, 0.0))
-                    rest_tail_local = Vector((0.0, 0.0, 0.0))
-                    for child in joint.children:
-                        rest_tail_world += child.rest_head_world
-                        rest_tail_local += child.rest_head_local
-
-                    joint.rest_tail_world = rest_tail_world * (1.0 / len(joint.children))
-                    joint.rest_tail_local = rest_tail_local * (1.0 / len(joint.children))
-
-
-    def add_joint(self, context, frame_start, source_points):
+            joint.anim_loc = anim[:, joint.index, 0:3]
+            joint.anim_rot = anim[:, joint.index, 3:6]
+            #Tuples are only built if anim_data is read
+            joint.anim_data = None if keep_anim_data else []
+
+    # new clip on the same skeleton playing anim (frames, joint_count, 6)
+    def new_clip(self, anim, frame_time=None):
+        bvh = Bvh(self.dtype)
+        bvh.set_hierarchy(self.get_hierarchy(), self.rootJoint.index)
+        bvh.frame_time = self.frame_time if frame_time is None else frame_time
+        bvh.channel_count = self.channel_count
+        anim = np.array(anim, dtype=bvh.dtype)
+        #Channels the joints do not have stay zero like in motion_to_anim
+        anim[:, bvh.get_channels() == -1] = 0.0
+        bvh.set_anim(anim)
+        return bvh
+
+    # anim with the root moved from source_points onto self.destiny_points and turned with the path,
+    # the motion baked by add_armature as plain Bvh.anim data
+    def get_retargeted_anim(self, source_points, chunk_size=1024):
+        root = self.rootJoint
+        anim = self.get_anim(chunk_size=chunk_size)
+        return retarget_anim(anim, (root.index, root.rot_order, root.has_loc, root.has_rot), source_points, self.destiny_points)
+
+    # save the clip as a BVH file (path or text file handle),
+    # with source_points the path retargeted motion of get_retargeted_anim is written instead
+    def write_bvh(self, file, source_points=None, precision=6, chunk_size=1024):
+        if source_points is not None:
+            #Retargeted chunk by chunk like the plain motion, never the whole clip at once
+            root = self.rootJoint
+            chunks = iter_retarget_anim(self.iter_anim(chunk_size), (root.index, root.rot_order, root.has_loc, root.has_rot),
+                                        source_points, self.destiny_points, self.frame_count)
+            motion = (self.anim_to_motion(anim) for start, anim in chunks)
+        else:
+            motion = (motion for start, motion in self.iter_motion(chunk_size))
+        frame_count = self.frame_count
+        write_bvh_file(file, self.get_hierarchy(), motion, self.frame_time, self.rootJoint.index, frame_count, precision, chunk_size)
+
+    # bytes held by the clip: {'anim', 'mapped', 'anim_data', 'derived', 'total'},
+    # a memory-mapped anim counts as 'mapped' and not in the total, the OS pages it in and out
+    def get_memory_footprint(self):
+        anim = mapped = 0
+        if self.anim is not None and self.map_path is not None:
+            mapped = self.anim.nbytes
+        elif self.anim is not None:
+            anim = self.anim.nbytes
+        #List slot, tuple of 6 and 6 floats for every built frame
+        frame_bytes = 8 + sys.getsizeof((0.0,) * 6) + 6 * sys.getsizeof(0.0)
+        anim_data = sum(len(joint._anim_data) for joint in self.joints.values() if joint._anim_data) * frame_bytes
+        derived = self.derived.get_size()
+        return {'anim': anim, 'mapped': mapped, 'anim_data': anim_data, 'derived': derived, 'total': anim + anim_data + derived}
+
+    # yield (start_frame, motion) chunks of at most chunk_size frames in file units (degrees),
+    # rebuilt from anim, or straight from the file when the motion is streamed
+    def iter_motion(self, chunk_size=1024):
+        self.ensure_motion()
+        if self.anim is not None:
+            for start in range(0, self.frame_count, chunk_size):
+                yield start, self.anim_to_motion(self.anim[start:start + chunk_size])
+            return
+
+        with open(self.file_path, 'r') as file:
+            file.seek(self.motion_offset)
+            start = 0
+            while self.channel_count:
+                lines = list(islice(file, chunk_size))
+                if not lines:
+                    break
+                motion = parse_frames(''.join(lines), self.channel_count, self.file_path)
+                if len(motion):
+                    yield start, motion
+                start += len(motion)
+            if start != self.frame_count:
+                raise Exception("%s: expected %d frames, got %d" % (self.file_path, self.frame_count, start))
+
+    # same as iter_motion but chunks are (frames, joint_count, 6) like Bvh.anim
+    def iter_anim(self, chunk_size=1024):
+        self.ensure_motion()
+        if self.anim is not None:
+            for start in range(0, self.frame_count, chunk_size):
+                yield start, self.anim[start:start + chunk_size]
+            return
+
+        for start, motion in self.iter_motion(chunk_size):
+            yield start, self.motion_to_anim(motion)
+
+    # every keyed channel of every joint as arrays, the same values the per-frame bake inserts
+    # return {joint name: {data path: (frames, 3) array}}
+    def get_joint_channels(self, source_points, destiny_points, chunk_size=1024):
+        frame_count = self.frame_count
+        source_points, destiny_points = to_arrays(source_points, destiny_points, frame_count)
+
+        channels = {}
+        for name, joint in self.joints.items():
+            data = channels[name] = {}
+            if joint.has_loc:
+                data['delta_location'] = np.empty((frame_count, 3))
+            if joint.has_rot:
+                if joint is self.rootJoint:
+                    data['rotation_euler'] = quat_to_euler(get_heading(source_points, destiny_points))
+                data['delta_rotation_euler'] = np.empty((frame_count, 3), dtype=self.dtype)
+
+        # frames [start, start + len(anim)) of every channel from a chunk of anim
+        def fill(start, anim):
+            end = start + len(anim)
+            for name, joint in self.joints.items():
+                data = channels[name]
+                values = anim[:, joint.index]
+                if joint.has_loc:
+                    data['delta_location'][start:end] = values[:, 0:3] - source_points[start:end] - tuple(joint.rest_head_world) + destiny_points[start:end]
+                if joint.has_rot:
+                    data['delta_rotation_euler'][start:end] = values[:, 3:6]
+
+        #Only one chunk of the motion is in memory at a time
+        second = None
+        for start, anim in self.iter_anim(chunk_size):
+            fill(start, anim)
+            if start <= 1 < start + len(anim):
+                second = np.array(anim[1 - start:2 - start])
+        #Frame 0 is keyed with the data of frame 1
+        if second is not None:
+            fill(0, second)
+        return channels
+
+    # (frames, joint_count, 6) like Bvh.anim for frames [start, end), read from the file when not loaded
+    def get_anim(self, start=0, end=None, chunk_size=1024):
+        self.ensure_motion()
+        if self.anim is not None:
+            return self.anim[start:end]
+        end = self.frame_count if end is None else min(end, self.frame_count)
+        parts = []
+        for chunk_start, anim in self.iter_anim(chunk_size):
+            if chunk_start >= end:
+                break
+            if chunk_start + len(anim) > start:
+                parts.append(anim[max(0, start - chunk_start):max(0, end - chunk_start)])
+        if not parts:
+            return np.zeros((0, len(self.joints), 6), dtype=self.dtype)
+        return np.concatenate(parts)
+
+    # world space joint positions (frames, joints, 3) and quaternions (frames, joints, 4),
+    # see bvhfk.forward_kinematics
+    def get_world_transforms(self, start=0, end=None, joints=None):
+        return forward_kinematics(self, start, end, joints)
+
+    # with a tolerance (bulk bake only) keys are decimated by write_fcurves,
+    # the keys left out per joint are kept in self.removed_keys
+    def add_joint(self, context, frame_start, source_points, chunk_size=1024, bulk=True, tolerance=None):
         if frame_start < 1:
             frame_start = 1
         
@@ -278,86 +585,101 @@ class Bvh():
             obj.empty_display_size = 0.5
             return obj
         
-        #Add objects
-        for name, joint in self.joints.items():
-            joint.temp = add_ob(name)
-            joint.temp.rotation_mode = joint.rot_order_str[::-1]
+        with PROFILER.stage('objects', joints=len(self.joints)):
+            #Add objects
+            for name, joint in self.joints.items():
+                joint.temp = add_ob(name)
+                joint.temp.rotation_mode = joint.rot_order_str[::-1]
         
-        #Set Parent
-        for joint in self.joints.values():
-            for child in joint.children:
-                child.temp.parent = joint.temp
+            #Set Parent
+            for joint in self.joints.values():
+                for child in joint.children:
+                    child.temp.parent = joint.temp
         
-        #Set location
-        for joint in self.joints.values():
-            joint.temp.location = joint.rest_head_local
-
-        #Add tail objects
-        for name, joint in self.joints.items():
-            if not joint.children:
-                ob_end = add_ob(name + '_end')
-                ob_end.parent = joint.temp
-                ob_end.location = joint.rest_tail_world - joint.rest_head_world
+            #Set location
+            for joint in self.joints.values():
+                joint.temp.location = joint.rest_head_local
+
+            #Add tail objects
+            for name, joint in self.joints.items():
+                if not joint.children:
+                    ob_end = add_ob(name + '_end')
+                    ob_end.parent = joint.temp
+                    ob_end.location = joint.rest_tail_world - joint.rest_head_world
         
         destiny_points = self.destiny_points
-        root_index = 0
-        for name, joint in self.joints.items():
-            obj = joint.temp
-
-            lx=ly=lz=rx=ry=rz=0
-            lx1=ly1=lz1=rx1=ry1=rz1=0
-
-            for fc in range(len(joint.anim_data)):
-                if fc != 0:
-                    lx, ly, lz, rx, ry, rz = joint.anim_data[fc]
-                    lx1,ly1,lz1,rx1,ry1,rz1 = joint.anim_data[fc-1]
-                else:
-                    lx, ly, lz, rx, ry, rz = joint.anim_data[1]
-                    lx1,ly1,lz1,rx1,ry1,rz1 = joint.anim_data[0]
-                
-                if joint.has_loc:
-                    p0ti = Vector((lx, ly, lz)) - source_points[fc]
-                    obj.delta_location = p0ti - joint.rest_head_world
-                
-                if joint.has_rot:
-                    rotation = Vector((rx,ry,rz))
-                    if root_index == 0:
-                        #rotation = Vector((lx,ly,lz)) - Vector((lx1,ly1,lz1))
-                        # r0ti = None
-                        # if fc == 0:
-                        #     source_rotation = source_points[1] - source_points[0]
-                        #     r0ti = source_rotation.rotation_difference(rotation).to_euler()
-                        # else:
-                        #     source_rotation = source_points[fc] - source_points[fc-1]
-                        #     r0ti = source_rotation.rotation_difference(rotation).to_euler()
-
-                        # rotation.rotate(r0ti)
-
-                        rt = None
-                        if fc == 0:
-                            destiny_rotation = destiny_points[1] - destiny_points[0]
-                            source_rotation = source_points[1] - source_points[0]
-                            rt = source_rotation.rotation_difference(destiny_rotation).to_euler()
-                        else:
-                            destiny_rotation = destiny_points[fc] - destiny_points[fc-1]
-                            source_rotation = source_points[fc] - source_points[fc-1]
-                            rt = source_rotation.rotation_difference(destiny_rotation).to_euler()
-                            
-                        rotation.rotate(rt)
-                        obj.rotation_euler = rt
-                        obj.keyframe_insert("rotation_euler", index=-1, frame=frame_start + fc)
-
-                    rotation = Vector((rx,ry,rz))
-                    obj.delta_rotation_euler = rotation
-                    obj.keyframe_insert("delta_rotation_euler", index=-1, frame=frame_start + fc)
-
-                if joint.has_loc:
-                    pt = destiny_points[fc]
-                    obj.delta_location +=  pt
-                    obj.keyframe_insert("delta_location", index=-1, frame=frame_start + fc)
-            root_index += 1
-
-    def add_armature(self, context, frame_start):
+        if bulk:
+            with PROFILER.stage('keyframes', self.frame_count, len(self.joints)):
+                channels = self.get_joint_channels(source_points, destiny_points, chunk_size)
+                curves = [values for name in self.joints for values in channels[name].values()]
+                keeps = iter(decimate_curves(frame_start + np.arange(self.frame_count), curves, tolerance))
+                removed = self.removed_keys = {}
+                for name, joint in self.joints.items():
+                    action = get_action(joint.temp)
+                    removed[name] = 0
+                    for data_path, values in channels[name].items():
+                        removed[name] += write_fcurves(action, data_path, values, frame_start + np.arange(len(values)),
+                            'Object Transforms', tolerance, joint.temp, next(keeps))
+            return
+
+        #Per-frame keyframe_insert bake, kept for comparison
+        for start, anim in self.iter_anim(chunk_size):
+            root_index = 0
+            for name, joint in self.joints.items():
+                obj = joint.temp
+
+                frames = anim[:, joint.index].tolist()
+                #Frame 0 is keyed with the data of frame 1
+                if start == 0 and len(frames) > 1:
+                    frames[0] = frames[1]
+
+                for fc, (lx, ly, lz, rx, ry, rz) in enumerate(frames, start):
+                    if joint.has_loc:
+                        p0ti = Vector((lx, ly, lz)) - source_points[fc]
+                        obj.delta_location = p0ti - joint.rest_head_world
+                    
+                    if joint.has_rot:
+                        rotation = Vector((rx,ry,rz))
+                        if root_index == 0:
+                            #rotation = Vector((lx,ly,lz)) - Vector((lx1,ly1,lz1))
+                            # r0ti = None
+                            # if fc == 0:
+                            #     source_rotation = source_points[1] - source_points[0]
+                            #     r0ti = source_rotation.rotation_difference(rotation).to_euler()
+                            # else:
+                            #     source_rotation = source_points[fc] - source_points[fc-1]
+                            #     r0ti = source_rotation.rotation_difference(rotation).to_euler()
+
+                            # rotation.rotate(r0ti)
+
+                            rt = None
+                            if fc == 0:
+                                destiny_rotation = destiny_points[1] - destiny_points[0]
+                                source_rotation = source_points[1] - source_points[0]
+                                rt = source_rotation.rotation_difference(destiny_rotation).to_euler()
+                            else:
+                                destiny_rotation = destiny_points[fc] - destiny_points[fc-1]
+                                source_rotation = source_points[fc] - source_points[fc-1]
+                                rt = source_rotation.rotation_difference(destiny_rotation).to_euler()
+                                
+                            rotation.rotate(rt)
+                            obj.rotation_euler = rt
+                            obj.keyframe_insert("rotation_euler", index=-1, frame=frame_start + fc)
+
+                        rotation = Vector((rx,ry,rz))
+                        obj.delta_rotation_euler = rotation
+                        obj.keyframe_insert("delta_rotation_euler", index=-1, frame=frame_start + fc)
+
+                    if joint.has_loc:
+                        pt = destiny_points[fc]
+                        obj.delta_location +=  pt
+                        obj.keyframe_insert("delta_location", index=-1, frame=frame_start + fc)
+                root_index += 1
+
+    # one armature for the whole skeleton, every pose bone channel keyed in one Action
+    # with source_points the root follows self.destiny_points like add_joint does
+    # with a tolerance keys are decimated like add_joint, the keys left out per joint are kept in self.removed_keys
+    def add_armature(self, context, frame_start, source_points=None, name='Armature', tolerance=None, chunk_size=1024):
         if frame_start < 1:
             frame_start = 1
 
@@ -365,8 +687,8 @@ class Bvh():
         for obj in scene.objects:
             obj.select_set(False)
 
-        arm_data = bpy.data.armatures.new('test')
-        arm_ob = bpy.data.objects.new('test', arm_data)
+        arm_data = bpy.data.armatures.new(name)
+        arm_ob = bpy.data.objects.new(name, arm_data)
         context.collection.objects.link(arm_ob)
         
         arm_ob.select_set(True)
@@ -378,17 +700,93 @@ class Bvh():
         joint_list = list(self.joints.values())
         joint_list.sort(key=lambda joint: joint.index)
 
-    def getTimeStamp(self):
-        total_d = 0
-        accumulate_d = [0] * len(self.rootJoint.anim_data)
+        with PROFILER.stage('objects', joints=len(joint_list)):
+            #Zero length bones get removed by Blender, they get the average length instead
+            lengths = [(joint.rest_tail_world - joint.rest_head_world).length for joint in joint_list]
+            lengths = [length for length in lengths if length >= 0.001]
+            average_length = sum(lengths) / len(lengths) if lengths else 1.0
+
+            #Add every edit bone in one pass, parents come first in index order
+            bone_names = {}
+            rest_matrices = {}
+            for joint in joint_list:
+                bone = joint.temp = arm_data.edit_bones.new(joint.name)
+                bone.head = joint.rest_head_world
+                bone.tail = joint.rest_tail_world
+                if (bone.head - bone.tail).length < 0.001:
+                    bone.tail = bone.head + Vector((0.0, average_length, 0.0))
+                if joint.parent:
+                    bone.parent = joint.parent.temp
+                bone_names[joint.name] = bone.name
+            for joint in joint_list:
+                rest_matrices[joint.name] = np.array([list(row) for row in joint.temp.matrix.to_3x3()])
+
+            bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
 
-        for index in range(1, len(self.rootJoint.anim_data)):
-            last = Vector((self.rootJoint.anim_data[index - 1][0:3]))
-            current = Vector((self.rootJoint.anim_data[index][0:3]))
-            accumulate_d[index] = accumulate_d[index - 1] + (current - last).length
-            total_d += (current - last).length
-        timestamp = [(d / total_d) for d in accumulate_d]
-        return timestamp
+        frame_count = self.frame_count
+        frames = frame_start + np.arange(frame_count)
+        if source_points is not None:
+            source_points, destiny_points = to_arrays(source_points, self.destiny_points, frame_count)
+            heading = quat_to_matrix(get_heading(source_points, destiny_points))
+
+        with PROFILER.stage('keyframes', frame_count, len(joint_list)):
+            action = get_action(arm_ob)
+            removed = self.removed_keys = {}
+            #(joint, data path, group, values) of every F-curve, written once all are filled and decimated together
+            curves = []
+            for joint in joint_list:
+                bone_name = bone_names[joint.name]
+                pose_bone = arm_ob.pose.bones[bone_name]
+                pose_bone.rotation_mode = joint.rot_order_str[::-1]
+                data_path = 'pose.bones["%s"].' % bone_name
+                removed[joint.name] = 0
+                if joint.has_rot:
+                    curves.append((joint, data_path + 'rotation_euler', bone_name, np.empty((frame_count, 3))))
+                if joint.has_loc:
+                    curves.append((joint, data_path + 'location', bone_name, np.empty((frame_count, 3))))
+
+            #Only one chunk of the motion is in memory at a time
+            for start, anim in self.iter_anim(chunk_size):
+                end = start + len(anim)
+                for joint, data_path, group, values in curves:
+                    #Bvh rotations are about world aligned axes, move them into the bone rest frame
+                    rest = rest_matrices[joint.name]
+                    rest_inv = rest.T
+                    retarget = source_points is not None and joint is self.rootJoint
+                    if data_path.endswith('rotation_euler'):
+                        rotation = euler_to_matrix(anim[:, joint.index, 3:6], joint.rot_order)
+                        if retarget:
+                            rotation = heading[start:end] @ rotation
+                        values[start:end] = matrix_to_euler(rest_inv @ rotation @ rest, joint.rot_order)
+                    else:
+                        location = anim[:, joint.index, 0:3]
+                        if retarget:
+                            location = location - source_points[start:end] + destiny_points[start:end]
+                        values[start:end] = (location - tuple(joint.rest_head_local)) @ rest_inv.T
+            for joint, data_path, group, values in curves:
+                if data_path.endswith('rotation_euler'):
+                    values[:] = np.unwrap(values, axis=0)
+
+            keeps = decimate_curves(frames, [values for joint, data_path, group, values in curves], tolerance)
+            for (joint, data_path, group, values), keep in zip(curves, keeps):
+                removed[joint.name] += write_fcurves(action, data_path, values, frames, group, tolerance, arm_ob, keep)
+
+        return arm_ob
+
+    # normalized cumulative root distance of every frame, in [0, 1]
+    # a clip whose root does not move (total distance 0) is spread uniformly over its frames
+    def getTimeStamp(self, chunk_size=1024):
+        return self.get_timestamp_array(chunk_size).tolist()
+
+    # getTimeStamp as a read-only array, computed once per motion
+    def get_timestamp_array(self, chunk_size=1024):
+        def compute():
+            with PROFILER.stage('timestamp', self.frame_count):
+                location = [anim[:, self.rootJoint.index, 0:3] for start, anim in self.iter_anim(chunk_size)]
+                timestamp = get_timestamp(np.concatenate(location)) if location else np.zeros(0)
+            timestamp.flags.writeable = False
+            return timestamp
+        return self.derived.get(('timestamp',), compute)
 
     def getCubicConstant(self, t, mode):
         result = 0
@@ -403,48 +801,35 @@ class Bvh():
 
         return result
 
-    # return  4 control points (Matrix 4 * 3) and sample point (List of Vector)
-    def getRootJointPath(self):
-
-        timestamp = self.getTimeStamp()
-
-        A = Matrix([[0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0]])
-        for row in range(4):
-            for col in range(4):
-                for fc in range(self.frame_count):
-                    t = timestamp[fc]
-                    A[row][col] += float(self.getCubicConstant(t, row) * self.getCubicConstant(t, col))
-
-        B = Matrix([[0, 0, 0], [0, 0, 0], [0, 0, 0], [0, 0, 0]])
-        for row in range(4):
-            for fc in range(self.frame_count):
-                lx, ly, lz, rx, ry, rz = self.rootJoint.anim_data[fc]
-                t = timestamp[fc]
-                B[row] += self.getCubicConstant(t, row) * Vector((lx, ly, lz))
-
-        A_invert = A.inverted()
-        # P = A^-1 * B
-        P = A_invert @ B
-
-        '''
-        print(A)
-        print(A_invert)
-        print(B)
-        print(P)
-        '''
-
-        points = []
-        for t in timestamp:
-            point = Vector((0, 0, 0))
-            for index in range(4):
-                point += self.getCubicConstant(t, index) * P[index]
-            points.append(point)
-
-        #print(points)
-
-        originalPoints = []
-        for fc in range(self.frame_count):
-            location = Vector((self.rootJoint.anim_data[fc][0:3]))
-            originalPoints.append(location)
-
-        return P, points , originalPoints
\ No newline at end of file
+    # return control points and sample point (List of Vector)
+    # 4 control points come back as Matrix 4 * 3, more as a List of Vector
+    # with a tolerance the control count grows until every sample is within tolerance of the root
+    def getRootJointPath(self, chunk_size=1024, control_count=4, tolerance=None):
+        P, points, location = self.derived.get(('root_path', max(4, control_count), tolerance), lambda: self.fit_root_path(chunk_size, control_count, tolerance))
+        if len(P) == 4:
+            P = Matrix(P.tolist())
+        else:
+            P = [Vector(p) for p in P.tolist()]
+        return P, [Vector(p) for p in points.tolist()], [Vector(p) for p in location.tolist()]
+
+    # read-only arrays (control points, fitted samples, root locations) of getRootJointPath
+    def fit_root_path(self, chunk_size=1024, control_count=4, tolerance=None):
+        timestamp = self.get_timestamp_array(chunk_size)
+        location = np.concatenate([anim[:, self.rootJoint.index, 0:3] for start, anim in self.iter_anim(chunk_size)]).astype(np.float64)
+
+        #Least squares fit of the control points over every frame at once
+        control_count = max(4, control_count)
+        max_count = max(control_count, len(location) // 4)
+        with PROFILER.stage('spline_fit', len(location)):
+            while True:
+                P = fit_bspline(timestamp, location, control_count)
+                points = eval_bspline(P, timestamp)
+                if tolerance is None or control_count >= max_count:
+                    break
+                if np.linalg.norm(points - location, axis=1).max() <= tolerance:
+                    break
+                control_count = min(max_count, control_count + max(1, control_count // 2))
+
+        for array in (P, points, location):
+            array.flags.writeable = False
+        return P, points, location
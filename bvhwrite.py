@@ -0,0 +1,68 @@
+import numpy as np
+
+#BVH text writing with no Blender dependency, the counterpart of bvhparse.
+#The joint tree is the plain format of Bvh.get_hierarchy / bvhparse.parse_bvh.
+
+CHANNEL_NAMES = ('Xposition', 'Yposition', 'Zposition', 'Xrotation', 'Yrotation', 'Zrotation')
+
+def format_vector(v, precision):
+    return ' '.join('%.*f' % (precision, value) for value in v)
+
+# HIERARCHY block lines, every joint lists its channels in motion column order
+def hierarchy_lines(hierarchy, root=0, precision=6):
+    children = [[] for _ in hierarchy]
+    for index, item in enumerate(hierarchy):
+        if item['parent'] != -1:
+            children[item['parent']].append(index)
+
+    lines = ['HIERARCHY']
+    def add(index, depth):
+        item = hierarchy[index]
+        indent = '\t' * depth
+        lines.append('%s%s %s' % (indent, 'ROOT' if depth == 0 else 'JOINT', item['name']))
+        lines.append(indent + '{')
+        lines.append('%s\tOFFSET %s' % (indent, format_vector(item['offset'], precision)))
+        used = sorted((channel, kind) for kind, channel in enumerate(item['channels']) if channel != -1)
+        lines.append('%s\tCHANNELS %d%s' % (indent, len(used), ''.join(' ' + CHANNEL_NAMES[kind] for channel, kind in used)))
+        for child in children[index]:
+            add(child, depth + 1)
+        if not children[index]:
+            end = [t - o for t, o in zip(item['tail_local'], item['offset'])]
+            lines.append(indent + '\tEnd Site')
+            lines.append(indent + '\t{')
+            lines.append('%s\t\tOFFSET %s' % (indent, format_vector(end, precision)))
+            lines.append(indent + '\t}')
+        lines.append(indent + '}')
+
+    add(root if root != -1 else 0, 0)
+    return lines
+
+# write a whole BVH file to file (path or text file handle)
+# motion is a (frames, channel_count) array in file units (degrees) or an iterable of such chunks,
+# chunks are formatted with one string operation each and written as they come
+def write_bvh(file, hierarchy, motion, frame_time, root=0, frame_count=None, precision=6, chunk_size=1024):
+    if isinstance(file, str):
+        with open(file, 'w') as handle:
+            return write_bvh(handle, hierarchy, motion, frame_time, root, frame_count, precision, chunk_size)
+
+    if isinstance(motion, np.ndarray):
+        frame_count = len(motion)
+        motion = [motion[start:start + chunk_size] for start in range(0, frame_count, chunk_size)]
+    elif frame_count is None:
+        motion = list(motion)
+        frame_count = sum(len(chunk) for chunk in motion)
+
+    file.write('\n'.join(hierarchy_lines(hierarchy, root, precision)))
+    file.write('\nMOTION\nFrames: %d\nFrame Time: %.*f\n' % (frame_count, max(precision, 6), frame_time))
+
+    row_format = {}
+    for chunk in motion:
+        chunk = np.asarray(chunk, dtype=np.float64)
+        if chunk.size == 0:
+            continue
+        rows, columns = chunk.shape
+        if columns not in row_format:
+            row_format[columns] = ' '.join(['%%.%df' % precision] * columns) + '\n'
+        #Round first so no value prints as -0.000000
+        chunk = np.round(chunk, precision) + 0.0
+        file.write((row_format[columns] * rows) % tuple(chunk.ravel().tolist()))
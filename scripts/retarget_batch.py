@@ -0,0 +1,199 @@
+"""Headless batch retargeting: parse -> fit -> retarget -> write for many BVH files.
+
+Every job moves the root path of one clip onto a destination spline given by its control points
+(JSON [[x, y, z], ...] / {"points": [...]} or CSV x,y,z rows), exactly like Generate Bone in the panel.
+
+One destination for many clips:
+
+    python scripts/retarget_batch.py clips/*.bvh --points path.json --output-dir out --workers 8
+
+or a job list, a JSON array of {"input", "points", "output"} (paths relative to the job file):
+
+    python scripts/retarget_batch.py --jobs jobs.json --report report.json
+
+BVH output needs no Blender. Inside Blender the clips can be baked to an armature and saved as .blend instead
+(those jobs run one after the other in the Blender process, bpy is not available in the workers):
+
+    blender --background --python scripts/retarget_batch.py -- clips/*.bvh --points path.csv --output-dir out --format blend
+"""
+import argparse
+import importlib
+import importlib.util
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.dirname(HERE)
+PACKAGE = 'motion_capture_blender'
+
+try:
+    import bpy
+    BLENDER = True
+except ImportError:
+    BLENDER = False
+
+
+def load_addon():
+    # Register the add-on directory as a package without running its __init__ (no bpy needed).
+    if PACKAGE not in sys.modules:
+        spec = importlib.util.spec_from_file_location(PACKAGE, os.path.join(ADDON_DIR, '__init__.py'),
+                                                      submodule_search_locations=[ADDON_DIR])
+        sys.modules[PACKAGE] = importlib.util.module_from_spec(spec)
+    return importlib.import_module(PACKAGE + '.bvhretarget')
+
+
+# Module level so spawned workers, which import this file as __mp_main__, get it too.
+bvhretarget = load_addon()
+
+
+def read_jobs(args):
+    if args.jobs:
+        with open(args.jobs, 'r') as file:
+            jobs = json.load(file)
+        base = os.path.dirname(os.path.abspath(args.jobs))
+        for job in jobs:
+            for key in ('input', 'points', 'output'):
+                if isinstance(job.get(key), str):
+                    job[key] = os.path.join(base, job[key])
+        return jobs
+
+    if not args.points or not args.output_dir:
+        raise SystemExit('give --jobs, or input files with --points and --output-dir')
+    points = bvhretarget.load_points(args.points).tolist()
+    return [{
+        'input': path,
+        'points': points,
+        'output': os.path.join(args.output_dir, os.path.splitext(os.path.basename(path))[0] + '.' + args.format),
+    } for path in args.inputs]
+
+
+def run_job(job, precision=6):
+    # Failures are reported with the job, one bad file does not stop the batch.
+    begin = time.perf_counter()
+    try:
+        if job['output'].lower().endswith('.blend'):
+            return bake_blend(job)
+        return bvhretarget.retarget_file(job, precision)
+    except Exception as e:
+        return {'input': job['input'], 'output': job['output'], 'error': str(e), 'wall': time.perf_counter() - begin}
+
+
+def bake_blend(job):
+    # Bake the retargeted clip onto an armature in an empty scene and save it, Blender only.
+    if not BLENDER:
+        raise Exception('.blend output needs blender --background')
+    bvhutils = importlib.import_module(PACKAGE + '.bvhutils')
+    stages = {}
+    begin = last = time.perf_counter()
+    def lap(name):
+        nonlocal last
+        now = time.perf_counter()
+        stages[name] = now - last
+        last = now
+
+    bpy.ops.wm.read_homefile(use_empty=True)
+    bvh = bvhutils.Bvh()
+    bvh.read_bvh(job['input'])
+    nodes = job['points']
+    if isinstance(nodes, str):
+        nodes = bvhretarget.load_points(nodes)
+    lap('parse')
+    path, source_points, original_points = bvh.getRootJointPath(control_count=len(nodes))
+    lap('fit')
+    bvh.destiny_points = bvhretarget.sample_path(nodes, bvh.getTimeStamp())
+    name = os.path.splitext(os.path.basename(job['input']))[0]
+    bvh.add_armature(bpy.context, 1, source_points, name=name)
+    scene = bpy.context.scene
+    scene.frame_start = 1
+    scene.frame_end = max(1, bvh.frame_count)
+    if bvh.frame_time > 0:
+        scene.render.fps = max(1, round(1.0 / bvh.frame_time))
+    lap('retarget')
+    directory = os.path.dirname(os.path.abspath(job['output']))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    bpy.ops.wm.save_as_mainfile(filepath=os.path.abspath(job['output']))
+    lap('write')
+    return {
+        'input': job['input'],
+        'output': job['output'],
+        'frames': bvh.frame_count,
+        'joints': len(bvh.joints),
+        'wall': time.perf_counter() - begin,
+        'stages': stages,
+    }
+
+
+def get_pool(max_workers):
+    # Clean interpreters, never a fork of a running Blender (same as bvhbatch.get_pool).
+    context = multiprocessing.get_context('spawn')
+    if BLENDER:
+        # Blender before 2.91 reports its own binary as sys.executable
+        python = getattr(bpy.app, 'binary_path_python', None)
+        if python:
+            context.set_executable(python)
+    return ProcessPoolExecutor(max_workers, mp_context=context)
+
+
+def report(index, count, result):
+    if 'error' in result:
+        print('[%d/%d] %s FAILED: %s' % (index, count, result['input'], result['error']))
+        return
+    stages = ' '.join('%s %.3fs' % item for item in result['stages'].items())
+    print('[%d/%d] %s -> %s: %d frames, %d joints, %.3fs (%s)' % (
+        index, count, result['input'], result['output'], result['frames'], result['joints'], result['wall'], stages))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='*', help='BVH files, all retargeted onto --points')
+    parser.add_argument('--jobs', help='JSON job list instead of inputs')
+    parser.add_argument('--points', help='destination control points, .json or .csv')
+    parser.add_argument('--output-dir')
+    parser.add_argument('--format', choices=('bvh', 'blend'), default='bvh')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, default one per core')
+    parser.add_argument('--precision', type=int, default=6, help='decimals of the written BVH values')
+    parser.add_argument('--report', help='write every job result as JSON')
+    args = parser.parse_args(argv)
+
+    jobs = read_jobs(args)
+    count = len(jobs)
+    results = []
+    begin = time.perf_counter()
+
+    #.blend jobs need the bpy of this process, BVH jobs go to the pool
+    serial = [job for job in jobs if job['output'].lower().endswith('.blend')]
+    parallel = [job for job in jobs if not job['output'].lower().endswith('.blend')]
+    if len(parallel) < 2 or args.workers == 1:
+        serial = parallel + serial
+        parallel = []
+
+    if parallel:
+        with get_pool(args.workers) as pool:
+            futures = [pool.submit(run_job, job, args.precision) for job in parallel]
+            for future in as_completed(futures):
+                results.append(future.result())
+                report(len(results), count, results[-1])
+    for job in serial:
+        results.append(run_job(job, args.precision))
+        report(len(results), count, results[-1])
+
+    wall = time.perf_counter() - begin
+    failed = sum(1 for result in results if 'error' in result)
+    frames = sum(result.get('frames', 0) for result in results)
+    print('%d jobs, %d failed, %d frames in %.2fs (%.0f frames/s)' % (count, failed, frames, wall, frames / wall if wall > 0 else 0.0))
+
+    if args.report:
+        with open(args.report, 'w') as file:
+            json.dump({'wall': wall, 'failed': failed, 'jobs': results}, file, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    # Blender passes its own arguments first, ours come after '--'.
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else sys.argv[1:]
+    sys.exit(main(argv))
@@ -1,7 +1,19 @@
 import bpy
 import os
+import shutil
+import tempfile
+import numpy as np
 from math import radians, ceil
 from .bvhutils import *
+from .bvhmath import eval_bspline
+from .bvhretarget import sample_path
+from .bvhcache import BvhCache
+from .bvhconcat import concatenate
+from .bvhresample import resample_rate, resample_count
+from .bvhprofile import PROFILER
+from .bvhindex import PoseIndex
+from .bvhgraph import MotionGraph
+from .bvhbatch import import_bvh_files, list_bvh_files
 from bpy.app.handlers import persistent
 import decimal
 
@@ -15,6 +27,134 @@ class DataManager():
     current_bvh_name_concat = ''
     current_bvh_object_concat = None
     nowSelectingFragment = 0
+    #parsed files kept on disk between sessions
+    bvh_cache = BvhCache()
+    #nearest pose lookup over every loaded clip
+    pose_index = PoseIndex()
+    #motion graph of the last assembled skeleton and the clip names it was built from
+    motion_graph = None
+    motion_graph_names = ()
+    #EnumProperty items of the loaded clips, rebuilt when a clip is added or removed
+    bvh_items = None
+    #Clip names from the least to the most recently used, for the memory budget
+    recent_bvh = []
+    #Spill files of evicted clips that have no source file, created on the first eviction
+    spill_directory = None
+
+# (identifier, name, description) of every loaded clip for the clip selectors,
+# the same list is returned until the clips change (Blender also needs the strings kept alive)
+def get_bvh_items():
+    if DataManager.bvh_items is None:
+        DataManager.bvh_items = [(name, name, '') for name in DataManager.all_bvh.keys()]
+    return DataManager.bvh_items
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return '%.1f %s' % (size, unit)
+        size /= 1024.0
+    return '%.1f GB' % size
+
+# execute decorator recording the stages of the operator when profiling is on
+def profiled(execute):
+    def wrapper(self, context):
+        pref = context.scene.setting
+        log_path = bpy.path.abspath(pref.profileLog) if pref.profileLog else None
+        with PROFILER.run(type(self).__name__, pref.profile, log_path):
+            return execute(self, context)
+    return wrapper
+
+# add bvh under a unique name and make it the current clip, return the name used
+def add_bvh(name, bvh):
+    index = 0
+    basename = name
+    #Avoid complicated name
+    while True:
+        if name in DataManager.all_bvh.keys():
+            index += 1
+            name = basename + '_' + str(index)
+        else:
+            break
+    DataManager.current_bvh_name = name
+    DataManager.current_bvh_object = bvh
+    DataManager.all_bvh[name] = bvh
+    DataManager.bvh_items = None
+    DataManager.current_bvh_object.destiny_points_nodes = None
+    DataManager.pose_index.add(name, bvh)
+    touch_bvh(name)
+    enforce_memory_budget()
+    return name
+
+# forget a loaded clip, another one becomes current when it was the current one
+def remove_bvh(name):
+    bvh = DataManager.all_bvh.pop(name, None)
+    DataManager.bvh_items = None
+    if name in DataManager.recent_bvh:
+        DataManager.recent_bvh.remove(name)
+    if bvh is not None:
+        bvh.release_spill()
+    DataManager.pose_index.remove(name)
+    if DataManager.current_bvh_name_concat == name:
+        DataManager.current_bvh_name_concat = ''
+        DataManager.current_bvh_object_concat = None
+    if DataManager.current_bvh_name == name:
+        DataManager.current_bvh_name = ''
+        DataManager.current_bvh_object = None
+        for other_name, other in DataManager.all_bvh.items():
+            DataManager.current_bvh_name = other_name
+            DataManager.current_bvh_object = other
+    return bvh
+
+# mark a clip as just used
+def touch_bvh(name):
+    if name in DataManager.recent_bvh:
+        DataManager.recent_bvh.remove(name)
+    if name in DataManager.all_bvh:
+        DataManager.recent_bvh.append(name)
+
+# evict the motion of the least recently used clips, except the current ones, until all clips and the pose index
+# fit in budget bytes (the memoryBudget setting by default, 0 for no limit), evicted clips reload when they are used again,
+# the pose index features are dropped last and rebuilt by the next query
+# return the number of evicted clips
+def enforce_memory_budget(budget=None):
+    if budget is None:
+        setting = getattr(getattr(bpy.context, 'scene', None), 'setting', None)
+        budget = int(setting.memoryBudget * 1024 * 1024) if setting is not None else 0
+    if budget <= 0:
+        return 0
+
+    index_size = DataManager.pose_index.get_size()
+    total = index_size + sum(bvh.get_memory_footprint()['total'] for bvh in DataManager.all_bvh.values())
+    current = (DataManager.current_bvh_object, DataManager.current_bvh_object_concat)
+    evicted = 0
+    for name in list(DataManager.recent_bvh):
+        if total <= budget:
+            break
+        bvh = DataManager.all_bvh[name]
+        if any(bvh is other for other in current):
+            continue
+        if DataManager.spill_directory is None:
+            DataManager.spill_directory = tempfile.mkdtemp(prefix='motion_capture_blender_')
+        freed = bvh.evict(DataManager.spill_directory)
+        if freed:
+            total -= freed
+            evicted += 1
+    if total > budget and index_size:
+        DataManager.pose_index.release()
+    return evicted
+
+# (resident bytes with the pose index, bytes of the evicted or not yet loaded clips, number of such clips)
+def get_memory_usage():
+    resident = DataManager.pose_index.get_size()
+    evicted = 0
+    count = 0
+    for bvh in DataManager.all_bvh.values():
+        if bvh.lazy:
+            evicted += bvh.get_motion_size()
+            count += 1
+        else:
+            resident += bvh.get_memory_footprint()['total']
+    return resident, evicted, count
 
 class SplineBvhContainer():
     spline_list = []
@@ -22,6 +162,10 @@ class SplineBvhContainer():
     curve_object_list = []
     index = 0
     function_added = 0
+    #spline index: (cube locations, curve coords) of the last live edit update
+    live_cache = {}
+    #spline index: first cube of the 4 point fragment Set path drew on its curve, whole spline when missing
+    curve_fragments = {}
 
 class ImportBvh(bpy.types.Operator):
     '''Add Bvh File'''
@@ -34,49 +178,193 @@ class ImportBvh(bpy.types.Operator):
         context.window_manager.fileselect_add(self) 
         return {'RUNNING_MODAL'}
 
+    @profiled
     def execute(self, context):
         scene = context.scene
         pref = scene.setting
 
         pref.bvhFilePath = os.path.basename(self.filepath)
         name = os.path.basename(self.filepath)[:-4]
-        bvh = Bvh()
-        bvh.read_bvh(self.filepath)
-        index = 0
-        basename = name
-        #Avoid complicated name
-        while True:
-            if name in DataManager.all_bvh.keys():
-                index += 1
-                name = basename + '_' + str(index)
-            else:
-                break
-        DataManager.current_bvh_name = name
-        DataManager.current_bvh_object = bvh
-        DataManager.all_bvh[name] = bvh
-        DataManager.current_bvh_object.destiny_points_nodes = None
+        dtype = np.float32 if pref.compactStorage else np.float64
+        if pref.useCache and pref.loadMode == 'FULL':
+            bvh = DataManager.bvh_cache.load(self.filepath, dtype=dtype)
+        else:
+            bvh = Bvh(dtype)
+            bvh.read_bvh(self.filepath, load_motion=pref.loadMode != 'STREAM', lazy=pref.loadMode == 'LAZY')
+        PROFILER.count(bvh.frame_count, len(bvh.joints))
+        add_bvh(name, bvh)
+        return {'FINISHED'}
+
+class ImportBvhBatch(bpy.types.Operator):
+    '''Add every selected Bvh File, or the whole folder when none is selected'''
+    bl_idname = "ldops.import_bvh_batch"
+    bl_label = "Add bvh folder"
+
+    filter_glob = bpy.props.StringProperty(default="*.bvh", options={'HIDDEN'})
+    directory = bpy.props.StringProperty(subtype="DIR_PATH")
+    files = bpy.props.CollectionProperty(type=bpy.types.OperatorFileListElement)
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+    def execute(self, context):
+        pref = context.scene.setting
+        file_paths = [os.path.join(self.directory, f.name) for f in self.files if f.name]
+        if not file_paths:
+            file_paths = list_bvh_files(self.directory)
+
+        cache = DataManager.bvh_cache if pref.useCache else None
+        dtype = np.float32 if pref.compactStorage else np.float64
+        loaded, failed = import_bvh_files(file_paths, cache=cache, dtype=dtype, lazy=pref.loadMode == 'LAZY', stream=pref.loadMode == 'STREAM')
+        for file_path, bvh in loaded.items():
+            add_bvh(os.path.basename(file_path)[:-4], bvh)
+        if loaded:
+            pref.bvhFilePath = os.path.basename(list(loaded)[-1])
+
+        for file_path, error in failed.items():
+            self.report({'WARNING'}, "%s: %s" % (os.path.basename(file_path), error))
+        self.report({'INFO'}, "Imported %d of %d bvh files" % (len(loaded), len(file_paths)))
+        return {'FINISHED'}
+
+class RemoveBvh(bpy.types.Operator):
+    '''Remove the current Bvh from the loaded clips'''
+    bl_idname = "ldops.remove_bvh"
+    bl_label = "Remove bvh"
+
+    def execute(self, context):
+        if DataManager.current_bvh_object == None:
+            return {'FINISHED'}
+        remove_bvh(DataManager.current_bvh_name)
+        return {'FINISHED'}
+
+class FindSimilarPose(bpy.types.Operator):
+    '''Find the closest pose to the current frame of the current Bvh in the other loaded clips'''
+    bl_idname = "ldops.find_similar_pose"
+    bl_label = "Find similar pose"
+
+    def execute(self, context):
+        scene = context.scene
+        if DataManager.current_bvh_object == None:
+            return {'FINISHED'}
+
+        current_bvh = DataManager.current_bvh_object
+        frame = min(max(scene.frame_current - max(scene.frame_start, 1), 0), current_bvh.frame_count - 1)
+        result = DataManager.pose_index.query(current_bvh, frame, exclude=(DataManager.current_bvh_name,))
+        if result is None:
+            self.report({'WARNING'}, "No other clip with the same skeleton")
+            return {'CANCELLED'}
+        name, match_frame, distance = result
+        #Indexing may have loaded evicted clips
+        enforce_memory_budget()
+        self.report({'INFO'}, "Frame %d is closest to %s frame %d (distance %.3f)" % (frame, name, match_frame, distance))
+        return {'FINISHED'}
+
+class AssembleMotion(bpy.types.Operator):
+    '''Stitch loaded clips of the current skeleton into one motion following the selected spline'''
+    bl_idname = "ldops.assemble_motion"
+    bl_label = "Assemble along path"
+
+    def execute(self, context):
+        scene = context.scene
+        if DataManager.current_bvh_object == None or not SplineBvhContainer.spline_list:
+            return {'FINISHED'}
+
+        #Spline of the active cube, the first one otherwise
+        spline = SplineBvhContainer.spline_list[0]
+        for other in SplineBvhContainer.spline_list:
+            if context.view_layer.objects.active in other:
+                spline = other
+        path = calc_path_array([cube.location for cube in spline], np.arange(200) / 199.0)
+
+        current_bvh = DataManager.current_bvh_object
+        skeleton = DataManager.pose_index.get_skeleton(current_bvh)
+        clips = {name: bvh for name, bvh in DataManager.all_bvh.items() if DataManager.pose_index.get_skeleton(bvh) == skeleton}
+        names = tuple(sorted(clips))
+        if DataManager.motion_graph is None or DataManager.motion_graph_names != names:
+            DataManager.motion_graph = MotionGraph(clips).build()
+            DataManager.motion_graph_names = names
+
+        graph = DataManager.motion_graph
+        segments, error, covered = graph.search(path)
+        if not segments:
+            self.report({'WARNING'}, "No clip sequence found")
+            return {'CANCELLED'}
+        bvh = graph.assemble(segments, scene.setting.concatBlendFrames, path)
+        name = add_bvh('Assembled', bvh)
+        if covered < 0.999:
+            self.report({'WARNING'}, "%s: the clips cover only %.0f%% of the path, %.3f from it" % (name, covered * 100.0, error))
+        else:
+            self.report({'INFO'}, "%s: %d clips, %d frames, %.3f from the path" % (name, len(segments), bvh.frame_count, error))
+        return {'FINISHED'}
+
+class ExportBvh(bpy.types.Operator):
+    '''Save the current Bvh, along the destination path when one is set'''
+    bl_idname = "ldops.export_bvh"
+    bl_label = "Export bvh"
+
+    filter_glob = bpy.props.StringProperty(default="*.bvh", options={'HIDDEN'})
+    filepath = bpy.props.StringProperty(subtype="FILE_PATH")
+    retarget = bpy.props.BoolProperty(name="Retarget", description="Write the motion moved onto the destination path", default=True)
+    def invoke(self, context, event):
+        if not self.filepath:
+            self.filepath = DataManager.current_bvh_name + '.bvh'
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+    def execute(self, context):
+        if DataManager.current_bvh_object == None:
+            return {'FINISHED'}
+
+        current_bvh = DataManager.current_bvh_object
+        nodes = current_bvh.destiny_points_nodes
+        source_points = None
+        if self.retarget and nodes:
+            #Same source path and destination samples as GenerateJointAndBone
+            path,source_points,original_points = current_bvh.getRootJointPath(control_count=len(nodes))
+            current_bvh.destiny_points = calc_path_by_distance(nodes, current_bvh.getTimeStamp())
+        current_bvh.write_bvh(bpy.path.ensure_ext(self.filepath, '.bvh'), source_points)
+        self.report({'INFO'}, "Saved %s" % os.path.basename(self.filepath))
+        return {'FINISHED'}
+
+class ClearBvhCache(bpy.types.Operator):
+    '''Remove every cached bvh file'''
+    bl_idname = "ldops.clear_bvh_cache"
+    bl_label = "Clear cache"
+
+    def execute(self, context):
+        DataManager.bvh_cache.clear()
         return {'FINISHED'}
 
 class SetPath(bpy.types.Operator):
     bl_idname = "ldops.set_path"
     bl_label = "Set path"
 
+    @profiled
     def execute(self,context):
         if DataManager.current_bvh_object == None:
             return {'FINISHED'}
+        pref = context.scene.setting
         index = 0
         for spline in SplineBvhContainer.spline_list:
             for i in range(len(spline)):
                 if bpy.context.view_layer.objects.active == spline[i]:
-                    number = int(DataManager.nowSelectingFragment)
-                    spline_list_t = []
-                    for k in range(number,number+4):
-                        spline_list_t.append(spline[k].location)
-
-                    Points = calc_path(spline_list_t,200)
-                    for k, coord in enumerate(Points):
-                        x,y,z = coord
-                        SplineBvhContainer.curve_object_list[index].data.splines[0].points[k].co = (x,y,z,0)
+                    curve_points = SplineBvhContainer.curve_object_list[index].data.splines[0].points
+                    if pref.fullPath:
+                        #Whole spline, every cube is a control point
+                        spline_list_t = [cube.location for cube in spline]
+                        SplineBvhContainer.curve_fragments.pop(index, None)
+                    else:
+                        number = int(DataManager.nowSelectingFragment)
+                        spline_list_t = []
+                        for k in range(number,number+4):
+                            spline_list_t.append(spline[k].location)
+                        #Live edit keeps drawing this fragment
+                        SplineBvhContainer.curve_fragments[index] = number
+
+                    with PROFILER.stage('destination_sampling', len(curve_points)):
+                        Points = calc_path_array(spline_list_t, np.arange(len(curve_points)) / len(curve_points))
+                        write_curve_points(curve_points, Points)
+                    SplineBvhContainer.live_cache.pop(index, None)
                     DataManager.current_bvh_object.destiny_points_nodes = spline_list_t
             index+=1
         return {'FINISHED'}
@@ -86,111 +374,39 @@ class GenerateJointAndBone(bpy.types.Operator):
     bl_idname = "ldops.generate_bone"
     bl_label = "Generate Bone"
 
+    @profiled
     def execute(self, context):
         scene = context.scene
         if DataManager.current_bvh_object == None:
             return {'FINISHED'}
 
         current_bvh = DataManager.current_bvh_object
-        path,source_points,original_points = current_bvh.getRootJointPath()
+        PROFILER.count(current_bvh.frame_count, len(current_bvh.joints))
         nodes = DataManager.current_bvh_object.destiny_points_nodes
-        nodelists = [nodes[0],nodes[1],nodes[2],nodes[3]]
-        DataManager.current_bvh_object.destiny_points = calc_path(nodelists,len(source_points))
-        current_bvh.add_joint(context, scene.frame_start,source_points)
+        #Fit the source with as many control points as the destination spline has
+        path,source_points,original_points = current_bvh.getRootJointPath(control_count=len(nodes))
+        #Walk the destination at the same normalized distance as the source root on every frame
+        timestamp = current_bvh.getTimeStamp()
+        with PROFILER.stage('destination_sampling', len(timestamp)):
+            DataManager.current_bvh_object.destiny_points = calc_path_by_distance(nodes, timestamp)
+        pref = scene.setting
+        tolerance = pref.decimateTolerance if pref.decimate and (pref.bulkBake or pref.bakeArmature) else None
+        current_bvh.removed_keys = {}
+        if pref.bakeArmature:
+            current_bvh.add_armature(context, scene.frame_start, source_points, name=DataManager.current_bvh_name, tolerance=tolerance)
+        else:
+            current_bvh.add_joint(context, scene.frame_start,source_points, bulk=pref.bulkBake, tolerance=tolerance)
+
+        if current_bvh.removed_keys:
+            for name, count in current_bvh.removed_keys.items():
+                self.report({'INFO'}, "%s: %d keys removed" % (name, count))
+            self.report({'INFO'}, "Decimation removed %d keys" % sum(current_bvh.removed_keys.values()))
         return {'FINISHED'}
 
-def add_concat_joint(a,b,context, frame_start):
-    if frame_start < 1:
-        frame_start = 1
-    
-    scene = context.scene
-    for obj in scene.objects:
-        obj.select_set(False)
-    
-    objects = []
-
-    def add_ob(name):
-        obj = bpy.data.objects.new(name, None)
-        context.collection.objects.link(obj)
-        objects.append(obj)
-        obj.select_set(True)
-        obj.empty_display_type = 'CUBE'
-        obj.empty_display_size = 0.5
-        return obj
-    
-    #Add objects
-    for name, joint in a.joints.items():
-        joint.temp = add_ob(name)
-        joint.temp.rotation_mode = joint.rot_order_str[::-1]
-    
-    #Set Parent
-    for joint in a.joints.values():
-        for child in joint.children:
-            child.temp.parent = joint.temp
-    
-    #Set location
-    for joint in a.joints.values():
-        joint.temp.location = joint.rest_head_local
-
-    #Add tail objects
-    for name, joint in a.joints.items():
-        if not joint.children:
-            ob_end = add_ob(name + '_end')
-            ob_end.parent = joint.temp
-            ob_end.location = joint.rest_tail_world - joint.rest_head_world
-    
-
-    fcprev = 0
-    lxp=lyp=lzp=0
-    root_index=0
-    obj_p = []
-    for name, joint in a.joints.items():
-        obj = joint.temp
-        fcprev=len(joint.anim_data)
-        obj_p.append(joint.temp)
-        root_index=0
-
-        print(len(joint.anim_data))
-        for fc in range(len(joint.anim_data)):
-
-            lx, ly, lz, rx, ry, rz = joint.anim_data[fc]
-
-            if joint.has_loc:
-                obj.delta_location = Vector((lx, ly, lz)) - joint.rest_head_world
-                obj.keyframe_insert("delta_location", index=-1, frame=frame_start + fc)
-            
-            if joint.has_rot:
-                obj.delta_rotation_euler = rx, ry, rz
-                obj.keyframe_insert("delta_rotation_euler", index=-1, frame=frame_start + fc)
-            
-            if root_index == 0:
-                lxp=lx
-                lyp=ly
-                lzp=lz
-            
-        root_index += 1
-
-    joint_index=0
-    for name, joint in b.joints.items():
-        obj = joint.temp
-        obj_first = obj_p[joint_index]
-        print(len(joint.anim_data))
-        for fc in range(len(joint.anim_data)):
-            lx, ly, lz, rx, ry, rz = joint.anim_data[fc]
-            
-            if joint.has_loc:
-                obj_first.delta_location = Vector((lx, ly, lz)) - joint.rest_head_world
-                obj_first.keyframe_insert("delta_location", index=-1, frame=frame_start + fc + fcprev)
-            
-            if joint.has_rot:
-                obj_first.delta_rotation_euler = rx, ry, rz
-                obj_first.keyframe_insert("delta_rotation_euler", index=-1, frame=frame_start + fc + fcprev)
-        joint_index+=1
-
 class GenerateJointAndBoneConcat(bpy.types.Operator):
-    '''Generate JointBone'''
+    '''Concatenate the two selected bvh into a new one'''
     bl_idname = "ldops.generate_concat_bone"
-    bl_label = "Generate Concat Bone"
+    bl_label = "Concatenate Bvh"
 
     def execute(self, context):
         scene = context.scene
@@ -199,24 +415,64 @@ class GenerateJointAndBoneConcat(bpy.types.Operator):
         if DataManager.current_bvh_object_concat == None:
             return {'FINISHED'}
 
+        pref = scene.setting
         current_bvh = DataManager.current_bvh_object
         current_bvh_concat = DataManager.current_bvh_object_concat
+        name = DataManager.current_bvh_name + '+' + DataManager.current_bvh_name_concat
+        try:
+            bvh, info = concatenate(current_bvh, current_bvh_concat, pref.concatBlendFrames, pref.concatWindow)
+        except Exception as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+
+        name = add_bvh(name, bvh)
+        self.report({'INFO'}, "%s: frame %d -> frame %d, distance %.3f" % (name, info['frame_a'], info['frame_b'], info['distance']))
+        return {'FINISHED'}
+
+class ResampleBvh(bpy.types.Operator):
+    '''Resample the current bvh to the scene frame rate or to a frame count'''
+    bl_idname = "ldops.resample_bvh"
+    bl_label = "Resample"
 
-        add_concat_joint(current_bvh,current_bvh_concat,context, scene.frame_start)
+    def execute(self, context):
+        scene = context.scene
+        if DataManager.current_bvh_object == None:
+            return {'FINISHED'}
+
+        pref = scene.setting
+        current_bvh = DataManager.current_bvh_object
+        if pref.resampleMode == 'SCENE':
+            fps = scene.render.fps / scene.render.fps_base
+            bvh = resample_rate(current_bvh, 1.0 / fps)
+            name = '%s_%gfps' % (DataManager.current_bvh_name, fps)
+        else:
+            bvh = resample_count(current_bvh, pref.resampleFrames)
+            name = '%s_%df' % (DataManager.current_bvh_name, pref.resampleFrames)
+
+        name = add_bvh(name, bvh)
+        self.report({'INFO'}, "%s: %d -> %d frames" % (name, current_bvh.frame_count, bvh.frame_count))
         return {'FINISHED'}
 
 class DrawBvhInitial(bpy.types.Operator):
     bl_idname = "ldops.draw_bvh_initial"
     bl_label = "Draw BVH Initial"
 
+    @profiled
     def execute(self, context):
         scene = context.scene
         if DataManager.current_bvh_object == None:
             return {'FINISHED'}
 
         current_bvh = DataManager.current_bvh_object
-        path,source_points,original_points = current_bvh.getRootJointPath()
+        pref = scene.setting
+        tolerance = pref.pathTolerance if pref.pathTolerance > 0 else None
+        PROFILER.count(current_bvh.frame_count, len(current_bvh.joints))
+        path,source_points,original_points = current_bvh.getRootJointPath(control_count=pref.pathControlCount, tolerance=tolerance)
+        with PROFILER.stage('objects', len(source_points)):
+            self.add_curves(context, path, source_points, original_points)
+        return {'FINISHED'}
 
+    def add_curves(self, context, path, source_points, original_points):
         # create the Curve Datablock
         curveData = bpy.data.curves.new('PathCurve', type='CURVE')
 
@@ -249,55 +505,101 @@ class DrawBvhInitial(bpy.types.Operator):
         # attach to scene and validate context
         context.collection.objects.link(curveOB)
         context.collection.objects.link(curveOB_ori)
-        return {'FINISHED'}
-
-def getCubicConstant(t, mode):
-    result = 0
-    if mode == 0:
-        result = float(pow(1 - t, 3) / 6)
-    elif mode == 1:
-        result = float((3 * pow(t, 3) - 6 * pow(t, 2) + 4) / 6)
-    elif mode == 2:
-        result = float((-3 * pow(t, 3) + 3 * pow(t, 2) + 3 * t + 1) / 6)
-    elif mode == 3:
-        result = pow(t, 3) / 6
-
-    return result
 
 def float_range(start, stop, step):
     while start < stop:
         yield float(start)
         start += decimal.Decimal(step)
 
-def calc_path(coords,timestamp):
-    points = []
-    fr = float_range(0,1,1.0/timestamp)
-    for t in list(fr):
-        point = Vector((0, 0, 0))
-        for index in range(4):
-            point.x += getCubicConstant(t, index) * coords[index][0]
-            point.y += getCubicConstant(t, index) * coords[index][1]
-            point.z += getCubicConstant(t, index) * coords[index][2]
-        points.append(point)
-    return points
-
-
-# def loc_change():
-#     for i in range(SplineBvhContainer.index):
-#         for j in range(len(SplineBvhContainer.index[i])):
-#             loc = Vector((SplineBvhContainer.spline_list[i][j].location.x,
-#                             SplineBvhContainer.spline_list[i][j].location.y,
-#                             SplineBvhContainer.spline_list[i][j].location.z))
-
-#             coords = [SplineBvhContainer.spline_list[i][0].location,SplineBvhContainer.spline_list[i][1].location
-#                      ,SplineBvhContainer.spline_list[i][2].location,SplineBvhContainer.spline_list[i][3].location]
-#             if dloc.length > 1.0e-4:
-#                 Points = calc_path(coords,200)
-#                 for k, coord in enumerate(Points):
-#                     x,y,z = coord
-#                     SplineBvhContainer.curve_object_list[i].data.splines[0].points[k].co = (x,y,z,0)
-    
-#     return 0.02
+# points of the spline through coords (4 or more control points) at every parameter of t,
+# as one (len(t), 3) array
+def calc_path_array(coords, t):
+    return eval_bspline([tuple(coord) for coord in coords], t)
+
+# timestamp samples over [0, 1) as a List of Vector
+# exact=False keeps the old Decimal stepping, which can give one sample more or fewer
+def calc_path(coords,timestamp,exact=True):
+    if exact:
+        t = np.arange(timestamp) / timestamp
+    else:
+        t = np.fromiter(float_range(0,1,1.0/timestamp), dtype=np.float64)
+    return [Vector(point) for point in calc_path_array(coords, t).tolist()]
+
+# points of the spline through coords at the normalized distances along it (List of Vector),
+# so equal distance steps give equal steps on the curve
+def calc_path_by_distance(coords, distances, samples=1024):
+    return [Vector(point) for point in sample_path(coords, distances, samples).tolist()]
+
+# write (n, 3) coords into the points of a POLY spline with one call
+def write_curve_points(curve_points, coords):
+    co = np.zeros((len(coords), 4), dtype=np.float32)
+    co[:, 0:3] = coords
+    curve_points.foreach_set('co', co.ravel())
+
+# redraw the curve of spline index from all of its cubes, only the segments
+# driven by cubes that moved since the last call are evaluated again
+def update_spline_curve(index):
+    spline = SplineBvhContainer.spline_list[index]
+    curve_object = SplineBvhContainer.curve_object_list[index]
+    curve_points = curve_object.data.splines[0].points
+    #Same control points as the last Set path on this curve
+    first = SplineBvhContainer.curve_fragments.get(index)
+    if first is not None and first + 4 <= len(spline):
+        spline = spline[first:first + 4]
+    locations = np.array([tuple(cube.location) for cube in spline], dtype=np.float64)
+    sample_count = len(curve_points)
+    t = np.arange(sample_count) / sample_count
+
+    cached = SplineBvhContainer.live_cache.get(index)
+    if cached is None or cached[0].shape != locations.shape or len(cached[1]) != sample_count:
+        coords = calc_path_array(locations, t)
+    else:
+        previous, coords = cached
+        moved = np.nonzero(np.any(np.abs(locations - previous) > 1.0e-6, axis=1))[0]
+        if len(moved) == 0:
+            return False
+        #Control point k drives segments k - 3 .. k
+        segment_count = len(locations) - 3
+        segment = np.minimum((t * segment_count).astype(np.intp), segment_count - 1)
+        affected = np.zeros(segment_count, dtype=bool)
+        for k in moved:
+            affected[max(0, k - 3):min(k, segment_count - 1) + 1] = True
+        samples = affected[segment]
+        coords = coords.copy()
+        coords[samples] = calc_path_array(locations, t[samples])
+
+    write_curve_points(curve_points, coords)
+    curve_object.data.update_tag()
+    SplineBvhContainer.live_cache[index] = (locations, coords)
+    return True
+
+# timer of the live edit mode, runs at most liveEditRate times per second
+def live_edit_timer():
+    pref = bpy.context.scene.setting
+    if not pref.liveEdit:
+        SplineBvhContainer.live_cache.clear()
+        return None
+    for index in range(len(SplineBvhContainer.spline_list)):
+        try:
+            update_spline_curve(index)
+        except ReferenceError:
+            #A cube or curve was deleted, redraw it from scratch next time
+            SplineBvhContainer.live_cache.pop(index, None)
+    return 1.0 / pref.liveEditRate
+
+def set_live_edit(enable):
+    if enable and not bpy.app.timers.is_registered(live_edit_timer):
+        bpy.app.timers.register(live_edit_timer, persistent = True)
+    elif not enable and bpy.app.timers.is_registered(live_edit_timer):
+        bpy.app.timers.unregister(live_edit_timer)
+        SplineBvhContainer.live_cache.clear()
+
+# the setting is saved with the .blend, start or stop the timer to match the loaded file
+@persistent
+def live_edit_load_post(dummy):
+    #Cached coords belong to the objects of the previous file
+    SplineBvhContainer.live_cache.clear()
+    set_live_edit(bpy.context.scene.setting.liveEdit)
 
 class CreateSpline(bpy.types.Operator):
     bl_idname = "ldops.create_spline"
@@ -306,7 +608,6 @@ class CreateSpline(bpy.types.Operator):
     def execute(self, context):
         if(SplineBvhContainer.function_added == 0):
             SplineBvhContainer.function_added = 1
-            # bpy.app.timers.register(loc_change)
             bpy.ops.object.select_all(action='DESELECT')
             bpy.data.objects['Cube'].select_set(True)
             bpy.ops.object.delete()
@@ -335,15 +636,12 @@ class CreateSpline(bpy.types.Operator):
         # create the Curve Datablock
         curveData = bpy.data.curves.new('UserCurve', type='CURVE')
 
-        Points = calc_path(coords,200)
+        Points = calc_path_array(coords, np.arange(200) / 200)
 
         # map coords to spline
         polyline = curveData.splines.new('POLY')
         polyline.points.add(len(Points)-1)
-
-        for i, coord in enumerate(Points):
-            x,y,z = coord
-            polyline.points[i].co=(x,y,z,0)
+        write_curve_points(polyline.points, Points)
 
         curveOB = bpy.data.objects.new('UserCurve', curveData)
         context.collection.objects.link(curveOB)
@@ -399,18 +697,39 @@ class DelPoint(bpy.types.Operator):
 def register():
     bpy.utils.register_class(SetPath)
     bpy.utils.register_class(ImportBvh)
+    bpy.utils.register_class(ImportBvhBatch)
+    bpy.utils.register_class(RemoveBvh)
+    bpy.utils.register_class(FindSimilarPose)
+    bpy.utils.register_class(AssembleMotion)
+    bpy.utils.register_class(ExportBvh)
+    bpy.utils.register_class(ClearBvhCache)
     bpy.utils.register_class(GenerateJointAndBone)
-    #bpy.utils.register_class(GenerateJointAndBoneConcat)
+    bpy.utils.register_class(GenerateJointAndBoneConcat)
+    bpy.utils.register_class(ResampleBvh)
     bpy.utils.register_class(DrawBvhInitial)
     bpy.utils.register_class(CreateSpline)
     bpy.utils.register_class(AddPoint)
     bpy.utils.register_class(DelPoint)
+    bpy.app.handlers.load_post.append(live_edit_load_post)
 
 def unregister():
+    if live_edit_load_post in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(live_edit_load_post)
+    set_live_edit(False)
+    if DataManager.spill_directory is not None:
+        shutil.rmtree(DataManager.spill_directory, ignore_errors=True)
+        DataManager.spill_directory = None
     bpy.utils.unregister_class(SetPath)
     bpy.utils.unregister_class(ImportBvh)
+    bpy.utils.unregister_class(ImportBvhBatch)
+    bpy.utils.unregister_class(RemoveBvh)
+    bpy.utils.unregister_class(FindSimilarPose)
+    bpy.utils.unregister_class(AssembleMotion)
+    bpy.utils.unregister_class(ExportBvh)
+    bpy.utils.unregister_class(ClearBvhCache)
     bpy.utils.unregister_class(GenerateJointAndBone)
-    #bpy.utils.unregister_class(GenerateJointAndBoneConcat)
+    bpy.utils.unregister_class(GenerateJointAndBoneConcat)
+    bpy.utils.unregister_class(ResampleBvh)
     bpy.utils.unregister_class(DrawBvhInitial)
     bpy.utils.unregister_class(CreateSpline)
     bpy.utils.unregister_class(AddPoint)
@@ -6,25 +6,39 @@ from .test_op import *
 #註冊共用變數class
 class MyPreferece(bpy.types.PropertyGroup):
     bvhFilePath = StringProperty(name = 'bvh Path', description = "bvh Path")
+    fullPath = BoolProperty(name = 'Full path', description = "Use every cube of the spline as control points instead of the selected 4 point fragment", default = False)
+    pathControlCount = IntProperty(name = 'Control points', description = "Control points of the fitted root path", default = 4, min = 4)
+    pathTolerance = FloatProperty(name = 'Tolerance', description = "Add control points until the fitted root path is this close to the root, 0 to disable", default = 0.0, min = 0.0)
+    bulkBake = BoolProperty(name = 'Bulk bake', description = "Write keyframes with F-curve batch calls instead of one keyframe_insert per frame", default = True)
+    bakeArmature = BoolProperty(name = 'Armature', description = "Bake onto one armature instead of one empty per joint", default = False)
+    decimate = BoolProperty(name = 'Decimate', description = "Drop constant channels and keys that linear interpolation can rebuild (bulk or armature bake)", default = False)
+    decimateTolerance = FloatProperty(name = 'Tolerance', description = "Largest error of a removed key (units for locations, radians for rotations)", default = 0.001, min = 0.0, precision = 4)
+    useCache = BoolProperty(name = 'Use cache', description = "Reuse parsed bvh files from the disk cache", default = True)
+    loadMode = EnumProperty(name = 'Load', description = "How the motion of imported bvh files is kept", items = [
+        ('FULL', 'Full', "Parse the whole motion on import"),
+        ('LAZY', 'Lazy', "Only read the skeleton on import, the motion is parsed the first time the clip is used (skips the cache)"),
+        ('STREAM', 'Stream', "Never keep the motion, read it from the file in chunks every time it is used, for captures too long for memory (skips the cache)"),
+    ], default = 'FULL')
+    compactStorage = BoolProperty(name = 'Float32', description = "Keep the motion of new bvh files in single precision, half the memory", default = False)
     
     def loadBvh(self, context):
-        item = []
-        bvh_names = DataManager.all_bvh.keys()
-        for bvh_name in bvh_names:
-            item.append((bvh_name, bvh_name, ''))
-        return item
+        return get_bvh_items()
     def updateBvh(self, context):
         DataManager.current_bvh_name = self.bvhRecord
         DataManager.current_bvh_object = DataManager.all_bvh[self.bvhRecord]
+        touch_bvh(self.bvhRecord)
+        enforce_memory_budget()
     def loadBvh2(self, context):
-        item = []
-        bvh_names = DataManager.all_bvh.keys()
-        for bvh_name in bvh_names:
-            item.append((bvh_name, bvh_name, ''))
-        return item
+        return get_bvh_items()
     def updateBvh2(self, context):
         DataManager.current_bvh_name_concat = self.bvhRecordConcat
         DataManager.current_bvh_object_concat = DataManager.all_bvh[self.bvhRecordConcat]
+        touch_bvh(self.bvhRecordConcat)
+        enforce_memory_budget()
+    def updateMemoryBudget(self, context):
+        enforce_memory_budget()
+    def updateLiveEdit(self, context):
+        set_live_edit(self.liveEdit)
     def loadNode(self,context):
         item = []
         spline_list = SplineBvhContainer.spline_list
@@ -36,6 +50,18 @@ class MyPreferece(bpy.types.PropertyGroup):
         return item
     def updateNode(self, context):
         DataManager.nowSelectingFragment = self.node_select
+    concatBlendFrames = IntProperty(name = 'Blend', description = "Frames blended between the two bvh", default = 10, min = 0)
+    concatWindow = IntProperty(name = 'Window', description = "Frames searched for the transition at the end of the first and the start of the second bvh", default = 60, min = 1)
+    resampleMode = EnumProperty(name = 'Resample', description = "Target of the resampling", items = [
+        ('SCENE', 'Scene rate', "Same motion at the frame rate of the scene"),
+        ('FRAMES', 'Frame count', "Same motion stretched to the given number of frames"),
+    ], default = 'SCENE')
+    resampleFrames = IntProperty(name = 'Frames', description = "Frame count of the resampled bvh", default = 100, min = 2)
+    profile = BoolProperty(name = 'Profile', description = "Record the time and memory of every stage of the operators", default = False)
+    profileLog = StringProperty(name = 'Log', description = "Append every profiled run to this file as one JSON line, empty to disable", default = '', subtype = 'FILE_PATH')
+    liveEdit = BoolProperty(name = 'Live edit', description = "Redraw the splines while their cubes are moved", default = False, update = updateLiveEdit)
+    liveEditRate = FloatProperty(name = 'Rate', description = "Maximum live edit updates per second", default = 30.0, min = 1.0, max = 120.0)
+    memoryBudget = FloatProperty(name = 'Budget (MB)', description = "Motion data and pose index kept in memory, clips that are not current are evicted from the least recently used and reload when used, the pose index is dropped last and rebuilt by the next search, 0 for no limit", default = 0.0, min = 0.0, update = updateMemoryBudget)
     bvhRecord = EnumProperty(name='Current Bvh', description = "",items = loadBvh, update = updateBvh)
     bvhRecordConcat = EnumProperty(name='Current Bvh2', description = "",items = loadBvh2, update = updateBvh2)
     node_select = EnumProperty(name='Node Select', description = "",items = loadNode, update = updateNode)
@@ -56,25 +82,90 @@ class Test_Panel(bpy.types.Panel):
         row = layout.row()
         row.prop(pref, 'bvhFilePath')
         row.operator('ldops.import_bvh', text='', icon='FILE_NEW')
+        row.operator('ldops.import_bvh_batch', text='', icon='FILE_FOLDER')
+        row.operator('ldops.export_bvh', text='', icon='EXPORT')
+        row = layout.row()
+        row.prop(pref, 'useCache')
+        row.prop(pref, 'compactStorage')
+        row.prop(pref, 'loadMode')
+        row.operator('ldops.clear_bvh_cache')
+        row = layout.row()
+        row.prop(pref, 'memoryBudget')
+        resident, evicted, count = get_memory_usage()
+        row.label(text='%s resident, %s evicted (%d)' % (format_bytes(resident), format_bytes(evicted), count))
+        if DataManager.current_bvh_object is not None:
+            footprint = DataManager.current_bvh_object.get_memory_footprint()
+            row = layout.row()
+            if DataManager.current_bvh_object.lazy:
+                size = 'not loaded'
+            elif DataManager.current_bvh_object.anim is None:
+                size = 'streamed, %s' % format_bytes(footprint['total'])
+            elif footprint['mapped']:
+                size = '%s, %s mapped' % (format_bytes(footprint['total']), format_bytes(footprint['mapped']))
+            else:
+                size = format_bytes(footprint['total'])
+            row.label(text='%s: %d frames, %s' % (DataManager.current_bvh_name, DataManager.current_bvh_object.frame_count, size))
+            stats = DataManager.current_bvh_object.derived.get_stats()
+            row = layout.row()
+            row.label(text='Derived data: %d hits, %d misses, %s' % (stats['hits'], stats['misses'], format_bytes(stats['bytes'])))
         row = layout.row()
         row.operator('ldops.create_spline')
         row = layout.row()
+        row.prop(pref, 'liveEdit')
+        row.prop(pref, 'liveEditRate')
+        row = layout.row()
         row.prop(pref, 'node_select')
         row.operator('ldops.set_path')
         row = layout.row()
+        row.prop(pref, 'fullPath')
+        row = layout.row()
         row.prop(pref, 'bvhRecord')
+        row.operator('ldops.remove_bvh', text='', icon='X')
         row.operator('ldops.generate_bone', text='Generate Bone')
         row = layout.row()
+        row.operator('ldops.find_similar_pose')
+        row.operator('ldops.assemble_motion')
+        row = layout.row()
+        row.prop(pref, 'resampleMode', text='')
+        if pref.resampleMode == 'FRAMES':
+            row.prop(pref, 'resampleFrames')
+        row.operator('ldops.resample_bvh')
+        row = layout.row()
+        row.prop(pref, 'bulkBake')
+        row.prop(pref, 'bakeArmature')
+        row = layout.row()
+        #Only the bulk and armature bakes decimate
+        row.enabled = pref.bulkBake or pref.bakeArmature
+        row.prop(pref, 'decimate')
+        row.prop(pref, 'decimateTolerance')
+        row = layout.row()
+        row.prop(pref, 'pathControlCount')
+        row.prop(pref, 'pathTolerance')
+        row = layout.row()
         row.operator('ldops.draw_bvh_initial')
         row = layout.row()
         row.prop(pref, 'bvhRecordConcat')
         row = layout.row()
-        row.operator('ldops.generate_concat_bone', text='Generate Concat Bone')
+        row.prop(pref, 'concatBlendFrames')
+        row.prop(pref, 'concatWindow')
+        row = layout.row()
+        row.operator('ldops.generate_concat_bone', text='Concatenate')
 
         row = layout.row()
         row.operator('ldops.add_point')
         row.operator('ldops.del_point')
 
+        row = layout.row()
+        row.prop(pref, 'profile')
+        if pref.profile:
+            row.prop(pref, 'profileLog', text='')
+            run = PROFILER.last_run
+            if run is not None:
+                box = layout.box()
+                box.label(text='%s: %.1f ms, %s peak' % (run['name'], run['wall'] * 1000.0, format_bytes(run['peak'])))
+                for stage in run['stages']:
+                    box.label(text='  %s: %.1f ms, %s' % (stage['name'], stage['wall'] * 1000.0, format_bytes(stage['peak'])))
+
 
 def register():
     bpy.utils.register_class(Test_Panel)
@@ -0,0 +1,53 @@
+"""Shared harness of the tests: the add-on modules are loaded on the bpy/mathutils stand-ins of
+benchmarks/stubs when Blender is not there, and clips come from benchmarks/synthetic.
+
+    python -m pytest -q tests
+"""
+import importlib
+import importlib.util
+import os
+import sys
+
+import numpy as np
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.dirname(HERE)
+PACKAGE = 'motion_capture_blender'
+
+try:
+    import bpy
+except ImportError:
+    sys.path.insert(0, os.path.join(ADDON_DIR, 'benchmarks', 'stubs'))
+sys.path.insert(0, os.path.join(ADDON_DIR, 'benchmarks'))
+from synthetic import write_bvh
+
+FRAMES = 300
+JOINTS = 12
+
+
+def load_module(name):
+    # Register the add-on directory as a package without running its __init__ (no operator registration).
+    if PACKAGE not in sys.modules:
+        spec = importlib.util.spec_from_file_location(PACKAGE, os.path.join(ADDON_DIR, '__init__.py'),
+                                                      submodule_search_locations=[ADDON_DIR])
+        sys.modules[PACKAGE] = importlib.util.module_from_spec(spec)
+    return importlib.import_module(PACKAGE + '.' + name)
+
+
+def read(path, load_motion=True):
+    bvh = load_module('bvhutils').Bvh()
+    bvh.read_bvh(path, load_motion=load_motion)
+    return bvh
+
+
+def keyframes(obj):
+    action = load_module('bvhutils').get_action(obj)
+    return {(fcurve.data_path, fcurve.array_index): np.asarray(fcurve.keyframe_points.co) for fcurve in action.fcurves}
+
+
+@pytest.fixture
+def clip_path(tmp_path):
+    path = str(tmp_path / 'clip.bvh')
+    write_bvh(path, JOINTS, FRAMES)
+    return path
@@ -0,0 +1,64 @@
+"""BvhCache hits, whose anim is memory-mapped from the cache entry."""
+import os
+
+import numpy as np
+
+from conftest import load_module
+
+bvhcache = load_module('bvhcache')
+
+
+def test_hit_maps_the_cached_anim(clip_path, tmp_path):
+    cache = bvhcache.BvhCache(str(tmp_path / 'cache'))
+    parsed = cache.load(clip_path)
+    cached = cache.load(clip_path)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    assert isinstance(cached.anim, np.memmap)
+    assert np.array_equal(cached.get_anim(), parsed.get_anim())
+    footprint = cached.get_memory_footprint()
+    assert footprint['mapped'] == parsed.anim.nbytes
+    assert footprint['anim'] == 0
+
+    #Evicting only unmaps, the next use maps the entry again
+    cached.evict()
+    assert cached.spill_path is None
+    assert np.array_equal(cached.get_anim(), parsed.get_anim())
+    assert isinstance(cached.anim, np.memmap)
+
+    #Without the entry the source file is parsed again
+    cached.evict()
+    cache.clear()
+    assert np.array_equal(cached.get_anim(), parsed.get_anim())
+    assert not isinstance(cached.anim, np.memmap)
+
+
+def test_entry_per_dtype(clip_path, tmp_path):
+    cache = bvhcache.BvhCache(str(tmp_path / 'cache'))
+    compact = cache.load(clip_path, dtype=np.float32)
+    parsed = cache.load(clip_path)
+    assert (cache.hits, cache.misses) == (0, 2)
+
+    #Never the float32 entry widened
+    cached = cache.load(clip_path)
+    assert cached.anim.dtype == np.float64
+    assert np.array_equal(cached.get_anim(), parsed.get_anim())
+    cached = cache.load(clip_path, dtype=np.float32)
+    assert np.array_equal(cached.get_anim(), compact.get_anim())
+    assert (cache.hits, cache.misses) == (2, 2)
+
+    cache.invalidate(clip_path)
+    assert os.listdir(cache.directory) == ['index.json']
+
+
+def test_batch_reports_missing_file(clip_path, tmp_path):
+    bvhbatch = load_module('bvhbatch')
+    cache = bvhcache.BvhCache(str(tmp_path / 'cache'))
+    missing = str(tmp_path / 'missing.bvh')
+    loaded, failed = bvhbatch.import_bvh_files([clip_path, missing], max_workers=1, cache=cache)
+    assert list(loaded) == [clip_path]
+    assert list(failed) == [missing]
+
+    loaded, failed = bvhbatch.import_bvh_files([clip_path, missing], max_workers=1, cache=cache)
+    assert list(loaded) == [clip_path]
+    assert (cache.hits, cache.misses) == (1, 1)
@@ -0,0 +1,87 @@
+"""bvhconcat transitions and joins."""
+import numpy as np
+import pytest
+
+from conftest import JOINTS, load_module, read, write_bvh
+
+bvhconcat = load_module('bvhconcat')
+bvhfk = load_module('bvhfk')
+bvhmath = load_module('bvhmath')
+
+
+def poses(bvh):
+    positions, quats = bvhfk.forward_kinematics(bvh)
+    return positions, bvhmath.quat_to_matrix(quats)
+
+
+def brute_force(a, b, blend_frames, window):
+    names = [joint.name for joint in sorted(a.joints.values(), key=lambda joint: joint.index)]
+    last = max(blend_frames, 1)
+    best = None
+    for i in range(max(0, a.frame_count - last - window + 1), a.frame_count - last + 1):
+        fa = bvhconcat.pose_features(a, i, i + 1, names)[0]
+        for j in range(min(window, b.frame_count - last + 1)):
+            distance = np.linalg.norm(fa - bvhconcat.pose_features(b, j, j + 1, names)[0])
+            if best is None or distance < best[2]:
+                best = (i, j, distance)
+    return best
+
+
+def test_transition_matches_brute_force(clip_path, tmp_path):
+    a = read(clip_path)
+    path = str(tmp_path / 'other.bvh')
+    write_bvh(path, JOINTS, 90, seed=3)
+    b = read(path)
+
+    frame_a, frame_b, distance = bvhconcat.find_transition(a, b, blend_frames=10, window=40)
+    expected = brute_force(a, b, 10, 40)
+    assert (frame_a, frame_b) == expected[:2]
+    assert distance == pytest.approx(expected[2])
+
+
+def test_joining_the_tail_gives_the_clip_back(clip_path):
+    #b is the end of a, the best transition is where they overlap and the blend changes nothing
+    a = read(clip_path)
+    offset = a.frame_count - 60
+    b = a.new_clip(a.get_anim()[offset:])
+
+    joined, info = bvhconcat.concatenate(a, b, blend_frames=10, window=60)
+    assert info['frame_a'] - info['frame_b'] == offset
+    assert info['distance'] == pytest.approx(0.0, abs=1e-5)
+    assert joined.frame_count == a.frame_count
+    for got, expected in zip(poses(joined), poses(a)):
+        assert np.allclose(got, expected, atol=1e-6)
+
+
+def test_join_moves_b_onto_a(clip_path):
+    #Same skeleton, the clip played backwards from elsewhere on its circle
+    a = read(clip_path)
+    b = a.new_clip(a.get_anim()[::-1][:90])
+
+    joined = bvhconcat.join(a, b, 100, 20, blend_frames=10)
+    assert joined.frame_count == 100 + b.frame_count - 20
+    joined_positions, joined_rotations = poses(joined)
+    a_positions, a_rotations = poses(a)
+    b_positions, b_rotations = poses(b)
+    assert np.allclose(joined_positions[:100], a_positions[:100])
+
+    #After the blend b plays turned around the up axis and moved on the ground,
+    #so the offsets between its joints are the same rotated ones
+    root = a.rootJoint.index
+    turn = joined_rotations[110:, root] @ np.swapaxes(b_rotations[30:, root], -1, -2)
+    assert np.allclose(turn, turn[0], atol=1e-6)
+    assert np.allclose(turn[0][1], [0.0, 1.0, 0.0], atol=1e-6)
+    got = joined_positions[110:] - joined_positions[110:, root:root + 1]
+    expected = (b_positions[30:] - b_positions[30:, root:root + 1]) @ turn[0].T
+    assert np.allclose(got, expected, atol=1e-6)
+    #The root continues on the ground from where a was at the transition
+    ground = np.array([1.0, 0.0, 1.0])
+    moved = (b_positions[30:, root] - b_positions[20, root] * ground) @ turn[0].T + a_positions[100, root] * ground
+    assert np.allclose(joined_positions[110:, root], moved, atol=1e-6)
+
+
+def test_missing_joint_raises(clip_path):
+    a = read(clip_path)
+    with pytest.raises(Exception):
+        bvhconcat.match_joints(a, a, {'Joint3': 'Nope'})
+    assert bvhconcat.match_joints(a, a) == list(range(JOINTS))
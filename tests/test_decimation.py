@@ -0,0 +1,57 @@
+"""Bulk and decimated bakes against the per-frame keyframe_insert bake."""
+import sys
+
+import numpy as np
+import pytest
+
+from conftest import keyframes, load_module, read
+
+bvhutils = load_module('bvhutils')
+
+
+def bake(bvh, bulk, tolerance=None):
+    bpy = sys.modules['bpy']
+    bpy.reset()
+    source_points = bvh.getRootJointPath(control_count=6)[1]
+    bvh.destiny_points = [p + bvhutils.Vector((2.0, 0.0, -1.0)) for p in source_points]
+    bvh.add_joint(bpy.context, 1, source_points, bulk=bulk, tolerance=tolerance)
+    #(frame, value) rows of every F-curve of every joint
+    baked = {}
+    for name, joint in bvh.joints.items():
+        baked[name] = {key: co.reshape(-1, 2) for key, co in keyframes(joint.temp).items()}
+    return baked, bvh
+
+
+def test_bulk_bake_matches_legacy_keys(clip_path):
+    legacy = bake(read(clip_path), False)[0]
+    bulk = bake(read(clip_path), True)[0]
+    assert legacy.keys() == bulk.keys()
+    for name, fcurves in legacy.items():
+        assert fcurves.keys() == bulk[name].keys()
+        for key, co in fcurves.items():
+            assert np.allclose(co, bulk[name][key])
+
+
+@pytest.mark.parametrize('tolerance', [1e-4, 1e-2])
+def test_decimated_bake_stays_within_tolerance(clip_path, tolerance):
+    legacy = bake(read(clip_path), False)[0]
+    decimated, bvh = bake(read(clip_path), True, tolerance)
+
+    kept = total = 0
+    for name, fcurves in legacy.items():
+        obj = bvh.joints[name].temp
+        for (data_path, index), co in fcurves.items():
+            total += len(co)
+            keys = decimated[name].get((data_path, index))
+            if keys is None:
+                #Constant curves become the property value
+                assert np.ptp(co[:, 1]) <= tolerance
+                assert abs(obj.path_resolve(data_path)[index] - co[0, 1]) <= tolerance
+                continue
+            kept += len(keys)
+            assert keys[0, 0] == co[0, 0] and keys[-1, 0] == co[-1, 0]
+            assert np.all(np.isin(keys[:, 0], co[:, 0]))
+            #Keys are float32
+            line = np.interp(co[:, 0], keys[:, 0], keys[:, 1])
+            assert np.all(np.abs(line - co[:, 1]) <= tolerance + 1e-6 * np.abs(co[:, 1]).max())
+    assert kept < total
@@ -0,0 +1,74 @@
+"""bvhfk against a naive walk of the joint tree, one frame and one joint at a time."""
+import math
+
+import numpy as np
+
+from conftest import load_module, read
+
+bvhfk = load_module('bvhfk')
+bvhmath = load_module('bvhmath')
+
+
+def axis_matrix(axis, angle):
+    c, s = math.cos(angle), math.sin(angle)
+    i, j = (axis + 1) % 3, (axis + 2) % 3
+    matrix = np.eye(3)
+    matrix[i, i] = matrix[j, j] = c
+    matrix[i, j] = -s
+    matrix[j, i] = s
+    return matrix
+
+
+def naive_walk(bvh, frame):
+    anim = bvh.get_anim()[frame]
+    world = {}
+
+    def visit(joint, parent_position, parent_rotation):
+        values = anim[joint.index]
+        rotation = np.eye(3)
+        for axis in joint.rot_order:
+            if axis is not None:
+                rotation = rotation @ axis_matrix(axis, values[3 + axis])
+        offset = values[0:3] if joint.has_loc else np.asarray(joint.rest_head_local, dtype=np.float64)
+        position = parent_position + parent_rotation @ offset
+        world[joint.name] = (position, parent_rotation @ rotation)
+        for child in joint.children:
+            visit(child, *world[joint.name])
+
+    visit(bvh.rootJoint, np.zeros(3), np.eye(3))
+    return world
+
+
+def test_matches_naive_walk(clip_path):
+    bvh = read(clip_path)
+    positions, quats = bvhfk.forward_kinematics(bvh)
+    joint_list = sorted(bvh.joints.values(), key=lambda joint: joint.index)
+    assert positions.shape == (bvh.frame_count, len(joint_list), 3)
+
+    for frame in (0, 1, bvh.frame_count // 2, bvh.frame_count - 1):
+        world = naive_walk(bvh, frame)
+        for joint in joint_list:
+            position, rotation = world[joint.name]
+            assert np.allclose(positions[frame, joint.index], position)
+            assert np.allclose(bvhmath.quat_to_matrix(quats[frame, joint.index]), rotation)
+
+
+def test_frame_range_and_joint_subset(clip_path):
+    bvh = read(clip_path)
+    positions, quats = bvhfk.forward_kinematics(bvh)
+    names = ['Joint7', 'Joint2']
+    columns = [bvh.joints[name].index for name in names]
+
+    part_positions, part_quats = bvhfk.forward_kinematics(bvh, 10, 40, names)
+    assert part_positions.shape == (30, 2, 3)
+    assert np.allclose(part_positions, positions[10:40, columns])
+    assert np.allclose(part_quats, quats[10:40, columns])
+
+    #Only the joints on the way to the root are evaluated
+    chain = bvhfk.get_chain(bvh, ['Joint7'])
+    walk = []
+    joint = bvh.joints['Joint7']
+    while joint is not None:
+        walk.append(joint)
+        joint = joint.parent
+    assert chain == sorted(walk, key=lambda joint: joint.index)
@@ -0,0 +1,72 @@
+"""PoseIndex queries against a brute force search over every frame."""
+import numpy as np
+import pytest
+
+from conftest import JOINTS, load_module, read, write_bvh
+
+bvhindex = load_module('bvhindex')
+
+
+@pytest.fixture
+def clips(tmp_path):
+    clips = {}
+    for seed, frames in enumerate((200, 350, 120, 260)):
+        path = str(tmp_path / ('clip%d.bvh' % seed))
+        write_bvh(path, JOINTS, frames, seed=seed)
+        clips['clip%d' % seed] = read(path)
+    return clips
+
+
+def brute_force(clips, bvh, frame, exclude=()):
+    feature = bvhindex.pose_features(bvh, frame, frame + 1)[0]
+    best = None
+    for name, clip in clips.items():
+        if name in exclude:
+            continue
+        distance = np.linalg.norm(bvhindex.pose_features(clip) - feature, axis=1)
+        i = int(np.argmin(distance))
+        if best is None or distance[i] < best[2]:
+            best = (name, i, float(distance[i]))
+    return best
+
+
+def assert_same_result(got, expected):
+    assert got[0] == expected[0] and got[1] == expected[1]
+    assert got[2] == pytest.approx(expected[2], abs=1e-9)
+
+
+def test_query_matches_brute_force(clips):
+    index = bvhindex.PoseIndex(leaf_size=8)
+    for name, clip in clips.items():
+        index.add(name, clip)
+    assert len(index) == len(clips)
+
+    probe = clips['clip1']
+    for frame in range(0, probe.frame_count, 37):
+        assert_same_result(index.query(probe, frame), brute_force(clips, probe, frame))
+        #The probe clip itself is the exact match unless it is excluded
+        assert index.query(probe, frame)[:2] == ('clip1', frame)
+        assert_same_result(index.query(probe, frame, exclude={'clip1'}), brute_force(clips, probe, frame, {'clip1'}))
+
+
+def test_query_after_remove_and_release(clips):
+    index = bvhindex.PoseIndex(leaf_size=8)
+    for name, clip in clips.items():
+        index.add(name, clip)
+    probe = clips['clip2']
+    index.query(probe, 0)
+    assert index.get_size() > 0
+
+    #Removed clips are masked, or dropped by a rebuild once enough are gone
+    for removed in ('clip2', 'clip0'):
+        index.remove(removed)
+        del clips[removed]
+        for frame in range(0, probe.frame_count, 29):
+            assert_same_result(index.query(probe, frame), brute_force(clips, probe, frame))
+
+    #Released features are built again by the next query
+    index.release()
+    assert index.get_size() == 0
+    assert len(index) == len(clips)
+    for frame in range(0, probe.frame_count, 29):
+        assert_same_result(index.query(probe, frame), brute_force(clips, probe, frame))
@@ -0,0 +1,126 @@
+"""bvhmath against plain reference implementations."""
+import itertools
+
+import numpy as np
+import pytest
+
+from conftest import load_module
+
+bvhmath = load_module('bvhmath')
+
+ORDERS = list(itertools.permutations(range(3)))
+
+
+def reference_rdp(x, y, tolerance, block):
+    # Recursive Ramer-Douglas-Peucker between the forced keys of every block.
+    keep = np.zeros(len(y), dtype=bool)
+    keep[::block] = True
+    keep[-1] = True
+
+    def split(left, right):
+        if right - left < 2:
+            return
+        line = y[left] + (y[right] - y[left]) * (x[left + 1:right] - x[left]) / (x[right] - x[left])
+        error = np.abs(y[left + 1:right] - line)
+        middle = int(np.argmax(error))
+        if error[middle] > tolerance:
+            keep[left + 1 + middle] = True
+            split(left, left + 1 + middle)
+            split(left + 1 + middle, right)
+
+    keys = np.flatnonzero(keep)
+    for left, right in zip(keys[:-1], keys[1:]):
+        split(left, right)
+    return keep
+
+
+@pytest.mark.parametrize('block', [16, 128, 1000])
+def test_simplify_curve_matches_recursive_rdp(block):
+    rng = np.random.default_rng(0)
+    x = np.arange(600, dtype=np.float64)
+    y = np.column_stack([np.sin(x / 17.0) + 0.05 * rng.standard_normal(len(x)),
+                         np.cumsum(rng.standard_normal(len(x))) * 0.1,
+                         np.where(x < 300, 0.0, 1.0)])
+    tolerance = 0.05
+
+    keep = bvhmath.simplify_curve(x, y, tolerance, block)
+    for column in range(y.shape[1]):
+        expected = reference_rdp(x, y[:, column], tolerance, block)
+        assert np.array_equal(keep[:, column], expected)
+        assert np.array_equal(bvhmath.simplify_curve(x, y[:, column], tolerance, block), expected)
+        #Every dropped sample is within tolerance of the kept keys
+        line = np.interp(x, x[expected], y[expected, column])
+        assert np.all(np.abs(line - y[:, column]) <= tolerance)
+
+
+def test_simplify_curve_of_short_curves():
+    assert bvhmath.simplify_curve(np.zeros(0), np.zeros(0), 0.1).shape == (0,)
+    assert bvhmath.simplify_curve([0.0], [[1.0, 2.0]], 0.1).tolist() == [[True, True]]
+    assert bvhmath.simplify_curve([0.0, 1.0, 2.0], [0.0, 5.0, 0.0], 0.1).tolist() == [True, True, True]
+
+
+@pytest.mark.parametrize('order', ORDERS)
+def test_euler_round_trip(order):
+    rng = np.random.default_rng(1)
+    angles = rng.uniform(-np.pi, np.pi, (200, 3))
+    #Middle angle within (-pi/2, pi/2) so the angles are the unique solution
+    angles[:, order[1]] *= 0.45
+
+    matrix = bvhmath.euler_to_matrix(angles, order)
+    assert np.allclose(matrix @ np.swapaxes(matrix, -1, -2), np.eye(3))
+    assert np.allclose(bvhmath.matrix_to_euler(matrix, order), angles)
+
+    #Same rotations as composing one axis at a time in channel order
+    expected = np.broadcast_to(np.eye(3), matrix.shape).copy()
+    for axis in order:
+        single = np.zeros_like(angles)
+        single[:, axis] = angles[:, axis]
+        expected = expected @ bvhmath.euler_to_matrix(single, (axis, None, None))
+    assert np.allclose(matrix, expected)
+
+
+def test_quaternion_round_trip():
+    rng = np.random.default_rng(2)
+    quat = bvhmath.normalize(rng.standard_normal((500, 4)))
+    quat *= np.sign(quat[:, :1])
+    matrix = bvhmath.quat_to_matrix(quat)
+    assert np.allclose(bvhmath.matrix_to_quat(matrix), quat)
+
+    #Rotating a vector matches q v q*
+    v = rng.standard_normal((500, 3))
+    w, u = quat[:, :1], quat[:, 1:]
+    expected = v + 2.0 * np.cross(u, np.cross(u, v) + w * v)
+    assert np.allclose(np.einsum('fab,fb->fa', matrix, v), expected)
+
+
+def test_slerp_ends_and_middle():
+    a = np.array([[1.0, 0.0, 0.0, 0.0]])
+    b = np.array([[np.cos(0.5), np.sin(0.5), 0.0, 0.0]])
+    assert np.allclose(bvhmath.slerp(a, b, np.array([0.0])), a)
+    assert np.allclose(bvhmath.slerp(a, b, np.array([1.0])), b)
+    assert np.allclose(bvhmath.slerp(a, b, np.array([0.5])), [[np.cos(0.25), np.sin(0.25), 0.0, 0.0]])
+    #The shorter arc, -b is the same rotation
+    assert np.allclose(bvhmath.slerp(a, -b, np.array([0.5])), [[np.cos(0.25), np.sin(0.25), 0.0, 0.0]])
+
+
+def test_solve_banded_spd_matches_dense_solve():
+    rng = np.random.default_rng(3)
+    n, width = 40, 3
+    bands = rng.uniform(-1.0, 1.0, (width + 1, n))
+    bands[0] = 10.0
+    dense = np.zeros((n, n))
+    for d in range(width + 1):
+        for i in range(n - d):
+            dense[i, i + d] = dense[i + d, i] = bands[d, i]
+    rhs = rng.standard_normal((n, 3))
+    assert np.allclose(bvhmath.solve_banded_spd(bands, rhs), np.linalg.solve(dense, rhs))
+
+
+def test_fit_bspline_recovers_the_control_points():
+    rng = np.random.default_rng(4)
+    control = rng.standard_normal((8, 3))
+    t = np.linspace(0.0, 1.0, 400)
+    assert np.allclose(bvhmath.fit_bspline(t, bvhmath.eval_bspline(control, t), len(control)), control)
+
+    table = bvhmath.arc_length_table(control)
+    assert np.allclose(bvhmath.arc_length_to_param(table, table[1]), table[0])
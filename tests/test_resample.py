@@ -0,0 +1,55 @@
+"""bvhresample frame counts and sampled poses."""
+import numpy as np
+
+from conftest import load_module, read, write_bvh
+
+bvhfk = load_module('bvhfk')
+bvhmath = load_module('bvhmath')
+bvhresample = load_module('bvhresample')
+
+
+def poses(bvh):
+    positions, quats = bvhfk.forward_kinematics(bvh)
+    return positions, bvhmath.quat_to_matrix(quats)
+
+
+def assert_same_poses(a, b):
+    for got, expected in zip(poses(a), poses(b)):
+        assert np.allclose(got, expected, atol=1e-6)
+
+
+def test_rounded_frame_time_keeps_the_last_frame(tmp_path):
+    #120 fps, the header says Frame Time: 0.008333
+    path = str(tmp_path / 'clip.bvh')
+    write_bvh(path, 6, 481)
+    bvh = read(path)
+    assert bvh.frame_time == 0.008333
+
+    resampled = bvhresample.resample_rate(bvh, 1.0 / 30.0)
+    assert resampled.frame_count == 121
+    #Every 4th source frame, no drift at the end
+    assert_same_poses(resampled, bvh.new_clip(bvh.get_anim()[::4], 1.0 / 30.0))
+
+
+def test_same_rate_keeps_the_clip(clip_path):
+    bvh = read(clip_path)
+    resampled = bvhresample.resample_rate(bvh, 1.0 / 120.0)
+    assert resampled.frame_count == bvh.frame_count
+    assert np.allclose(resampled.get_anim()[:, :, :3], bvh.get_anim()[:, :, :3])
+    assert_same_poses(resampled, bvh)
+
+
+def test_resample_count_and_time_warp(clip_path):
+    bvh = read(clip_path)
+    anim = bvh.get_anim()
+
+    stretched = bvhresample.resample_count(bvh, 2 * bvh.frame_count - 1)
+    assert stretched.frame_count == 2 * bvh.frame_count - 1
+    assert stretched.frame_time == bvh.frame_time
+    #Even frames are the source frames, odd ones halfway between
+    assert_same_poses(bvh.new_clip(stretched.get_anim()[::2]), bvh)
+    middle = stretched.get_anim()[1::2, :, :3]
+    assert np.allclose(middle, 0.5 * (anim[:-1, :, :3] + anim[1:, :, :3]))
+
+    reversed_clip = bvhresample.time_warp(bvh, lambda t: 1.0 - t)
+    assert_same_poses(reversed_clip, bvh.new_clip(anim[::-1]))
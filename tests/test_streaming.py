@@ -0,0 +1,100 @@
+"""Clips read with load_motion=False, whose motion is streamed from the file on every use."""
+import sys
+
+import numpy as np
+
+from conftest import FRAMES, JOINTS, keyframes, load_module, read
+
+bvhutils = load_module('bvhutils')
+
+
+def test_get_anim_of_streamed_clip(clip_path):
+    loaded = read(clip_path, True)
+    streamed = read(clip_path, False)
+    assert streamed.anim is None
+
+    assert np.array_equal(streamed.get_anim(), loaded.get_anim())
+    assert np.array_equal(streamed.get_anim(10), loaded.get_anim(10))
+    assert np.array_equal(streamed.get_anim(10, 50, chunk_size=16), loaded.get_anim(10, 50))
+    assert np.array_equal(streamed.get_anim(0, FRAMES + 100), loaded.get_anim())
+    assert streamed.get_anim(FRAMES, FRAMES + 10).shape == (0, JOINTS, 6)
+
+
+def test_whole_clip_callers_of_streamed_clip(clip_path):
+    loaded = read(clip_path, True)
+    streamed = read(clip_path, False)
+
+    positions, quats = streamed.get_world_transforms()
+    expected_positions, expected_quats = loaded.get_world_transforms()
+    assert np.allclose(positions, expected_positions)
+    assert np.allclose(quats, expected_quats)
+
+    source_points = loaded.getRootJointPath()[1]
+    loaded.destiny_points = streamed.destiny_points = [p + bvhutils.Vector((1.0, 0.0, 2.0)) for p in source_points]
+    assert np.allclose(streamed.get_retargeted_anim(source_points), loaded.get_retargeted_anim(source_points))
+
+
+def test_pipeline_of_streamed_clip(clip_path):
+    loaded = read(clip_path, True)
+    streamed = read(clip_path, False)
+
+    assert streamed.getTimeStamp() == loaded.getTimeStamp()
+    path, source_points, original_points = streamed.getRootJointPath(control_count=6)
+    expected = loaded.getRootJointPath(control_count=6)
+    assert np.allclose([tuple(p) for p in path], [tuple(p) for p in expected[0]])
+    assert np.allclose([tuple(p) for p in source_points], [tuple(p) for p in expected[1]])
+
+    destiny_points = [p + bvhutils.Vector((0.0, 0.0, 3.0)) for p in source_points]
+    loaded.destiny_points = streamed.destiny_points = destiny_points
+
+    #The bakes read the motion one chunk at a time, never as a whole
+    def whole_motion(*args, **kwargs):
+        raise AssertionError('get_anim of a streamed clip')
+    streamed.get_anim = whole_motion
+    bpy = sys.modules['bpy']
+    for tolerance in (None, 1e-3):
+        baked = {}
+        for name, bvh in (('loaded', loaded), ('streamed', streamed)):
+            bpy.reset()
+            armature = bvh.add_armature(bpy.context, 1, source_points, name=name, tolerance=tolerance, chunk_size=64)
+            baked[name] = keyframes(armature)
+        assert baked['loaded'] and baked['loaded'].keys() == baked['streamed'].keys()
+        for key, co in baked['loaded'].items():
+            assert np.allclose(co, baked['streamed'][key])
+
+        for name, bvh in (('loaded', loaded), ('streamed', streamed)):
+            bpy.reset()
+            bvh.add_joint(bpy.context, 1, source_points, tolerance=tolerance, chunk_size=64)
+            baked[name] = {joint.name: keyframes(joint.temp) for joint in bvh.joints.values()}
+        for name, fcurves in baked['loaded'].items():
+            assert fcurves.keys() == baked['streamed'][name].keys()
+            for key, co in fcurves.items():
+                assert np.allclose(co, baked['streamed'][name][key])
+    assert streamed.anim is None
+
+
+def test_anim_data_of_streamed_clip(clip_path):
+    loaded = read(clip_path, True)
+    streamed = read(clip_path, False)
+    for name, joint in loaded.joints.items():
+        assert streamed.joints[name].anim_data == joint.anim_data
+    assert len(streamed.rootJoint.anim_data) == FRAMES
+    assert streamed.anim is None
+    assert streamed.get_memory_footprint()['anim_data'] == 0
+
+
+def test_retargeted_write_of_streamed_clip(clip_path, tmp_path):
+    loaded = read(clip_path, True)
+    streamed = read(clip_path, False)
+    source_points = loaded.getRootJointPath(control_count=6)[1]
+    #A path that keeps turning, the root rotation has to stay continuous across chunks
+    turns = np.linspace(0.0, 4.0 * np.pi, FRAMES)
+    loaded.destiny_points = streamed.destiny_points = [bvhutils.Vector((50.0 * np.cos(t), 0.0, 50.0 * np.sin(t))) for t in turns]
+
+    expected = str(tmp_path / 'expected.bvh')
+    loaded.write_bvh(expected, source_points)
+    written = str(tmp_path / 'written.bvh')
+    streamed.write_bvh(written, source_points, chunk_size=16)
+    with open(expected) as a, open(written) as b:
+        assert a.read() == b.read()
+    assert streamed.anim is None
@@ -0,0 +1,53 @@
+"""bvhwrite output read back by bvhparse."""
+import numpy as np
+
+from conftest import FRAMES, JOINTS, load_module, read
+
+bvhparse = load_module('bvhparse')
+bvhwrite = load_module('bvhwrite')
+
+
+def test_round_trip(clip_path, tmp_path):
+    bvh = read(clip_path)
+    written = str(tmp_path / 'written.bvh')
+    bvh.write_bvh(written)
+
+    again = read(written)
+    assert again.get_hierarchy() == bvh.get_hierarchy()
+    assert (again.frame_count, again.frame_time) == (FRAMES, bvh.frame_time)
+    #The clip has 4 decimals, 6 are written
+    assert np.allclose(again.get_anim(), bvh.get_anim(), rtol=0.0, atol=1e-9)
+
+    #Writing the read back clip gives the same text
+    rewritten = str(tmp_path / 'rewritten.bvh')
+    again.write_bvh(rewritten)
+    with open(written) as a, open(rewritten) as b:
+        assert a.read() == b.read()
+
+
+def test_chunks_write_the_same_text(clip_path, tmp_path):
+    parsed = bvhparse.parse_bvh(clip_path)
+    motion = parsed['motion']
+    whole = str(tmp_path / 'whole.bvh')
+    bvhwrite.write_bvh(whole, parsed['hierarchy'], motion, parsed['frame_time'], parsed['root'])
+
+    chunks = (motion[start:start + 7] for start in range(0, len(motion), 7))
+    streamed = str(tmp_path / 'streamed.bvh')
+    bvhwrite.write_bvh(streamed, parsed['hierarchy'], chunks, parsed['frame_time'], parsed['root'], frame_count=len(motion))
+    with open(whole) as a, open(streamed) as b:
+        assert a.read() == b.read()
+
+    again = bvhparse.parse_bvh(whole)
+    assert again['hierarchy'] == parsed['hierarchy']
+    assert again['channel_count'] == motion.shape[1] == 6 + 3 * (JOINTS - 1)
+    assert np.array_equal(again['motion'], motion)
+
+
+def test_no_negative_zero(clip_path, tmp_path):
+    hierarchy = bvhparse.parse_bvh(clip_path, load_motion=False)['hierarchy']
+    motion = np.full((2, 6 + 3 * (JOINTS - 1)), -1e-9)
+    written = str(tmp_path / 'zero.bvh')
+    bvhwrite.write_bvh(written, hierarchy, motion, 0.01)
+    with open(written) as file:
+        assert '-0.000000' not in file.read()
+